@@ -0,0 +1,47 @@
+"""Representative wallbox payloads and frames shared by the benchmarks."""
+from evseMQTT.utils import Utils
+
+# Serial bytes whose hex form is all digits, like real wallbox serials
+SERIAL = int.from_bytes(bytes.fromhex("2023040112345678"), "little")
+PASSWORD = "123456"
+
+
+def padded(text, size):
+    return list(text.encode("ascii").ljust(size, b"\x00"))
+
+
+def frame(cmd, data=None):
+    """A complete wallbox frame; the layout is the same in both directions."""
+    return Utils.build_command(SERIAL, PASSWORD, cmd, data)
+
+
+IDENTITY = [10] + padded("BESEN", 16) + padded("BS20", 16) + padded("HW1.0", 16) + [0, 0x1C, 0, 0, 32] + [0] * 15
+VERSION = padded("HW1.0", 16) + padded("SW2.1", 16) + [0, 0, 0, 0]
+OUTPUT_AMPS = [1, 16]
+NAME = [1] + padded("ACP#Garage", 32)
+SYSTEM_TIME = [1, 0x00, 0x5E, 0x2C, 0x66]
+LANGUAGE = [1, 3]
+TEMPERATURE_UNIT = [1, 1]
+CHARGE_START = [1, 0, 1, 0, 16]
+CHARGE_STOP = [1, 1, 0]
+CHARGE_STATUS = [1, 14] + padded("20260101000001", 16) + [1, 0, 0, 0, 0xFF, 0xFF, 0xFF, 0xFF, 0, 0, 0, 0] \
+    + padded("user", 16) + [16] + [0x00, 0x5E, 0x2C, 0x66] + [0x10, 0x0E, 0, 0] + [0] * 20 + [14]
+CHARGE_RECORD = [1] + padded("user", 16) + padded("user", 16) + padded("20260101000001", 16) + [0] * 46 \
+    + [30, 0] + [i for i in range(60)] + [0] * 288
+
+
+def single_ac_status(index=0, phases=1):
+    """A cmd 4/13 status payload; 25 bytes for one phase, 33 for three."""
+    volts = 2300 + index % 20
+    amps = 1600 if index % 100 < 80 else 0
+    data = [1, volts >> 8, volts & 255, amps >> 8, amps & 255]
+    data += list((index * 10).to_bytes(4, "little")) + [0, 0, 0, 0]
+    data += [0x4E, 0x20 + index % 8, 0, 255, 0, 3, 1, 3, 0, 0, 0, 0]
+    if phases == 3:
+        data += [volts >> 8, volts & 255, amps >> 8, amps & 255] * 2
+    return data
+
+
+def login_frames():
+    """Inbound frames of a complete login: beacon, login response, version, config."""
+    return [frame(1, IDENTITY), frame(2, IDENTITY), frame(262, VERSION), frame(263, OUTPUT_AMPS), frame(264, NAME)]
@@ -0,0 +1,84 @@
+"""Offline stand-ins for bleak and paho-mqtt.
+
+The benchmarks only exercise evseMQTT's own code paths, so they must run on a
+machine without a Bluetooth stack or MQTT broker. Importing this module puts the
+src directory on sys.path and registers minimal fake modules for any optional
+dependency that is not installed.
+"""
+import os
+import sys
+import types
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+
+def _install_bleak():
+    try:
+        import bleak  # noqa: F401
+        return
+    except ImportError:
+        pass
+
+    bleak = types.ModuleType("bleak")
+
+    class BleakError(Exception):
+        pass
+
+    class BleakScanner:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        @staticmethod
+        async def discover(*args, **kwargs):
+            return {}
+
+        @staticmethod
+        async def find_device_by_filter(*args, **kwargs):
+            return None
+
+        async def start(self):
+            pass
+
+        async def stop(self):
+            pass
+
+    class BleakClient:
+        def __init__(self, *args, **kwargs):
+            pass
+
+    bleak.BleakError = BleakError
+    bleak.BleakScanner = BleakScanner
+    bleak.BleakClient = BleakClient
+    sys.modules["bleak"] = bleak
+
+
+def _install_paho():
+    try:
+        import paho.mqtt.client  # noqa: F401
+        return
+    except ImportError:
+        pass
+
+    class Client:
+        def __init__(self, *args, **kwargs):
+            self.published = []
+
+        def publish(self, topic, payload=None, qos=0, retain=False):
+            self.published.append((topic, payload, qos, retain))
+
+        def __getattr__(self, name):
+            return lambda *args, **kwargs: None
+
+    paho = types.ModuleType("paho")
+    mqtt = types.ModuleType("paho.mqtt")
+    client = types.ModuleType("paho.mqtt.client")
+    client.Client = Client
+    paho.mqtt = mqtt
+    mqtt.client = client
+    sys.modules.update({"paho": paho, "paho.mqtt": mqtt, "paho.mqtt.client": client})
+
+
+_install_bleak()
+_install_paho()
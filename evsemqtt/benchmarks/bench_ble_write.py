@@ -0,0 +1,101 @@
+"""Time-to-ready of the BLE login burst against a fake client with simulated latency.
+
+Compares the legacy write path (one acknowledged write per frame) with the
+pipelined write-without-response path:
+
+    python bench_ble_write.py --latency 0.03
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+import _stubs  # noqa: F401
+from evseMQTT.ble_manager import BLEManager
+from evseMQTT.utils import Utils
+
+ADDRESS = "AA:BB:CC:DD:EE:FF"
+WRITE_UUID = "0000ffe9-0000-1000-8000-00805f9b34fb"
+
+
+class FakeCharacteristic:
+    def __init__(self, properties, max_write_without_response_size):
+        self.properties = properties
+        self.max_write_without_response_size = max_write_without_response_size
+
+
+class FakeServices:
+    def __init__(self, characteristic):
+        self._characteristic = characteristic
+
+    def get_characteristic(self, uuid):
+        return self._characteristic
+
+
+class FakeClient:
+    """Acknowledged writes cost a full round trip, unacknowledged ones only the link slot."""
+
+    def __init__(self, latency, slot, mtu):
+        self.latency = latency
+        self.slot = slot
+        self.mtu_size = mtu
+        self.services = FakeServices(FakeCharacteristic(["write", "write-without-response"], mtu - 3))
+        self.writes = 0
+        self.bytes = 0
+
+    async def write_gatt_char(self, uuid, data, response=False):
+        self.writes += 1
+        self.bytes += len(data)
+        await asyncio.sleep(self.latency if response else self.slot)
+
+
+def login_burst():
+    serial, password = "1234567890", "123456"
+    frames = [Utils.build_command(serial, password, 32769, [1])]
+    for cmd, data in [(33042, [2, 0]), (33030, None), (33032, [2, 0]), (33031, [2, 0]),
+                      (33039, [2, 0]), (33122, [0, 1, 0, 1, 0, 0, 0, 0]),
+                      (33025, [1] + Utils.timestamp_bytes()), (32781, None)]:
+        frames.append(Utils.build_command(serial, password, cmd, data))
+    return frames
+
+
+async def run(pipelined, latency, slot, mtu):
+    logger = logging.getLogger("bench")
+    manager = BLEManager(event_handler=None, logger=logger)
+    manager.write_uuid = WRITE_UUID
+    client = FakeClient(latency, slot, mtu)
+    manager.connected_devices[ADDRESS] = client
+    if pipelined:
+        await manager._configure_writes(client)
+    else:
+        # Legacy behaviour: one acknowledged write per frame, no batching
+        manager.write_chunk_size = 512
+        manager.write_window = 1
+
+    consumer = asyncio.create_task(manager.message_consumer(ADDRESS, WRITE_UUID))
+    start = time.perf_counter()
+    for frame in login_burst():
+        await manager.message_producer(frame)
+    await manager.queue.join()
+    elapsed = time.perf_counter() - start
+    consumer.cancel()
+    return elapsed, client.writes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.03, help="Round trip of an acknowledged write (s)")
+    parser.add_argument("--slot", type=float, default=0.0075, help="Cost of an unacknowledged write (s)")
+    parser.add_argument("--mtu", type=int, default=23, help="Simulated ATT MTU")
+    args = parser.parse_args()
+
+    legacy, legacy_writes = asyncio.run(run(False, args.latency, args.slot, args.mtu))
+    pipelined, pipelined_writes = asyncio.run(run(True, args.latency, args.slot, args.mtu))
+
+    print(f"legacy:    {legacy * 1000:7.1f} ms ({legacy_writes} writes)")
+    print(f"pipelined: {pipelined * 1000:7.1f} ms ({pipelined_writes} writes)")
+    print(f"speedup:   {legacy / pipelined:7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Count event-loop wakeups of an idle WiFi-mode Manager.
+
+Runs Manager in WiFi mode (no MQTT) on a loop that counts its iterations while
+no wallbox is talking, and extrapolates to wakeups per minute:
+
+    python bench_idle_wakeups.py --seconds 10
+"""
+import argparse
+import asyncio
+import logging
+import socket
+
+import _stubs  # noqa: F401
+from main import Manager
+
+
+class CountingEventLoop(asyncio.SelectorEventLoop):
+    """Selector loop that counts how often it wakes up to run callbacks."""
+
+    wakeups = 0
+
+    def _run_once(self):
+        self.wakeups += 1
+        super()._run_once()
+
+
+def free_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def idle(seconds, loop):
+    manager = Manager(address="", ble_password="123456", unit="W", logging_level=logging.WARNING,
+                      wifi_enabled=True, wifi_port=free_udp_port())
+    runner = asyncio.create_task(manager.run(""))
+    await asyncio.sleep(0.5)  # let the socket bind before counting
+    start = loop.wakeups
+    await asyncio.sleep(seconds)
+    wakeups = loop.wakeups - start
+    await manager.wifi_manager.disconnect()
+    runner.cancel()
+    await asyncio.gather(runner, return_exceptions=True)
+    return wakeups
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=10.0, help="Idle period to measure")
+    args = parser.parse_args()
+
+    loop = CountingEventLoop()
+    asyncio.set_event_loop(loop)
+    try:
+        wakeups = loop.run_until_complete(idle(args.seconds, loop))
+    finally:
+        loop.close()
+
+    print(f"wakeups in {args.seconds:.0f} s: {wakeups}")
+    print(f"wakeups per minute: {wakeups * 60 / args.seconds:.0f}")
+
+
+if __name__ == "__main__":
+    main()
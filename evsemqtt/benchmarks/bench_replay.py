@@ -0,0 +1,80 @@
+"""Replay throughput on a synthetic capture.
+
+Writes a capture in the --capture format with a login sequence followed by a
+stream of status frames, replays it through EventHandlers as fast as possible
+and reports frames/sec. Pass --capture to replay a real capture instead, and
+--golden/--write_golden to check the decoded output against a golden file:
+
+    python bench_replay.py --frames 20000
+    python bench_replay.py --capture /data/frames.cap --golden frames.golden
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+
+import _stubs  # noqa: F401
+from evseMQTT.capture import FrameCapture, read_capture
+from evseMQTT.replay import Replayer, compare_golden
+from _frames import frame, login_frames, single_ac_status
+
+
+def wallbox_frames(status_frames):
+    """Inbound frames of a login followed by status_frames charge status updates."""
+    yield from login_frames()
+    for i in range(status_frames):
+        yield frame(13, single_ac_status(i))
+
+
+def write_synthetic_capture(path, status_frames, interval=1.0):
+    with open(path, "wb") as f:
+        f.write(FrameCapture.MAGIC)
+        for index, frame in enumerate(wallbox_frames(status_frames)):
+            f.write(FrameCapture.RECORD.pack(index * interval, FrameCapture.INBOUND,
+                                             FrameCapture.TRANSPORTS["wifi"], len(frame)))
+            f.write(bytes(frame))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=10000, help="Status frames in the synthetic capture")
+    parser.add_argument("--capture", type=str, help="Replay this capture instead of a synthetic one")
+    parser.add_argument("--speed", type=float, default=0.0, help="Replay speed, 0 = as fast as possible")
+    parser.add_argument("--golden", type=str, help="Compare decoded output against this golden file")
+    parser.add_argument("--write_golden", type=str, help="Write decoded output to this golden file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    path = args.capture
+    if not path:
+        fd, path = tempfile.mkstemp(suffix=".cap")
+        os.close(fd)
+        write_synthetic_capture(path, args.frames)
+
+    try:
+        replayer = Replayer(logging.getLogger("evseMQTT"), speed=args.speed)
+        stats = asyncio.run(replayer.run(read_capture(path)))
+    finally:
+        if not args.capture:
+            os.unlink(path)
+
+    print(json.dumps(stats, indent=2))
+
+    if args.write_golden:
+        with open(args.write_golden, "w") as f:
+            for entry in replayer.published:
+                f.write(json.dumps(entry, sort_keys=True) + "\n")
+    if args.golden:
+        differences = compare_golden(replayer.published, args.golden)
+        for difference in differences[:20]:
+            print(difference)
+        if differences:
+            sys.exit(1)
+        print(f"Output matches {args.golden}")
+
+
+if __name__ == "__main__":
+    main()
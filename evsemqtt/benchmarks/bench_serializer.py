@@ -0,0 +1,122 @@
+"""Cost of encoding the charge and config state publishes.
+
+Feeds status frames through the parser into a Device, the way EventHandlers
+does, and times a publish (setter, snapshot and encoding; no_encoding is the
+first two alone) with json.dumps, with a StateSerializer that reuses the
+payload while the snapshot version is unchanged, and with orjson when it is
+installed:
+
+  * charging: every status frame carries new measurements
+  * idle: the wallbox repeats the same status frame
+  * config: the config snapshot is published again (command responses, RSSI)
+
+Before timing, random updates (including 1 -> True, NaN and non-ASCII names)
+check that every payload the serializer publishes is the bytes json.dumps
+gives for the current snapshot:
+
+    python bench_serializer.py --frames 20000 --checks 20000
+"""
+import argparse
+import json
+import random
+import time
+
+import _stubs  # noqa: F401
+import _frames
+from evseMQTT import Device, Parsers
+from evseMQTT.serializer import StateSerializer, orjson
+
+SERIAL = "2023040112345678"
+
+
+def _device():
+    device = Device("AA:BB:CC:DD:EE:FF")
+    device.info = Parsers.login_beacon(bytearray(_frames.IDENTITY), SERIAL)
+    device.config = Parsers.output_amps(bytearray(_frames.OUTPUT_AMPS), None)
+    device.config = Parsers.name(bytearray(_frames.NAME), None)
+    return device
+
+
+def _status(index, phases):
+    return Parsers.single_ac_status(bytearray(_frames.single_ac_status(index, phases=phases)), None)
+
+
+def scenarios(frames, phases):
+    """name -> (topic, list of snapshots the setter receives before each publish)."""
+    return {
+        "charging": ("charge", [_status(index, phases) for index in range(frames)]),
+        "idle": ("charge", [_status(0, phases)] * frames),
+        "config": ("config", [{"rssi": -67}] * frames),
+    }
+
+
+def check(checks, seed):
+    """Compare every published payload with json.dumps of the snapshot; returns mismatches."""
+    rng = random.Random(seed)
+    device = _device()
+    serializer = StateSerializer(version=device.version)
+    values = [0, 1, True, False, 1.0, -0.0, float("nan"), float("inf"), 2 ** 70, None, "ACP#Garage", "Büro \"2\"\n"]
+    mismatches = 0
+    for index in range(checks):
+        if rng.random() < 0.5:
+            device.charge = _status(rng.randrange(200), rng.choice((1, 3)))
+        if rng.random() < 0.3:
+            device.charge = {rng.choice(list(device.charge)): rng.choice(values)}
+        if rng.random() < 0.3:
+            device.config = {rng.choice(("charge_amps", "rssi", "device_name", "time_to_ready")): rng.choice(values)}
+        for topic in ("charge", "config"):
+            state = getattr(device, topic)
+            if serializer.encode(topic, state) != json.dumps(state):
+                mismatches += 1
+    return mismatches, serializer.reused
+
+
+def measure(topic, snapshots, make):
+    device = _device()
+    encode = make(device)
+    started = time.perf_counter()
+    for snapshot in snapshots:
+        setattr(device, topic, snapshot)
+        encode(topic, getattr(device, topic))
+    return (time.perf_counter() - started) / len(snapshots) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=20000, help="Publishes per scenario (default 20000)")
+    parser.add_argument("--phases", type=int, default=3, choices=(1, 3), help="Phases of the status frames (default 3)")
+    parser.add_argument("--checks", type=int, default=20000, help="Random updates for the byte comparison (default 20000)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default 1)")
+    args = parser.parse_args()
+
+    mismatches, reused = check(args.checks, args.seed)
+
+    # Each builds the encode(topic, state) of one device
+    encoders = {
+        # Setter and snapshot alone, what every publish costs before encoding
+        "no_encoding": lambda device: (lambda topic, state: None),
+        "json.dumps": lambda device: (lambda topic, state: json.dumps(state)),
+        "serializer": lambda device: StateSerializer(version=device.version).encode,
+    }
+    if orjson is not None:
+        encoders["orjson"] = lambda device: (lambda topic, state: orjson.dumps(state))
+
+    result = {}
+    for name, (topic, snapshots) in scenarios(args.frames, args.phases).items():
+        result[name] = {encoder: round(min(measure(topic, snapshots, make) for _ in range(5)), 2)
+                        for encoder, make in encoders.items()}
+        result[name]["speedup"] = round(result[name]["json.dumps"] / result[name]["serializer"], 2)
+
+    print(json.dumps({
+        "us_per_publish": result,
+        "byte_mismatches": mismatches,
+        "checked_payloads": 2 * args.checks,
+        "reused_payloads": reused,
+        "orjson": orjson is not None,
+    }, indent=2))
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
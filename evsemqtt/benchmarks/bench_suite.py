@@ -0,0 +1,269 @@
+"""Microbenchmarks for the protocol and publish hot paths.
+
+Covers frame building, every parser, EventHandlers.receive_notification (whole,
+fragmented and concatenated input), Device setters and snapshots, discovery
+payload generation and JSON state encoding. Runs offline; bleak and paho are
+stubbed when missing.
+
+    python bench_suite.py                          # compare against baseline.json
+    python bench_suite.py --save_baseline          # record a new baseline
+    python bench_suite.py --filter parsers --threshold 0.1 --json results.json
+
+The whole suite runs --rounds times, interleaved, so a burst of load on the
+host lands in one round instead of one benchmark; each benchmark is compared
+by the median over all rounds of its median timing. Timings are compared as
+measured: a baseline belongs to the machine it was recorded on. --calibrate
+scales them by a fixed pure-Python workload instead, for a rough comparison
+across machines.
+
+Exits with status 1 when a benchmark is slower than the baseline by more than
+the threshold (a fraction, default 0.4).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import timeit
+
+import _stubs  # noqa: F401
+import _frames
+from _frames import frame
+from evseMQTT import Commands, Device, EventHandlers, MQTTPayloads, Parsers, StateSerializer, Utils
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def _bytes(payload):
+    return bytearray(payload)
+
+
+def _initialized_device():
+    device = Device("AA:BB:CC:DD:EE:FF")
+    device.unit = "W"
+    device.ble_password = _frames.PASSWORD
+    device.info = Parsers.login_beacon(_bytes(_frames.IDENTITY), "2023040112345678")
+    device.info = Parsers.version(_bytes(_frames.VERSION), "2023040112345678")
+    device.config = Parsers.output_amps(_bytes(_frames.OUTPUT_AMPS), None)
+    device.config = Parsers.name(_bytes(_frames.NAME), None)
+    device.charge = Parsers.single_ac_status(_bytes(_frames.single_ac_status(1)), None)
+    return device
+
+
+class _NullTransport:
+    async def message_producer(self, message, priority=None):
+        pass
+
+
+def _event_handlers():
+    logger = logging.getLogger("bench")
+    device = _initialized_device()
+    device.logged_in = True
+    commands = Commands(ble_manager=_NullTransport(), device=device, logger=logger)
+    return EventHandlers(device=device, commands=commands, logger=logger, callback=lambda *args: None)
+
+
+def _notification_benchmark(chunks):
+    """Run receive_notification over chunks inside one event loop, per call."""
+    handlers = _event_handlers()
+    loop = asyncio.new_event_loop()
+    receive = handlers.receive_notification
+
+    async def feed():
+        for chunk in chunks:
+            await receive("bench", chunk)
+
+    def run():
+        loop.run_until_complete(feed())
+
+    return run, loop
+
+
+def benchmarks():
+    """name -> (callable, event loop to close afterwards or None)."""
+    suite = {}
+
+    # Frame building
+    suite["utils.build_command"] = (lambda: Utils.build_command(_frames.SERIAL, _frames.PASSWORD, 32770), None)
+    suite["utils.build_command_data"] = (
+        lambda: Utils.build_command(_frames.SERIAL, _frames.PASSWORD, 33025, _frames.SYSTEM_TIME), None)
+
+    # Parsers on representative payloads
+    payloads = {
+        "login_beacon": _frames.IDENTITY,
+        "login_response": _frames.IDENTITY,
+        "version": _frames.VERSION,
+        "charge_record": _frames.CHARGE_RECORD,
+        "charge_status": _frames.CHARGE_STATUS,
+        "single_ac_status": _frames.single_ac_status(1),
+        "single_ac_status_3p": _frames.single_ac_status(1, phases=3),
+        "output_amps": _frames.OUTPUT_AMPS,
+        "name": _frames.NAME,
+        "system_time": _frames.SYSTEM_TIME,
+        "system_language": _frames.LANGUAGE,
+        "system_temperature_unit": _frames.TEMPERATURE_UNIT,
+        "charge_start": _frames.CHARGE_START,
+        "charge_stop": _frames.CHARGE_STOP,
+    }
+    for name, payload in payloads.items():
+        parser = getattr(Parsers, name.replace("_3p", ""))
+        data = _bytes(payload)
+        suite[f"parsers.{name}"] = ((lambda parser=parser, data=data: parser(data, "2023040112345678")), None)
+
+    # Notification pipeline
+    status = frame(13, _frames.single_ac_status(1))
+    config = frame(264, _frames.NAME)
+    suite["event_handlers.receive_whole"] = _notification_benchmark([status])
+    suite["event_handlers.receive_fragmented"] = _notification_benchmark(
+        [status[i:i + 20] for i in range(0, len(status), 20)])
+    suite["event_handlers.receive_concatenated"] = _notification_benchmark([status + config])
+
+    # Device state
+    device = _initialized_device()
+    charge = Parsers.single_ac_status(_bytes(_frames.single_ac_status(2)), None)
+    suite["device.set_charge"] = (lambda: setattr(device, "charge", charge), None)
+    suite["device.set_config"] = (lambda: setattr(device, "config", {"charge_amps": 12}), None)
+    suite["device.charge_snapshot"] = (lambda: device.charge, None)
+    suite["device.info_snapshot"] = (lambda: device.info, None)
+
+    # Publishing
+    # The entity table is expanded in the constructor, so time both
+    suite["mqttpayloads.discovery"] = (lambda: MQTTPayloads(device=device).discovery(), None)
+    suite["json.charge_state"] = (lambda: json.dumps(device.charge), None)
+    suite["json.config_state"] = (lambda: json.dumps(device.config), None)
+    serializer = StateSerializer(version=device.version)
+    suite["serializer.charge_state_unchanged"] = (lambda: serializer.encode("charge", device.charge), None)
+
+    return suite
+
+
+def measure(func, repeat, min_time):
+    """Best and median nanoseconds per call over repeat timing runs."""
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(number, int(number * min_time / elapsed))
+    runs = sorted(timer.repeat(repeat=repeat, number=number))
+    per_call = [run / number * 1e9 for run in runs]
+    return {"best_ns": round(per_call[0], 1), "median_ns": round(per_call[len(per_call) // 2], 1), "number": number}
+
+
+def _calibration():
+    # Fixed pure-Python workload; timings are compared relative to it so that a
+    # slower or busier machine does not show up as a regression everywhere.
+    total = 0
+    for i in range(1000):
+        total += i * i
+    return total
+
+
+def measure_rounds(suite, rounds, repeat, min_time):
+    """Run every benchmark once per round; best of the bests and median of the medians."""
+    runs = {name: [] for name in suite}
+    for _ in range(rounds):
+        for name, func in suite.items():
+            runs[name].append(measure(func, repeat, min_time))
+    return {
+        name: {
+            "best_ns": min(run["best_ns"] for run in measured),
+            "median_ns": statistics.median(run["median_ns"] for run in measured),
+            "number": measured[-1]["number"],
+        }
+        for name, measured in runs.items()
+    }
+
+
+def compare(results, baseline, threshold, scale=1.0):
+    """Rows of (name, baseline_ns, current_ns, ratio, regressed) on median timings; ratio is corrected by scale."""
+    rows = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            rows.append((name, None, result["median_ns"], None, False))
+            continue
+        ratio = result["median_ns"] / reference["median_ns"] / scale
+        rows.append((name, reference["median_ns"], result["median_ns"], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filter", type=str, default="", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--rounds", type=int, default=3, help="Times the whole suite is run (default 3)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing runs per benchmark and round (default 3)")
+    parser.add_argument("--min_time", type=float, default=0.2, help="Minimum seconds per timing run (default 0.2)")
+    parser.add_argument("--baseline", type=str, default=BASELINE_FILE, help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.4, help="Allowed slowdown as a fraction (default 0.4)")
+    parser.add_argument("--calibrate", action="store_true", help="Scale timings by the machine speed relative to the baseline")
+    parser.add_argument("--save_baseline", action="store_true", help="Write the results to --baseline")
+    parser.add_argument("--json", type=str, help="Write the results as JSON to this file ('-' for stdout)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    suite, loops = {}, []
+    for name, (func, loop) in benchmarks().items():
+        if loop:
+            loops.append(loop)
+        if args.filter in name:
+            suite[name] = func
+    try:
+        results = measure_rounds(suite, args.rounds, args.repeat, args.min_time)
+        calibration = measure_rounds({"calibration": _calibration}, args.rounds, args.repeat, args.min_time)
+    finally:
+        for loop in loops:
+            loop.close()
+    calibration = calibration["calibration"]["median_ns"]
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "calibration_ns": calibration,
+        "results": results,
+    }
+
+    if args.json:
+        text = json.dumps(report, indent=2, sort_keys=True)
+        if args.json == "-":
+            print(text)
+        else:
+            with open(args.json, "w") as f:
+                f.write(text + "\n")
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f).get("results", {})
+        baseline.update(results)
+        report["results"] = dict(sorted(baseline.items()))
+        with open(args.baseline, "w") as f:
+            f.write(json.dumps(report, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline with {len(results)} benchmark(s) written to {args.baseline}")
+
+    baseline, scale = {}, 1.0
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            stored = json.load(f)
+        baseline = stored.get("results", {})
+        if stored.get("calibration_ns") and args.calibrate:
+            scale = calibration / stored["calibration_ns"]
+            print(f"Machine speed relative to baseline: {1 / scale:.2f}x")
+
+    regressions = 0
+    print(f"{'benchmark':<40} {'baseline':>12} {'current':>12} {'ratio':>7}")
+    for name, reference, current, ratio, regressed in compare(results, baseline, args.threshold, scale):
+        regressions += regressed
+        reference = f"{reference / 1000:.2f} us" if reference else "-"
+        ratio = f"{ratio:.2f}" if ratio else "-"
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<40} {reference:>12} {current / 1000:>9.2f} us {ratio:>7}{flag}")
+
+    if regressions:
+        print(f"{regressions} benchmark(s) slower than baseline by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
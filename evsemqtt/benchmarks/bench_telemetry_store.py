@@ -0,0 +1,82 @@
+"""Size and query speed of the on-disk telemetry store.
+
+Writes a synthetic month of three-phase status frames (one every --interval
+seconds, charging a few hours a day) to a temporary TelemetryStore, then times
+a month-long range read and the hourly and daily rollups:
+
+    python bench_telemetry_store.py --days 30 --interval 2
+"""
+import argparse
+import json
+import random
+import shutil
+import tempfile
+import time
+
+import _stubs  # noqa: F401
+from evseMQTT import telemetry_store
+from evseMQTT.telemetry_store import TelemetryStore, rollup
+
+SERIAL = "2023040112345678"
+START = 1788220800  # 2026-09-01 00:00 UTC
+
+
+def charge(index, interval):
+    charging = (index * interval // 3600) % 24 in (1, 2, 3, 13)
+    amps = 16.0 if charging else 0.0
+    return {
+        "current_energy": round(3 * 230 * amps),
+        "l1_voltage": round(229 + random.random() * 3, 1),
+        "l2_voltage": round(229 + random.random() * 3, 1),
+        "l3_voltage": round(229 + random.random() * 3, 1),
+        "l1_amperage": amps,
+        "l2_amperage": round(amps * 0.97, 1),
+        "l3_amperage": amps,
+        "inner_temp_c": 31.5 + (index // 600) % 5,
+        "outer_temp": -1.0,
+        "total_energy": round(index * interval * 0.0001, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=30, help="Days of telemetry to write (default 30)")
+    parser.add_argument("--interval", type=float, default=2.0, help="Seconds between status frames (default 2)")
+    args = parser.parse_args()
+
+    random.seed(1)
+    root = tempfile.mkdtemp(prefix="evse-telemetry-")
+    try:
+        store = TelemetryStore(root)
+        samples = int(args.days * 86400 / args.interval)
+        started = time.perf_counter()
+        for index in range(samples):
+            store.record(SERIAL, charge(index, args.interval), START + index * args.interval + random.random() * 0.05)
+        store.flush()
+        write = time.perf_counter() - started
+        size, stored = store.disk_usage(SERIAL)
+
+        until = START + args.days * 86400
+        started = time.perf_counter()
+        data = store.read(SERIAL, START, until, fields=("current_energy", "l1_amperage", "l2_amperage", "l3_amperage"))
+        read = time.perf_counter() - started
+        started = time.perf_counter()
+        hourly = rollup(data, 3600) if telemetry_store.np is not None else []
+        daily = rollup(data, 86400) if telemetry_store.np is not None else []
+        rollups = time.perf_counter() - started
+
+        print(json.dumps({
+            "samples": stored,
+            "bytes_per_sample": round(size / stored, 2),
+            "write_us_per_sample": round(write / samples * 1e6, 1),
+            "read_s": round(read, 3),
+            "rollup_s": round(rollups, 3) if hourly else None,
+            "hours": len(hourly),
+            "first_day": daily[0] if daily else None,
+        }, indent=2))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Run evseMQTT end to end against the wallbox emulator.
+
+Starts a Manager in WiFi mode on a localhost UDP port (or in BLE mode with the
+fake BleakClient) next to a WallboxEmulator playing --scenario, and reports
+what evseMQTT made of it: time to ready, status updates that reached the
+publish callback, checksum failures, reconnects and restarts, and the charge
+state at the end.
+
+    python e2e_emulator.py --seconds 60
+    python e2e_emulator.py --ble --scenario "5 fragment 7; 15 corrupt 0.3; 25 corrupt 0; 30 reboot"
+    python e2e_emulator.py --scenario "10 silent 45; 70 change_ip 127.0.0.3" --seconds 100
+"""
+import argparse
+import asyncio
+import json
+import logging
+
+import _stubs  # noqa: F401
+from evseMQTT import metrics
+from evseMQTT.emulator import UDPWallbox, WallboxEmulator, attach_ble, parse_scenario
+from main import Manager
+
+ADDRESS = "AA:BB:CC:DD:EE:FF"
+
+
+async def run(args):
+    emulator = WallboxEmulator(phases=args.phases, status_interval=args.status_interval, seed=args.seed)
+    emulator.scenario = parse_scenario(args.scenario)
+    emulator.plug_in(32)
+    manager = Manager(address=ADDRESS, ble_password="123456", unit="W", wifi_enabled=not args.ble,
+                      wifi_port=args.port, logging_level=getattr(logging, args.logging_level.upper()))
+    (manager.ble_manager or manager.wifi_manager).message_timeout = args.message_timeout
+    if args.ble:
+        attach_ble(manager.ble_manager, {ADDRESS: emulator})
+
+    published = []
+    manager.event_handlers.callback = lambda serial, topic, state: published.append((topic, dict(state)))
+
+    tasks = [asyncio.ensure_future(manager.run(ADDRESS))]
+    await asyncio.sleep(0.2)
+    tasks.append(asyncio.ensure_future(emulator.run() if args.ble else
+                                       UDPWallbox(emulator, target=("127.0.0.1", args.port)).run()))
+
+    # Start charging once the session is ready, like a user pressing start
+    await asyncio.wait_for(manager.event_handlers.session.ready.wait(), timeout=30)
+    ready = manager.event_handlers.session.time_to_ready
+    await manager.commands.set_config_output_amps(16)
+    await manager.commands.set_charge_start(16)
+    await asyncio.sleep(args.seconds)
+    failed = [task.exception() for task in tasks if task.done() and not task.cancelled() and task.exception()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    charge = [state for topic, state in published if topic == "charge"]
+    return {
+        "transport": "ble" if args.ble else "wifi",
+        "time_to_ready_s": ready,
+        "charge_updates": len(charge),
+        "status_frames_sent": emulator.stats["status_frames"],
+        "checksum_failures": metrics.CHECKSUM_FAILURES.value(),
+        "reconnects": metrics.RECONNECTS.value("ble" if args.ble else "wifi"),
+        "restarts": manager.supervisor.stats().get("restarts"),
+        "session_state": manager.event_handlers.session.state,
+        "last_charge": {key: charge[-1].get(key) for key in ("output_state", "current_state", "l1_amperage",
+                                                              "total_energy")} if charge else None,
+        "emulator": emulator.stats,
+        "errors": [repr(error) for error in failed],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ble", action="store_true", help="Use BLEManager with the fake BleakClient instead of UDP")
+    parser.add_argument("--port", type=int, default=38376, help="UDP port for evseMQTT (default 38376)")
+    parser.add_argument("--phases", type=int, default=3, choices=(1, 3), help="Phases of the emulated wallbox (default 3)")
+    parser.add_argument("--status_interval", type=float, default=1.0, help="Seconds between status frames (default 1)")
+    parser.add_argument("--message_timeout", type=float, default=35, help="evseMQTT's silence timeout in seconds (default 35)")
+    parser.add_argument("--scenario", type=str, default="", help="Emulator scenario, see evseMQTT.emulator.parse_scenario")
+    parser.add_argument("--seconds", type=float, default=20, help="How long to run after the session is ready (default 20)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the emulator (default 1)")
+    parser.add_argument("--logging_level", type=str, default="WARNING", help="Logging level (default WARNING)")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
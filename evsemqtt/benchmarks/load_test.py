@@ -0,0 +1,255 @@
+"""Find how many wallboxes one evseMQTT process can serve over WiFi.
+
+Runs N Managers in WiFi mode in this process, one UDP port each (a WiFiManager
+serves a single wallbox), publishing to an in-process MQTT broker stand-in.
+N emulated wallboxes (evseMQTT.emulator) run in --generators separate
+processes, so they do not take CPU from the process under test, and send a
+status frame every 1/--rate seconds. After all sessions are logged in, each
+step measures for --seconds:
+
+  * loss: status frames sent by the wallboxes that evseMQTT never decoded,
+    counted over the whole step after the wallboxes stopped sending
+  * latency: per-stage p95 from receive to MQTT handoff (evseMQTT.tracing)
+    and how late a timer fires on the event loop (time a datagram waits)
+  * cpu: CPU time of this process over wall time (one core = 1.0)
+
+N grows by --step until loss, p95 latency or CPU cross their threshold, or a
+step does not get all sessions up. The last passing step is the capacity:
+
+    python load_test.py --rate 1 --start 25 --step 25
+    python load_test.py --rate 0.5 --start 100 --step 100 --max_cpu 0.5 --json capacity.json
+
+The generators report their own CPU too; if one is saturated, or the host has
+no core to spare for them, the result is a lower bound.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+import _stubs  # noqa: F401
+from evseMQTT import MQTTClient, StateSerializer, TRACER
+from evseMQTT.emulator import UDPWallbox, WallboxEmulator
+from evseMQTT.histogram import LatencyHistogram
+from main import Manager
+
+PASSWORD = "123456"
+
+
+class BrokerStandIn:
+    """Takes the place of the paho client: counts publishes instead of sending them."""
+
+    def __init__(self):
+        self.publishes = 0
+        self.bytes = 0
+        self.charge = 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.publishes += 1
+        self.bytes += len(payload) if payload is not None else 0
+        if topic.endswith("/state/charge"):
+            self.charge += 1
+
+    def __getattr__(self, name):
+        # connect, subscribe, loop_start, message_callback_add, ...
+        return lambda *args, **kwargs: None
+
+
+def _serial(index):
+    return f"2023{index:012d}"
+
+
+def _generate(ports, first, rate, seed, conn):
+    """Generator process: one emulated wallbox per port, answering snapshot/stop requests on conn."""
+    logging.basicConfig(level=logging.WARNING)
+
+    async def run():
+        wallboxes = []
+        for offset, port in enumerate(ports):
+            emulator = WallboxEmulator(serial=_serial(first + offset), password=PASSWORD, status_interval=1 / rate,
+                                       seed=seed + first + offset)
+            emulator.plug_in(32)
+            wallboxes.append(UDPWallbox(emulator, target=("127.0.0.1", port)))
+        tasks = [asyncio.ensure_future(wallbox.run()) for wallbox in wallboxes]
+        loop = asyncio.get_running_loop()
+        while True:
+            request = await loop.run_in_executor(None, conn.recv)
+            if request == "stop":
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+            conn.send({
+                "status_frames": sum(wallbox.emulator.stats["status_frames"] for wallbox in wallboxes),
+                "cpu_s": time.process_time(),
+            })
+            if request == "stop":
+                break
+
+    asyncio.run(run())
+
+
+class Generators:
+    """The wallbox processes of one step."""
+
+    def __init__(self, ports, rate, count, seed):
+        context = multiprocessing.get_context("spawn")
+        self.processes = []
+        self.conns = []
+        share = -(-len(ports) // count)
+        for first in range(0, len(ports), share):
+            parent, child = context.Pipe()
+            process = context.Process(target=_generate, args=(ports[first:first + share], first, rate, seed, child),
+                                      daemon=True)
+            process.start()
+            self.processes.append(process)
+            self.conns.append(parent)
+
+    async def request(self, request):
+        loop = asyncio.get_running_loop()
+        for conn in self.conns:
+            conn.send(request)
+        return [await loop.run_in_executor(None, conn.recv) for conn in self.conns]
+
+    def join(self):
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+
+async def _loop_lag(histogram, interval=0.01):
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        histogram.observe(max(time.perf_counter() - started - interval, 0))
+
+
+async def step(args, wallboxes):
+    ports = [args.port + index for index in range(wallboxes)]
+    broker = BrokerStandIn()
+    decoded = [0]
+    managers = []
+    for port in ports:
+        manager = Manager(address="", ble_password=PASSWORD, unit="W", wifi_enabled=True, wifi_port=port,
+                          logging_level=getattr(logging, args.logging_level.upper()))
+        # Same wiring as Manager does for --mqtt, with the broker stand-in behind MQTTClient
+        manager.mqtt_client = MQTTClient(logger=manager.logger, client_id=f"load-{port}", broker="localhost", port=1883)
+        manager.mqtt_client.client = broker
+        manager.mqtt_client.serializer = StateSerializer(version=manager.device.version)
+        manager.event_handlers.callback = manager.mqtt_client.publish_state
+        manager.event_handlers.charge_listeners.append(lambda charge: decoded.__setitem__(0, decoded[0] + 1))
+        managers.append(manager)
+    tasks = [asyncio.ensure_future(manager.run(manager.address)) for manager in managers]
+    await asyncio.sleep(0.5)
+
+    generators = Generators(ports, args.rate, min(args.generators, wallboxes), args.seed)
+    result = {"wallboxes": wallboxes}
+    try:
+        ready = asyncio.gather(*(manager.event_handlers.session.ready.wait() for manager in managers))
+        try:
+            await asyncio.wait_for(ready, timeout=args.login_timeout)
+        except asyncio.TimeoutError:
+            result["ready"] = sum(manager.event_handlers.session.ready.is_set() for manager in managers)
+            result["failed"] = ["sessions"]
+            return result
+        await asyncio.sleep(args.warmup)
+
+        TRACER.histogram._values.clear()
+        lag = LatencyHistogram(TRACER.BUCKETS)
+        probe = asyncio.ensure_future(_loop_lag(lag))
+        before = await generators.request("snapshot")
+        delivered, wall, cpu = broker.charge, time.perf_counter(), time.process_time()
+        await asyncio.sleep(args.seconds)
+        delivered, wall, cpu = broker.charge - delivered, time.perf_counter() - wall, time.process_time() - cpu
+        after = await generators.request("stop")
+        probe.cancel()
+        await asyncio.sleep(0.5)
+
+        sent = sum(item["status_frames"] for item in after)
+        stages = TRACER.summary()
+        result.update({
+            "frames_per_s": round(delivered / wall, 1),
+            "sent": sent,
+            "decoded": decoded[0],
+            "loss": round(max(sent - decoded[0], 0) / sent, 4) if sent else None,
+            "cpu": round(cpu / wall, 3),
+            "generator_cpu": [round((a["cpu_s"] - b["cpu_s"]) / wall, 3) for a, b in zip(after, before)],
+            "p95_ms": stages.get("total", {}).get("p95_ms"),
+            "loop_lag": lag.summary(),
+            "stages": {stage: summary["p95_ms"] for stage, summary in stages.items()},
+            "publishes": broker.publishes,
+            "mqtt_bytes": broker.bytes,
+        })
+        failed = []
+        if result["loss"] is None or result["loss"] > args.max_loss:
+            failed.append("loss")
+        if result["p95_ms"] is None or result["p95_ms"] > args.max_p95_ms:
+            failed.append("latency")
+        if result["cpu"] > args.max_cpu:
+            failed.append("cpu")
+        result["failed"] = failed
+        if any(value > 0.9 for value in result["generator_cpu"]):
+            result["warning"] = "a generator process is saturated, add --generators"
+        elif (os.cpu_count() or 1) <= len(generators.processes):
+            result["warning"] = "fewer cores than generators + 1, the wallboxes compete with evseMQTT for CPU"
+        return result
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        generators.join()
+
+
+async def ramp(args):
+    steps = []
+    wallboxes = args.start
+    while wallboxes <= args.max_wallboxes:
+        result = await step(args, wallboxes)
+        print(json.dumps(result), flush=True)
+        steps.append(result)
+        if result["failed"]:
+            break
+        wallboxes += args.step
+    passed = [result for result in steps if not result["failed"]]
+    best = passed[-1] if passed else None
+    return {
+        "rate_per_wallbox": args.rate,
+        "thresholds": {"loss": args.max_loss, "p95_ms": args.max_p95_ms, "cpu": args.max_cpu},
+        "max_wallboxes": best["wallboxes"] if best else 0,
+        "max_frames_per_s": best["frames_per_s"] if best else 0,
+        "limited_by": steps[-1]["failed"] if steps and steps[-1]["failed"] else None,
+        "steps": steps,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=float, default=1.0, help="Status frames per second per wallbox (default 1)")
+    parser.add_argument("--start", type=int, default=50, help="Wallboxes in the first step (default 50)")
+    parser.add_argument("--step", type=int, default=50, help="Wallboxes added per step (default 50)")
+    parser.add_argument("--max_wallboxes", type=int, default=1000, help="Stop ramping here (default 1000)")
+    parser.add_argument("--seconds", type=float, default=20, help="Measurement window per step (default 20)")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds between login and measuring (default 3)")
+    parser.add_argument("--login_timeout", type=float, default=60, help="Seconds for all sessions to come up (default 60)")
+    parser.add_argument("--max_loss", type=float, default=0.001, help="Highest acceptable frame loss (default 0.001)")
+    parser.add_argument("--max_p95_ms", type=float, default=50, help="Highest acceptable p95 receive-to-publish latency (default 50)")
+    parser.add_argument("--max_cpu", type=float, default=0.8, help="Highest acceptable CPU use, 1.0 = one core (default 0.8)")
+    parser.add_argument("--generators", type=int, default=2, help="Processes running the emulated wallboxes (default 2)")
+    parser.add_argument("--port", type=int, default=40000, help="First UDP port for the Managers (default 40000)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the emulators (default 1)")
+    parser.add_argument("--logging_level", type=str, default="WARNING", help="Logging level of the Managers (default WARNING)")
+    parser.add_argument("--json", type=str, help="Also write the result to this file")
+    args = parser.parse_args()
+
+    result = asyncio.run(ramp(args))
+    print(json.dumps({key: value for key, value in result.items() if key != "steps"}, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
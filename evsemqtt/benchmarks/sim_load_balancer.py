@@ -0,0 +1,215 @@
+"""Simulate a car park of wallboxes sharing a site limit through LoadBalancer.
+
+Simulated wallboxes send a status frame every --frame_interval seconds (each
+with its own offset) and cars arrive, charge and leave at random over a day in
+one-second steps. A car starts drawing as soon as it is plugged in, at the
+current the wallbox is set to, and some cars take less than the wallbox
+offers. Every amps change on a running session is a stop/start during which
+the car draws nothing for --restart_seconds; like Commands.restart_charge it
+only returns once the wallbox is back, --restart_seconds later on the
+simulated clock. The balancer is driven the way LoadBalancer.run does it,
+as a task woken by the status frames, so a balancer that waited for one
+wallbox's restart would hold up the others. The same day is run with:
+
+  * balancer: LoadBalancer with --strategy, fed by the simulated status frames
+  * static: every wallbox fixed at its share of the site limit
+
+Reported per run: seconds above the site limit, the longest stretch above it
+(a car plugging in while the limit is fully shared; the balancer should end
+it within one status frame), the peak overshoot, energy charged, and session
+restarts and pauses.
+
+    python sim_load_balancer.py --wallboxes 4 --limit 32 --strategy fair
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+
+import _stubs  # noqa: F401
+from evseMQTT.load_balancer import Charger, LoadBalancer
+
+VOLTAGE = 230
+
+
+class Clock:
+    """Simulated seconds; sleep_until() returns once advance() got there."""
+
+    def __init__(self):
+        self.now = 0
+        self._ticked = asyncio.Event()
+
+    def advance(self, now):
+        self.now = now
+        ticked, self._ticked = self._ticked, asyncio.Event()
+        ticked.set()
+
+    async def sleep_until(self, when):
+        while self.now < when:
+            await self._ticked.wait()
+
+
+class SimulatedWallbox(Charger):
+    def __init__(self, name, clock, restart_seconds, **kwargs):
+        super().__init__(name, **kwargs)
+        self.clock = clock
+        self.restart_seconds = restart_seconds
+        self.setting = 6                  # charge_amps configured on the wallbox
+        self.car = None                   # (leaves, car max amps) while plugged in
+        self.output = False
+        self.resume_at = None             # end of a restart
+        self.restarts = self.pauses = 0
+        self.charged_wh = 0.0
+
+    def draw(self):
+        if not self.car or not self.output or self.resume_at is not None:
+            return 0
+        return min(self.setting, self.car[1])
+
+    def status(self):
+        amps = self.draw()
+        charge = {
+            'output_state': "Charging" if self.output else "Idle",
+            'plug_state': "Connected" if self.car else "Disconnected",
+            'l1_voltage': VOLTAGE, 'l2_voltage': VOLTAGE if self.phases == 3 else 0,
+            'l3_voltage': VOLTAGE if self.phases == 3 else 0,
+        }
+        for line in range(3):
+            charge[f"l{line + 1}_amperage"] = amps if line in self.lines() else 0
+        return charge
+
+    async def apply(self, amps, running):
+        self.setting = amps
+        if running and self.output:
+            self.restarts += 1
+            self.resume_at = self.clock.now + self.restart_seconds
+            return asyncio.create_task(self.clock.sleep_until(self.resume_at))
+        return None
+
+    async def pause(self):
+        self.pauses += 1
+        self.output = False
+
+    async def resume(self, amps):
+        self.setting = amps
+        self.output = bool(self.car)
+
+
+class StaticBalancer:
+    """Every wallbox fixed at an equal share of the site limit."""
+
+    def __init__(self, wallboxes, limits):
+        self.wallboxes = wallboxes
+        self.limits = limits
+        self.allocation = {}
+
+    def update(self, charger, charge, now=None):
+        pass
+
+    async def rebalance(self, now=None):
+        for wallbox in self.wallboxes:
+            users = sum(1 for other in self.wallboxes if set(other.lines()) & set(wallbox.lines()))
+            wallbox.setting = max(6, min(self.limits) // users)
+            self.allocation[wallbox.name] = wallbox.setting
+        return self.allocation
+
+
+async def drive(balancer, clock, changed):
+    """Rebalance after status frames, as LoadBalancer.run does, on the simulated clock."""
+    while True:
+        await changed.wait()
+        changed.clear()
+        await balancer.rebalance(now=clock.now)
+
+
+async def run(args, mode):
+    rng = random.Random(args.seed)
+    clock = Clock()
+    limits = (args.limit,) * 3
+    wallboxes = []
+    for index in range(args.wallboxes):
+        single = index < args.single_phase
+        wallboxes.append(SimulatedWallbox(f"wb{index + 1}", clock, args.restart_seconds, phases=1 if single else 3,
+                                          phase=index % 3 + 1, priority=args.wallboxes - index))
+    if mode == "static":
+        balancer = StaticBalancer(wallboxes, limits)
+    else:
+        balancer = LoadBalancer(logging.getLogger("sim"), limits, strategy=args.strategy)
+        for wallbox in wallboxes:
+            balancer.add(wallbox)
+    await balancer.rebalance(now=0)
+    changed = asyncio.Event()
+    driver = asyncio.create_task(drive(balancer, clock, changed))
+
+    offsets = {wallbox: rng.randrange(args.frame_interval) for wallbox in wallboxes}
+    overload_s, longest, run_s, peak = 0, 0, 0, 0
+    for t in range(args.hours * 3600):
+        clock.advance(t)
+        for wallbox in wallboxes:
+            if wallbox.resume_at is not None and t >= wallbox.resume_at:
+                wallbox.resume_at = None
+            if wallbox.car is None and rng.random() < args.arrivals / 3600 / args.wallboxes:
+                wallbox.car = (t + rng.randint(1800, 4 * 3600), rng.choice((10, 16, 32, 32)))
+                wallbox.output = True
+            elif wallbox.car and t >= wallbox.car[0]:
+                wallbox.car, wallbox.output, wallbox.resume_at = None, False, None
+
+        load = [0, 0, 0]
+        for wallbox in wallboxes:
+            amps = wallbox.draw()
+            wallbox.charged_wh += amps * VOLTAGE * wallbox.phases / 3600
+            for line in wallbox.lines():
+                load[line] += amps
+        over = max(amps - limit for amps, limit in zip(load, limits))
+        if over > 0:
+            overload_s += 1
+            run_s += 1
+            longest = max(longest, run_s)
+            peak = max(peak, over)
+        else:
+            run_s = 0
+
+        for wallbox in wallboxes:
+            if (t - offsets[wallbox]) % args.frame_interval:
+                continue
+            balancer.update(wallbox, wallbox.status(), now=t)
+            changed.set()
+        # Let the driver and the restarts that are due run before the next second
+        for _ in range(3):
+            await asyncio.sleep(0)
+
+    driver.cancel()
+    return {
+        "overload_s": overload_s,
+        "longest_overload_s": longest,
+        "peak_over_limit_a": peak,
+        "charged_kwh": round(sum(wallbox.charged_wh for wallbox in wallboxes) / 1000, 1),
+        "per_wallbox_kwh": {wallbox.name: round(wallbox.charged_wh / 1000, 1) for wallbox in wallboxes},
+        "restarts": sum(wallbox.restarts for wallbox in wallboxes),
+        "pauses": sum(wallbox.pauses for wallbox in wallboxes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the car arrivals (default 1)")
+    parser.add_argument("--wallboxes", type=int, default=4, help="Number of wallboxes (default 4)")
+    parser.add_argument("--single_phase", type=int, default=1, help="How many of them are single-phase (default 1)")
+    parser.add_argument("--limit", type=int, default=32, help="Site limit per phase in A (default 32)")
+    parser.add_argument("--strategy", type=str, default="fair", choices=LoadBalancer.STRATEGIES, help="Balancer strategy (default fair)")
+    parser.add_argument("--arrivals", type=float, default=3, help="Cars arriving per hour across the site (default 3)")
+    parser.add_argument("--hours", type=int, default=12, help="Simulated hours (default 12)")
+    parser.add_argument("--frame_interval", type=int, default=2, help="Seconds between status frames of a wallbox (default 2)")
+    parser.add_argument("--restart_seconds", type=int, default=15, help="Seconds without current while a session restarts (default 15)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    print(json.dumps({
+        "balancer": asyncio.run(run(args, "balancer")),
+        "static": asyncio.run(run(args, "static")),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""Simulate a day of PV-surplus charging with SurplusController and with the blueprints.
+
+A three-phase wallbox, a PV plant with passing clouds and a household with a
+few large loads are simulated in one-second steps on a virtual clock. The grid
+meter reports feed-in and import every --meter_interval seconds. The same day
+is run twice:
+
+  * controller: SurplusController fed straight from the meter readings
+  * blueprints: a model of the Home Assistant automations it replaces
+    (wallbox_surplus_start/_amps/_stop): raw feed-in, a 3 A step filter, the
+    60 s restart cooldown in MQTTCallback and --ha_latency seconds between a
+    meter update and the command reaching the wallbox
+
+Every amps change on a running session is a stop/start on the wallbox, during
+which the car draws nothing for --restart_seconds. Reported per run: session
+starts and stops, setpoint changes, energy charged, energy drawn from the grid
+while charging, surplus exported while charging, and the mean time from a
+surplus change to the wallbox following it.
+
+    python sim_surplus.py --seed 3
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+
+import _stubs  # noqa: F401
+from evseMQTT import Device, SurplusController
+
+VOLTAGE = 230
+PHASES = 3
+
+
+class World:
+    """PV plant, household and wallbox."""
+
+    def __init__(self, seed, restart_seconds, start_seconds=5):
+        self.random = random.Random(seed)
+        self.restart_seconds = restart_seconds
+        self.start_seconds = start_seconds
+        self.cloud = 1.0
+        self.cloud_target = 1.0
+        self.loads = []                   # (until, watts)
+        self.amps = 0                     # current the car draws
+        self.pending = None               # (time, amps) the wallbox switches to next
+        self.setpoint_changes = 0
+        self.starts = 0
+        self.stops = 0
+        self.charged_wh = self.grid_wh = self.exported_wh = 0.0
+        self.lag = []                     # seconds until the car followed a surplus change
+        self._lag_since = None
+
+    def pv_w(self, t):
+        hour = t / 3600
+        clear = max(0.0, math.sin(math.pi * (hour - 6) / 14)) * 10000
+        if self.random.random() < 1 / 120:
+            self.cloud_target = self.random.choice((1.0, 0.9, 0.6, 0.35))
+        self.cloud += (self.cloud_target - self.cloud) * 0.05
+        return clear * self.cloud * (1 + self.random.gauss(0, 0.02))
+
+    def house_w(self, t):
+        if self.random.random() < 1 / 1800:
+            self.loads.append((t + self.random.randint(120, 1200), self.random.choice((1500, 2200, 3000))))
+        self.loads = [(until, watts) for until, watts in self.loads if until > t]
+        return 350 + sum(watts for _, watts in self.loads)
+
+    def command(self, t, amps, restart):
+        if amps == 0:
+            self.stops += 1
+            self.amps, self.pending = 0, None
+            return
+        if self.amps == 0 and self.pending is None:
+            self.starts += 1
+            self.pending = (t + self.start_seconds, amps)
+            return
+        self.setpoint_changes += 1
+        if restart:
+            self.amps = 0
+            self.pending = (t + self.restart_seconds, amps)
+
+    @property
+    def charging(self):
+        return self.amps > 0 or self.pending is not None
+
+    def step(self, t):
+        if self.pending and t >= self.pending[0]:
+            self.amps, self.pending = self.pending[1], None
+        pv, house = self.pv_w(t), self.house_w(t)
+        car = self.amps * VOLTAGE * PHASES
+        balance = pv - house - car        # > 0: exported
+        if self.charging:
+            self.charged_wh += car / 3600
+            self.grid_wh += max(-balance, 0) / 3600
+            self.exported_wh += max(balance, 0) / 3600
+            # How long the car's current stays more than 3 A off what the surplus allows
+            ideal = max(min((pv - house) // (VOLTAGE * PHASES), 32), 6)
+            if abs(ideal - self.amps) > 3:
+                if self._lag_since is None:
+                    self._lag_since = t
+            elif self._lag_since is not None:
+                self.lag.append(t - self._lag_since)
+                self._lag_since = None
+        return max(balance, 0), max(-balance, 0)
+
+    def result(self):
+        return {
+            "starts": self.starts,
+            "stops": self.stops,
+            "setpoint_changes": self.setpoint_changes,
+            "charged_kwh": round(self.charged_wh / 1000, 2),
+            "grid_kwh_while_charging": round(self.grid_wh / 1000, 2),
+            "exported_kwh_while_charging": round(self.exported_wh / 1000, 2),
+            "mean_follow_s": round(sum(self.lag) / len(self.lag), 1) if self.lag else None,
+        }
+
+
+class SimulatedCommands:
+    def __init__(self, world, device, clock):
+        self.world = world
+        self.device = device
+        self.clock = clock
+
+    async def set_config_output_amps(self, amps):
+        self.device.config = {'charge_amps': amps}
+
+    async def set_charge_start(self, amps):
+        self.world.command(self.clock[0], amps, restart=False)
+
+    async def set_charge_stop(self):
+        self.world.command(self.clock[0], 0, restart=False)
+
+    async def restart_charge(self, amps):
+        self.world.command(self.clock[0], amps, restart=True)
+        return True
+
+
+def _device():
+    device = Device("AA:BB:CC:DD:EE:FF")
+    device.unit = "W"
+    device.info = {'serial': "2023040112345678", 'phases': PHASES}
+    device.config = {'charge_amps': 6}
+    return device
+
+
+def _sync_device(device, world):
+    device.charge = {
+        'output_state': "Charging" if world.amps else "Idle",
+        'plug_state': "Connected Locked",
+        'current_energy': world.amps * VOLTAGE * PHASES,
+        'l1_voltage': VOLTAGE, 'l2_voltage': VOLTAGE, 'l3_voltage': VOLTAGE,
+    }
+
+
+async def run_controller(args):
+    world = World(args.seed, args.restart_seconds)
+    device = _device()
+    clock = [0]
+    controller = SurplusController(device, SimulatedCommands(world, device, clock), logging.getLogger("sim"))
+    for t in range(args.start * 3600, args.end * 3600):
+        clock[0] = t
+        feedin, grid = world.step(t)
+        _sync_device(device, world)
+        if t % args.meter_interval == 0:
+            controller.on_measurement("feedin", str(feedin), now=t)
+            controller.on_measurement("grid", str(grid), now=t)
+            await controller.step(now=t)
+            await asyncio.sleep(0)        # let a charge restart task run
+    return world.result()
+
+
+async def run_blueprints(args):
+    """The start, amps and stop blueprints plus MQTTCallback's cooldown, with HA latency."""
+    world = World(args.seed, args.restart_seconds)
+    amps, cooldown_until, start_since, stop_since = 6, 0, None, None
+    queue = []                            # (time, action, amps) on their way through HA and MQTT
+    buffer_w, start_w, stop_w = 200, 6 * VOLTAGE * PHASES, 50
+    for t in range(args.start * 3600, args.end * 3600):
+        feedin, grid = world.step(t)
+        while queue and queue[0][0] <= t:
+            _, action, value = queue.pop(0)
+            if action == "start":
+                world.command(t, amps, restart=False)
+            elif action == "stop":
+                world.command(t, 0, restart=False)
+            else:
+                amps = value
+                if world.amps and t >= cooldown_until:
+                    world.command(t, value, restart=True)
+                    cooldown_until = t + 60
+        if t % args.meter_interval:
+            continue
+        own = world.amps * VOLTAGE * PHASES
+        if not world.charging:
+            if feedin - buffer_w < start_w:
+                start_since = None
+            elif start_since is None:
+                start_since = t
+            if start_since is not None and t - start_since >= 180:
+                queue.append((t + args.ha_latency, "start", None))
+                start_since = None
+            continue
+        if feedin >= stop_w:
+            stop_since = None
+        elif stop_since is None:
+            stop_since = t
+        if stop_since is not None and t - stop_since >= 300:
+            queue.append((t + args.ha_latency, "stop", None))
+            stop_since = None
+            continue
+        target = int(max(min((feedin + own - grid - buffer_w) / (VOLTAGE * PHASES), 32), 6))
+        if abs(target - amps) >= 3:
+            queue.append((t + args.ha_latency, "amps", target))
+            amps = target
+    return world.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for weather and household (default 1)")
+    parser.add_argument("--start", type=int, default=7, help="First hour of the simulated day (default 7)")
+    parser.add_argument("--end", type=int, default=19, help="Last hour of the simulated day (default 19)")
+    parser.add_argument("--meter_interval", type=int, default=5, help="Seconds between meter readings (default 5)")
+    parser.add_argument("--ha_latency", type=int, default=3, help="Seconds from meter update to command in the blueprint model (default 3)")
+    parser.add_argument("--restart_seconds", type=int, default=15, help="Seconds without current while the wallbox restarts a session (default 15)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    print(json.dumps({
+        "controller": asyncio.run(run_controller(args)),
+        "blueprints": asyncio.run(run_blueprints(args)),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,26 @@ RSSI=${RSSI:-"false"}
 WIFI_ENABLED=${WIFI_ENABLED:-"false"}
 WIFI_PORT=${WIFI_PORT:-28376}
 WIFI_IP=${WIFI_IP:-""}
+CAPTURE=${CAPTURE:-"false"}
+METRICS_PORT=${METRICS_PORT:-0}
+METRICS_HOST=${METRICS_HOST:-"127.0.0.1"}
+SESSION_LEDGER=${SESSION_LEDGER:-"false"}
+TELEMETRY_STORE=${TELEMETRY_STORE:-"false"}
+SURPLUS_FEEDIN_TOPIC=${SURPLUS_FEEDIN_TOPIC:-""}
+SURPLUS_GRID_TOPIC=${SURPLUS_GRID_TOPIC:-""}
+SURPLUS_BATTERY_TOPIC=${SURPLUS_BATTERY_TOPIC:-""}
+SURPLUS_KW=${SURPLUS_KW:-"false"}
+SURPLUS_BUFFER_W=${SURPLUS_BUFFER_W:-200}
+SURPLUS_MAX_AMPS=${SURPLUS_MAX_AMPS:-32}
+BALANCE_LIMIT=${BALANCE_LIMIT:-""}
+BALANCE_STRATEGY=${BALANCE_STRATEGY:-"fair"}
+BALANCE_PRIORITY=${BALANCE_PRIORITY:-0}
+BALANCE_PHASE=${BALANCE_PHASE:-1}
+BALANCE_MAX_AMPS=${BALANCE_MAX_AMPS:-32}
+BALANCE_REMOTES=${BALANCE_REMOTES:-""}
+ENTITY_GROUPS=${ENTITY_GROUPS:-""}
+DISCOVERY_MODE=${DISCOVERY_MODE:-"entity"}
+JSON_BACKEND=${JSON_BACKEND:-"json"}
 EXTRA_ARGS=""
 
 if [ "${WIFI_ENABLED}" = "true" ]; then
@@ -24,6 +44,52 @@ else
     fi
 fi
 
+if [ "${CAPTURE}" = "true" ]; then
+    EXTRA_ARGS="${EXTRA_ARGS} --capture /data/frames.cap"
+fi
+
+if [ "${METRICS_PORT}" != "0" ]; then
+    EXTRA_ARGS="${EXTRA_ARGS} --metrics_port ${METRICS_PORT} --metrics_host ${METRICS_HOST}"
+fi
+
+if [ "${SESSION_LEDGER}" = "true" ]; then
+    EXTRA_ARGS="${EXTRA_ARGS} --session_db /data/sessions.db"
+fi
+
+if [ "${TELEMETRY_STORE}" = "true" ]; then
+    EXTRA_ARGS="${EXTRA_ARGS} --telemetry_dir /data/telemetry"
+fi
+
+if [ -n "${SURPLUS_FEEDIN_TOPIC}" ]; then
+    EXTRA_ARGS="${EXTRA_ARGS} --surplus_feedin_topic ${SURPLUS_FEEDIN_TOPIC}"
+    EXTRA_ARGS="${EXTRA_ARGS} --surplus_buffer_w ${SURPLUS_BUFFER_W} --surplus_max_amps ${SURPLUS_MAX_AMPS}"
+    if [ -n "${SURPLUS_GRID_TOPIC}" ]; then
+        EXTRA_ARGS="${EXTRA_ARGS} --surplus_grid_topic ${SURPLUS_GRID_TOPIC}"
+    fi
+    if [ -n "${SURPLUS_BATTERY_TOPIC}" ]; then
+        EXTRA_ARGS="${EXTRA_ARGS} --surplus_battery_topic ${SURPLUS_BATTERY_TOPIC}"
+    fi
+    if [ "${SURPLUS_KW}" = "true" ]; then
+        EXTRA_ARGS="${EXTRA_ARGS} --surplus_kw"
+    fi
+fi
+
+if [ -n "${BALANCE_LIMIT}" ]; then
+    EXTRA_ARGS="${EXTRA_ARGS} --balance_limit ${BALANCE_LIMIT} --balance_strategy ${BALANCE_STRATEGY}"
+    EXTRA_ARGS="${EXTRA_ARGS} --balance_priority ${BALANCE_PRIORITY} --balance_phase ${BALANCE_PHASE} --balance_max_amps ${BALANCE_MAX_AMPS}"
+    for REMOTE in $(echo "${BALANCE_REMOTES}" | tr ',' ' '); do
+        EXTRA_ARGS="${EXTRA_ARGS} --balance_remote ${REMOTE}"
+    done
+fi
+
+if [ -n "${ENTITY_GROUPS}" ]; then
+    EXTRA_ARGS="${EXTRA_ARGS} --entity_groups ${ENTITY_GROUPS}"
+fi
+
+EXTRA_ARGS="${EXTRA_ARGS} --discovery_mode ${DISCOVERY_MODE}"
+
+EXTRA_ARGS="${EXTRA_ARGS} --json_backend ${JSON_BACKEND}"
+
 if [ -n "${SYS_MODULE_TO_RELOAD}" ]; then
     echo "Sys module reload enabled for: ${SYS_MODULE_TO_RELOAD}"
     if [ -d /lib/modules/ ]; then
@@ -1,12 +1,47 @@
-from .ble_manager import BLEManager
-from .wifi_manager import WiFiManager
-from .device import Device
-from .event_handlers import EventHandlers
-from .logger import Logger
-from .utils import Utils
-from .constants import Constants
-from .parsers import Parsers
-from .mqttpayloads import MQTTPayloads
-from .mqttclient import MQTTClient
-from .mqttcallback import MQTTCallback
-from .commands import Commands
\ No newline at end of file
+# Names are resolved on first access (PEP 562), so a module and its
+# dependencies are only imported once something uses it: BLEManager pulls in
+# bleak, MQTTClient paho-mqtt, and neither is needed in every mode.
+import importlib
+
+_EXPORTS = {
+    "BLEManager": ".ble_manager",
+    "WiFiManager": ".wifi_manager",
+    "Device": ".device",
+    "EventHandlers": ".event_handlers",
+    "Logger": ".logger",
+    "Utils": ".utils",
+    "Constants": ".constants",
+    "Parsers": ".parsers",
+    "MQTTPayloads": ".mqttpayloads",
+    "MQTTClient": ".mqttclient",
+    "MQTTCallback": ".mqttcallback",
+    "StateSerializer": ".serializer",
+    "Commands": ".commands",
+    "TaskSupervisor": ".supervisor",
+    "FrameCapture": ".capture",
+    "MetricsServer": ".metrics",
+    "Diagnostics": ".diagnostics",
+    "TRACER": ".tracing",
+    "TelemetryBuffer": ".telemetry",
+    "ChargeSessionDetector": ".charge_sessions",
+    "ChargeSessionLedger": ".charge_sessions",
+    "TelemetryStore": ".telemetry_store",
+    "SurplusController": ".surplus",
+    "LoadBalancer": ".load_balancer",
+    "LocalCharger": ".load_balancer",
+    "RemoteCharger": ".load_balancer",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
\ No newline at end of file
@@ -1,80 +1,123 @@
 import asyncio
+import json
 import logging
 from bleak import BleakScanner, BleakClient, BleakError
+from . import metrics
+from .capture import FrameCapture
 from .constants import Constants
+from .rssi_monitor import RSSIMonitor
+from .scheduler import CommandScheduler
+from .tracing import TRACER
+
+# File used to persist resolved GATT profiles across add-on restarts.
+_PROFILE_CACHE_FILE = "/data/ble_profiles.json"
 
 class BLEManager:
-    def __init__(self, event_handler, logger, callback=None):
+    def __init__(self, event_handler, logger, callback=None, rssi_window=10, scan_timeout=10.0):
         self.connected_devices = {}
         self.available_devices = {}
         self.connectiondata = {}
         self.logger = logger  # Use the centralized logger
-        self.queue = asyncio.Queue(5)
+        self.queue = CommandScheduler(logger)
         self.callback = callback
         self.event_handler = event_handler  # Use the EventHandlers instance passed from MainManager
         self.last_message_time = asyncio.get_event_loop().time()
         self.message_timeout = 35  # 35 seconds timeout for message reception
         self.max_retries = 5  # Maximum number of retries for connection
+        self.scan_timeout = scan_timeout  # Upper bound for a single scan in seconds
+        self.rssi_monitor = RSSIMonitor(logger=logger, window=rssi_window)
+        self.capture = None  # Optional FrameCapture, set by Manager
+        # bleak classes used to scan and connect; the emulator substitutes fakes
+        self.scanner = BleakScanner
+        self.client_factory = BleakClient
+        metrics.QUEUE_DEPTH.set_function(lambda: self.queue.qsize(), "ble")
         
         self.write_uuid = ""
         self.read_uuid = ""
+        self.board_revision = None
+
+        # Resolved GATT profiles (UUIDs, board revision, fallback) from previous connections
+        self.profiles = self._load_profiles()
+
+        # Write path tuning, resolved per connection in _configure_writes()
+        self.write_chunk_size = Constants.BLE_MIN_WRITE_SIZE  # Largest payload per GATT write
+        self.write_without_response = False  # Characteristic supports write-without-response
+        self.write_with_response = True  # Characteristic supports acknowledged writes
+        self.write_window = 8  # Max frames pipelined before an acknowledged write
 
         # Ensure bleak does not go bananas, if we set logging to DEBUG
         self.logger_bleak = logging.getLogger("bleak")
         self.logger_bleak.setLevel(logging.INFO)
 
-    async def scan(self, device_addr = False):
-        self.logger.info("Scanning for evse BLE devices...")
-        try:
-            devices = await BleakScanner.discover(return_adv=True)
+    @staticmethod
+    def _is_evse(device, adv_data):
+        name = device.name or adv_data.local_name or ""
+        return "ACP#" in name
 
-            # Filter devices with "ACP#" in their name
-            self.available_devices = {dev.address: (dev, adv_data) for dev, adv_data in devices.values() if "ACP#" in dev.name}
-            
-            if device_addr:
-                return self.available_devices[device_addr][1].rssi
+    async def scan(self, address=None):
+        """Targeted scan: return as soon as the wallbox is seen.
 
-            for address, (device, adv_data) in self.available_devices.items():
-                self.logger.info(f"Found device: {device.name} ({address})")
-                self.connectiondata[address] = device
+        Stops at the first advertisement from address (or from any ACP# device when
+        no address is given), or after scan_timeout seconds at the latest.
+        """
+        self.logger.info(f"Scanning for evse BLE device {address or ''}...")
+        found = {}
 
-            return self.available_devices
+        def match(device, adv_data):
+            if not self._is_evse(device, adv_data):
+                return False
+            found[device.address] = (device, adv_data)
+            return address is None or device.address.upper() == address.upper()
 
+        try:
+            await self.scanner.find_device_by_filter(match, timeout=self.scan_timeout)
         except BleakError as e:
             await self.manager.exit_with_error(f"BleakError during scanning: {e}")
-            
+            return None
+
+        self._remember_devices(found)
+        return self.available_devices
+
+    async def discover(self, timeout=None):
+        """General discovery: scan for the full window and list every evse device in range."""
+        self.logger.info("Scanning for evse BLE devices...")
+        devices = await self.scanner.discover(timeout=timeout or self.scan_timeout, return_adv=True)
+        self.available_devices = {}
+        self._remember_devices({dev.address: (dev, adv_data) for dev, adv_data in devices.values()
+                                if self._is_evse(dev, adv_data)})
+        return self.available_devices
+
+    def _remember_devices(self, devices):
+        for address, (device, adv_data) in devices.items():
+            self.logger.info(f"Found device: {device.name} ({address})")
+            self.available_devices[address] = (device, adv_data)
+            self.connectiondata[address] = device
+
     async def connect_device(self, address):
-        if address in self.available_devices:
+        profile = self.profiles.get(address)
+        if address in self.available_devices or profile:
             for attempt in range(self.max_retries):
                 self.logger.info(f"Connecting to {address}, attempt {attempt + 1}")
                 try:
-                    client = BleakClient(address, timeout=65.0)
+                    client = self.client_factory(address, timeout=65.0)
                     await client.connect()
 
-                    services = client.services
-                    service_uuids = [service.uuid for service in services]
-
-                    # Check service UUIDs to determine board type
-                    if any(uuid.startswith("0000ffe5-") or uuid.startswith("0000ffe0-") for uuid in service_uuids):
-                        self.logger.debug(f"Device ({address}) identified as new revision")
-                        self.write_uuid = Constants.NEW_BOARD_WRITE_UUID
-                        self.read_uuid = Constants.NEW_BOARD_READ_UUID
-                    elif any(uuid.startswith("0003cdd0-") for uuid in service_uuids):
-                        self.logger.debug(f"Device ({address}) identified as other revision")
-                        self.write_uuid = Constants.REV_WRITE_UUID
-                        self.read_uuid = Constants.REV_READ_UUID
-                        self.event_handler.device.fallback = True
-                    else:
-                        self.logger.debug(f"Device ({address}) identified as old revision")
-                        self.write_uuid = Constants.WRITE_UUID
-                        self.read_uuid = Constants.READ_UUID
-
                     self.connected_devices[address] = client
                     self.logger.info(f"Connected to {address}")
-                    await self.start_notifications(address, self.read_uuid)
-                                        
-                    self.event_handler.device.config = {"rssi": self.available_devices[address][1].rssi}
-                    self._schedule_reconnect_check()
+
+                    # Reuse the profile resolved on a previous connection. If its
+                    # characteristics do not work any more, classify the board again.
+                    if not (profile and await self._use_cached_profile(address, client, profile)):
+                        profile = self._resolve_profile(address, client)
+                        self._apply_profile(profile)
+                        await self._configure_writes(client)
+                        await self.start_notifications(address, self.read_uuid)
+                        self._save_profile(address, profile)
+
+                    if address in self.available_devices:
+                        self.event_handler.device.config = {"rssi": self.available_devices[address][1].rssi}
+                    # Give the watchdog a full message_timeout from the moment we connected.
+                    self.last_message_time = asyncio.get_event_loop().time()
                     return True
                 except BleakError as e:
                     self.logger.error(f"Attempt {attempt + 1} failed with BleakError: {e}")
@@ -87,6 +130,79 @@ class BLEManager:
             await self.manager.exit_with_error(f"Device {address} not found")
             return False
 
+    def _resolve_profile(self, address, client):
+        """Classify the board revision from its service UUIDs."""
+        service_uuids = [service.uuid for service in client.services]
+
+        # Check service UUIDs to determine board type
+        if any(uuid.startswith("0000ffe5-") or uuid.startswith("0000ffe0-") for uuid in service_uuids):
+            self.logger.debug(f"Device ({address}) identified as new revision")
+            return {"revision": "new", "write_uuid": Constants.NEW_BOARD_WRITE_UUID,
+                    "read_uuid": Constants.NEW_BOARD_READ_UUID, "fallback": False}
+        elif any(uuid.startswith("0003cdd0-") for uuid in service_uuids):
+            self.logger.debug(f"Device ({address}) identified as other revision")
+            return {"revision": "rev", "write_uuid": Constants.REV_WRITE_UUID,
+                    "read_uuid": Constants.REV_READ_UUID, "fallback": True}
+        else:
+            self.logger.debug(f"Device ({address}) identified as old revision")
+            return {"revision": "old", "write_uuid": Constants.WRITE_UUID,
+                    "read_uuid": Constants.READ_UUID, "fallback": False}
+
+    def _apply_profile(self, profile):
+        self.write_uuid = profile["write_uuid"]
+        self.read_uuid = profile["read_uuid"]
+        self.board_revision = profile["revision"]
+        if profile["fallback"]:
+            self.event_handler.device.fallback = True
+
+    async def _use_cached_profile(self, address, client, profile):
+        """Apply a cached profile; return False if its characteristics are unusable."""
+        try:
+            if client.services.get_characteristic(profile["write_uuid"]) is None:
+                raise BleakError(f"write characteristic {profile['write_uuid']} not found")
+            self._apply_profile(profile)
+            await self._configure_writes(client)
+            await client.start_notify(self.read_uuid, self._handle_notification_wrapper)
+        except (BleakError, KeyError) as e:
+            self.logger.warning(f"Cached GATT profile for {address} failed ({e}), running full discovery")
+            self._forget_profile(address)
+            return False
+        self.logger.info(f"Using cached GATT profile for {address} ({profile['revision']} revision)")
+        return True
+
+    # ------------------------------------------------------------------
+    # GATT profile cache helpers
+    # ------------------------------------------------------------------
+
+    def _load_profiles(self):
+        """Return the cached GATT profiles keyed by address, or an empty dict."""
+        try:
+            with open(_PROFILE_CACHE_FILE, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, IOError, json.JSONDecodeError):
+            return {}
+
+    def _write_profiles(self):
+        try:
+            with open(_PROFILE_CACHE_FILE, "w") as f:
+                json.dump(self.profiles, f)
+        except IOError as e:
+            self.logger.warning(f"Could not save GATT profile cache: {e}")
+
+    def _save_profile(self, address, profile):
+        """Persist the resolved profile so reconnects can skip scanning and classification."""
+        if self.profiles.get(address) != profile:
+            self.profiles[address] = profile
+            self._write_profiles()
+            self.logger.debug(f"Cached GATT profile for {address}: {profile}")
+
+    def _forget_profile(self, address):
+        if self.profiles.pop(address, None) is not None:
+            self._write_profiles()
+
+    def has_profile(self, address):
+        return address in self.profiles
+
     async def start_notifications(self, address, characteristic_uuid):
         if address in self.connected_devices:
             self.logger.debug(f"Starting notifications for {characteristic_uuid} on {address}")
@@ -100,7 +216,10 @@ class BLEManager:
             return False
 
     async def _handle_notification_wrapper(self, sender, data):
+        TRACER.begin("ble")
         self.last_message_time = asyncio.get_event_loop().time()
+        if self.capture:
+            self.capture.record(FrameCapture.INBOUND, "ble", data)
         await self.event_handler.receive_notification(sender, data)
 
     async def disconnect_device(self, address):
@@ -131,45 +250,126 @@ class BLEManager:
             await self.manager.exit_with_error(f"Device {address} not connected")
             return None
 
-    async def write_characteristic(self, address, characteristic_uuid, data):
+    async def _configure_writes(self, client):
+        """Pick the cheapest write mode the write characteristic supports and its chunk size."""
+        characteristic = client.services.get_characteristic(self.write_uuid)
+        properties = characteristic.properties if characteristic else []
+        self.write_without_response = "write-without-response" in properties
+        self.write_with_response = "write" in properties or not self.write_without_response
+
+        # Only writes without response are chunked; bleak does a long write otherwise.
+        # bleak derives max_write_without_response_size from the MTU negotiated for
+        # this connection (MTU - 3); never go below the 20-byte ATT minimum.
+        chunk_size = characteristic.max_write_without_response_size if self.write_without_response else 0
+        self.write_chunk_size = max(chunk_size, Constants.BLE_MIN_WRITE_SIZE)
+
+        self.logger.info(f"Write mode: {'without' if self.write_without_response else 'with'} response"
+                         + (f", {self.write_chunk_size} bytes per write" if self.write_without_response else ""))
+
+    async def write_characteristic(self, address, characteristic_uuid, data, response=None):
         if address in self.connected_devices:
             self.logger.debug(f"Writing to characteristic {characteristic_uuid} on {address}")
             client = self.connected_devices[address]
-            await client.write_gatt_char(characteristic_uuid, data)
+            if response is None:
+                response = not self.write_without_response
+
+            # With write-without-response, frames larger than a single ATT payload are
+            # split and only the last chunk carries the requested response semantics.
+            # Characteristics that only support "write" get the whole frame with response.
+            if self.write_without_response:
+                chunks = [data[i:i + self.write_chunk_size] for i in range(0, len(data), self.write_chunk_size)]
+            else:
+                chunks = [data]
+                response = True
+            try:
+                for index, chunk in enumerate(chunks):
+                    last = index == len(chunks) - 1
+                    await client.write_gatt_char(characteristic_uuid, chunk, response=response and last)
+            except Exception:
+                metrics.SEND_ERRORS.inc("ble")
+                raise
             self.logger.debug(f"Write complete")
+            metrics.FRAMES_SENT.inc("ble")
+            if self.capture:
+                self.capture.record(FrameCapture.OUTBOUND, "ble", data)
             return True
         else:
+            metrics.SEND_ERRORS.inc("ble")
             await self.manager.exit_with_error(f"Device {address} not connected")
             return False
 
+    async def write_batch(self, address, characteristic_uuid, messages):
+        """Pipeline several frames back to back.
+
+        With write-without-response the frames go out without waiting for a GATT
+        round trip. Every write_window frames, and at the end of the batch, one write
+        is acknowledged to bound the number of writes in flight. ATT preserves
+        ordering, so that acknowledgement covers the frames before it as well.
+        """
+        if not self.write_without_response:
+            for message in messages:
+                if not await self.write_characteristic(address, characteristic_uuid, message):
+                    return False
+            return True
+
+        for index, message in enumerate(messages):
+            barrier = self.write_with_response and (
+                (index + 1) % self.write_window == 0 or index == len(messages) - 1
+            )
+            if not await self.write_characteristic(address, characteristic_uuid, message, response=barrier):
+                return False
+        return True
+
     async def heartbeat(self, interval, address):
-        while True:
-            self.logger.debug(f"Retrieving RSSI for device {address}")
-            rssi = await self.scan(address)
-            self.event_handler.device.config = {"rssi": rssi}
-            await asyncio.sleep(interval)
+        await self.rssi_monitor.start(address)
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                # A few intervals without advertisements and the last value is stale
+                rssi = self.rssi_monitor.smoothed(address, max_age=3 * interval)
+                if rssi is None:
+                    self.logger.debug(f"No recent advertisements seen from {address}")
+                    continue
+
+                self.logger.debug(f"Smoothed RSSI for device {address}: {rssi}")
+                device = self.event_handler.device
+                device.config = {"rssi": rssi}
+                if self.event_handler.callback and device.initialization_state:
+                    self.event_handler.callback(device.info['serial'], "config", device.config)
+        finally:
+            await self.rssi_monitor.stop()
 
     async def message_consumer(self, address, characteristic_uuid):
         while True:
             if not self.connected_devices.get(address):
                 self.logger.warning(f"Device {address} not connected. Attempting to reconnect...")
-                await self.connect_device(address)
+                if await self.connect_device(address):
+                    metrics.RECONNECTS.inc("ble")
                 await asyncio.sleep(1)
                 continue
 
-            message = await self.queue.get()
-            await self.write_characteristic(address, characteristic_uuid, message)
-            self.queue.task_done()
+            # Drain whatever is queued (up to one window) so bursts such as the
+            # login sequence are pipelined instead of paying a round trip per frame.
+            batch = [await self.queue.get()]
+            while len(batch) < self.write_window and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
 
-    async def message_producer(self, message):
-        await self.queue.put(message)
+            try:
+                await self.write_batch(address, characteristic_uuid, batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
 
-    def _schedule_reconnect_check(self):
-        asyncio.get_event_loop().call_later(self.message_timeout, self._check_reconnect)
+    async def message_producer(self, message, priority=CommandScheduler.CONFIG):
+        return self.queue.put_nowait(message, priority)
 
-    def _check_reconnect(self):
-        if asyncio.get_event_loop().time() - self.last_message_time > self.message_timeout:
-            self.logger.warning(f"No message received in the last {self.message_timeout} seconds. Requesting manager to restart.")
-            asyncio.create_task(self.manager.restart_run())
-        else:
-            self._schedule_reconnect_check()
\ No newline at end of file
+    async def watchdog(self):
+        """Ask the manager for a restart once no notification arrived for message_timeout seconds."""
+        loop = asyncio.get_event_loop()
+        while True:
+            silent = loop.time() - self.last_message_time
+            if silent >= self.message_timeout:
+                self.logger.warning(f"No message received in the last {self.message_timeout} seconds. Requesting manager to restart.")
+                self.manager.request_restart("BLE watchdog")
+                return
+            await asyncio.sleep(self.message_timeout - silent)
\ No newline at end of file
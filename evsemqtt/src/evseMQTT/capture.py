@@ -0,0 +1,73 @@
+import os
+import struct
+import time
+
+class FrameCapture:
+    """Append-only binary log of raw frames, for reproducing field problems.
+
+    The file starts with the 8 byte magic EVSECAP1, followed by one record per
+    frame: a little-endian header (monotonic timestamp as double, direction,
+    transport, payload length) and the raw payload. Outbound frames have their
+    password field zeroed so captures can be shared.
+    """
+
+    MAGIC = b"EVSECAP1"
+    RECORD = struct.Struct("<dBBH")
+
+    INBOUND = 0
+    OUTBOUND = 1
+    DIRECTIONS = {INBOUND: "in", OUTBOUND: "out"}
+    TRANSPORTS = {"ble": 0, "wifi": 1}
+
+    def __init__(self, path, logger=None, flush_interval=1.0):
+        self.path = path
+        self.logger = logger
+        self.flush_interval = flush_interval  # seconds between flushes to disk
+        self.frames = 0
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "ab")
+        if new:
+            self._file.write(self.MAGIC)
+        self._last_flush = time.monotonic()
+        if logger:
+            logger.info(f"Capturing raw frames to {path}")
+
+    def record(self, direction, transport, data):
+        if self._file is None:
+            return
+        data = bytes(data)
+        if direction == self.OUTBOUND and len(data) >= 19:
+            data = data[:13] + bytes(6) + data[19:]
+        now = time.monotonic()
+        self._file.write(self.RECORD.pack(now, direction, self.TRANSPORTS[transport], len(data)))
+        self._file.write(data)
+        self.frames += 1
+        if now - self._last_flush >= self.flush_interval:
+            self._file.flush()
+            self._last_flush = now
+
+    def close(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        if self.logger:
+            self.logger.info(f"Captured {self.frames} frames to {self.path}")
+
+
+def read_capture(path):
+    """Yield (timestamp, direction, transport, payload) for every frame in a capture file."""
+    transports = {value: name for name, value in FrameCapture.TRANSPORTS.items()}
+    with open(path, "rb") as f:
+        if f.read(len(FrameCapture.MAGIC)) != FrameCapture.MAGIC:
+            raise ValueError(f"{path} is not a frame capture")
+        header_size = FrameCapture.RECORD.size
+        while True:
+            header = f.read(header_size)
+            if len(header) < header_size:
+                return
+            timestamp, direction, transport, length = FrameCapture.RECORD.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return  # truncated last record, e.g. after a crash
+            yield timestamp, direction, transports.get(transport, "unknown"), payload
@@ -0,0 +1,277 @@
+import argparse
+import calendar
+import json
+import sqlite3
+import time
+
+class ChargeSession:
+    """Running totals of one charging session."""
+
+    def __init__(self, serial, started, total_energy=None, amps=None, id=None):
+        self.id = id
+        self.serial = serial
+        self.started = started
+        self.last_seen = started
+        self.energy_kwh = 0.0
+        self.peak_power_w = 0.0
+        self.power_seconds = 0.0          # integral of power over time, in Ws
+        self.last_power_w = 0.0
+        self.last_total = total_energy
+        self.amps = [] if amps is None else [[started, amps]]
+        self.end_reason = None
+
+    def update(self, timestamp, power_w, total_energy, amps):
+        self.power_seconds += self.last_power_w * max(timestamp - self.last_seen, 0)
+        self.last_seen = timestamp
+        self.last_power_w = power_w
+        self.peak_power_w = max(self.peak_power_w, power_w)
+        if total_energy is not None:
+            if self.last_total is not None:
+                # The meter restarts from zero on some firmwares; count the new reading in full then
+                self.energy_kwh += total_energy - self.last_total if total_energy >= self.last_total else total_energy
+            self.last_total = total_energy
+        if amps is not None and (not self.amps or self.amps[-1][1] != amps):
+            self.amps.append([timestamp, amps])
+
+    @property
+    def duration(self):
+        return self.last_seen - self.started
+
+    @property
+    def avg_power_w(self):
+        return self.power_seconds / self.duration if self.duration > 0 else self.last_power_w
+
+    def summary(self):
+        return {
+            "started": round(self.started),
+            "ended": round(self.last_seen) if self.end_reason else None,
+            "duration": round(self.duration),
+            "energy_kwh": round(self.energy_kwh, 3),
+            "peak_power_w": round(self.peak_power_w),
+            "avg_power_w": round(self.avg_power_w),
+            "amps": [amps for _, amps in self.amps],
+            "end_reason": self.end_reason,
+        }
+
+
+class ChargeSessionLedger:
+    """SQLite table of charging sessions.
+
+    A session is inserted when it starts and checkpointed while it runs, so a
+    restart of evseMQTT can pick it up again. Rows with end_reason NULL are
+    still open. Reports are single queries on the (serial, started) index.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY,
+            serial TEXT NOT NULL,
+            started REAL NOT NULL,
+            ended REAL NOT NULL,
+            energy_kwh REAL NOT NULL,
+            peak_power_w REAL NOT NULL,
+            power_seconds REAL NOT NULL,
+            last_total REAL,
+            amps TEXT NOT NULL,
+            end_reason TEXT
+        );
+        CREATE INDEX IF NOT EXISTS sessions_serial_started ON sessions (serial, started);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        # WAL with synchronous=NORMAL needs no fsync per commit, which matters on SD cards
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(self.SCHEMA)
+
+    def save(self, session):
+        values = (session.serial, session.started, session.last_seen, session.energy_kwh, session.peak_power_w,
+                  session.power_seconds, session.last_total, json.dumps(session.amps), session.end_reason)
+        with self.db:
+            if session.id is None:
+                session.id = self.db.execute(
+                    "INSERT INTO sessions (serial, started, ended, energy_kwh, peak_power_w, power_seconds, last_total,"
+                    " amps, end_reason) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", values).lastrowid
+            else:
+                self.db.execute(
+                    "UPDATE sessions SET serial = ?, started = ?, ended = ?, energy_kwh = ?, peak_power_w = ?,"
+                    " power_seconds = ?, last_total = ?, amps = ?, end_reason = ? WHERE id = ?", values + (session.id,))
+
+    def _session(self, row):
+        session = ChargeSession(row["serial"], row["started"], row["last_total"], id=row["id"])
+        session.last_seen = row["ended"]
+        session.energy_kwh = row["energy_kwh"]
+        session.peak_power_w = row["peak_power_w"]
+        session.power_seconds = row["power_seconds"]
+        session.amps = json.loads(row["amps"])
+        session.end_reason = row["end_reason"]
+        return session
+
+    def open_session(self, serial):
+        row = self.db.execute("SELECT * FROM sessions WHERE serial = ? AND end_reason IS NULL"
+                              " ORDER BY started DESC LIMIT 1", (serial,)).fetchone()
+        return self._session(row) if row else None
+
+    def serials(self):
+        return [row[0] for row in self.db.execute("SELECT DISTINCT serial FROM sessions ORDER BY serial")]
+
+    def last(self, serial):
+        row = self.db.execute("SELECT * FROM sessions WHERE serial = ? AND end_reason IS NOT NULL"
+                              " ORDER BY started DESC LIMIT 1", (serial,)).fetchone()
+        return self._session(row) if row else None
+
+    def sessions(self, serial, since=0, until=None):
+        until = time.time() if until is None else until
+        rows = self.db.execute("SELECT * FROM sessions WHERE serial = ? AND started >= ? AND started < ?"
+                               " ORDER BY started", (serial, since, until))
+        return [self._session(row) for row in rows]
+
+    def totals(self, serial, since, until):
+        """Session count, energy and charging time of sessions started in [since, until)."""
+        row = self.db.execute("SELECT COUNT(*) AS count, COALESCE(SUM(energy_kwh), 0) AS energy_kwh,"
+                              " COALESCE(SUM(ended - started), 0) AS duration FROM sessions"
+                              " WHERE serial = ? AND started >= ? AND started < ?", (serial, since, until)).fetchone()
+        return dict(row)
+
+    def close(self):
+        self.db.close()
+
+
+class ChargeSessionDetector:
+    """Turns single AC status updates into charging sessions.
+
+    A session starts when output_state becomes "Charging" and ends when the
+    plug is disconnected or charging has not resumed within end_grace seconds,
+    so the stop/start MQTTCallback does for a new amps setpoint stays one
+    session. Finished sessions are stored in the ledger (if any) and handed
+    to on_session_end.
+    """
+
+    def __init__(self, device, logger, ledger=None, on_session_end=None, end_grace=120, checkpoint_interval=60,
+                 resume_window=900):
+        self.device = device
+        self.logger = logger
+        self.ledger = ledger
+        self.on_session_end = on_session_end
+        self.end_grace = end_grace
+        self.checkpoint_interval = checkpoint_interval
+        self.resume_window = resume_window
+        self.session = None
+        self._paused_since = None         # when charging stopped within the current session
+        self._checkpointed = 0
+        self._recovered = False
+
+    def update(self, charge, timestamp=None):
+        """charge_listeners entry point."""
+        timestamp = time.time() if timestamp is None else timestamp
+        serial = self.device.info['serial']
+        if serial is None:
+            return
+        if not self._recovered:
+            self._recover(serial, charge, timestamp)
+
+        charging = charge.get('output_state') == "Charging"
+        power_w = charge.get('current_energy') or 0
+        if self.device.unit == "kW":
+            power_w *= 1000
+        total_energy = charge.get('total_energy')
+        amps = self.device.config.get('charge_amps')
+
+        if self.session is None:
+            if charging:
+                self.session = ChargeSession(serial, timestamp, total_energy, amps)
+                self.logger.info(f"Charging session started")
+                self._save(timestamp)
+            return
+
+        self.session.update(timestamp, power_w if charging else 0, total_energy, amps)
+        if charging:
+            self._paused_since = None
+        elif charge.get('plug_state') == "Disconnected":
+            self._end("unplugged")
+            return
+        elif self._paused_since is None:
+            self._paused_since = timestamp
+        elif timestamp - self._paused_since >= self.end_grace:
+            self._end("stopped")
+            return
+
+        if timestamp - self._checkpointed >= self.checkpoint_interval:
+            self._save(timestamp)
+
+    def _recover(self, serial, charge, timestamp):
+        # Continue a session that was open when evseMQTT stopped, if the car is still charging
+        self._recovered = True
+        if self.ledger is None:
+            return
+        session = self.ledger.open_session(serial)
+        if session is None:
+            return
+        if charge.get('output_state') == "Charging" and timestamp - session.last_seen < self.resume_window:
+            self.logger.info(f"Resuming charging session started at {time.ctime(session.started)}")
+            self.session = session
+        else:
+            self.session = session
+            self._end("interrupted")
+
+    def flush(self):
+        """Checkpoint the running session, e.g. before shutting down."""
+        if self.session is not None:
+            self._save(self.session.last_seen)
+
+    def _save(self, timestamp):
+        self._checkpointed = timestamp
+        if self.ledger is None:
+            return
+        try:
+            self.ledger.save(self.session)
+        except Exception as e:
+            self.logger.error(f"Could not write charging session to {self.ledger.path}: {e}")
+
+    def _end(self, reason):
+        session = self.session
+        session.end_reason = reason
+        # Time after the car stopped drawing power is not part of the session
+        if self._paused_since is not None:
+            session.last_seen = self._paused_since
+        self._save(session.last_seen)
+        self.session = None
+        self._paused_since = None
+        summary = session.summary()
+        self.logger.info(f"Charging session ended ({reason}): {summary['energy_kwh']} kWh in {summary['duration']} s")
+        if self.on_session_end:
+            self.on_session_end(session.serial, summary)
+
+
+def month_range(month):
+    """Local-time bounds of a "YYYY-MM" month as epoch seconds."""
+    year, number = (int(part) for part in month.split("-"))
+    days = calendar.monthrange(year, number)[1]
+    # mktime normalises day days + 1 to the first of the next month
+    return (time.mktime((year, number, 1, 0, 0, 0, 0, 0, -1)),
+            time.mktime((year, number, days + 1, 0, 0, 0, 0, 0, -1)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report charging sessions from an evseMQTT session ledger")
+    parser.add_argument("db", type=str, help="Ledger written with --session_db")
+    parser.add_argument("--month", type=str, default=time.strftime("%Y-%m"), help="Month to report, YYYY-MM (default: current)")
+    parser.add_argument("--sessions", action="store_true", help="List the individual sessions as well")
+    args = parser.parse_args()
+
+    ledger = ChargeSessionLedger(args.db)
+    since, until = month_range(args.month)
+    report = {}
+    for serial in ledger.serials():
+        report[serial] = ledger.totals(serial, since, until)
+        if args.sessions:
+            report[serial]["sessions"] = [session.summary() for session in ledger.sessions(serial, since, until)]
+    ledger.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,59 +1,61 @@
+import asyncio
 import json
 from .utils import Utils
+from .constants import Constants
+from .scheduler import CommandScheduler
+from .correlation import ResponseTracker
 
 class Commands:
     def __init__(self, ble_manager, device, logger):
         self.ble_manager = ble_manager
         self.device = device
         self.logger = logger  # Use the centralized logger
+        self.tracker = ResponseTracker(logger=logger, send=self._enqueue)
+
+    async def _enqueue(self, command, priority):
+        return await self.ble_manager.message_producer(command, priority)
+
+    async def _send(self, name, cmd, data=None, priority=CommandScheduler.CONFIG):
+        """Build and queue a command, returning a PendingCommand that resolves with the wallbox's response.
+
+        Queries are resent up to twice when awaited and left unanswered; settings and
+        charge control are not, since repeating them is not always harmless. A command
+        identical to one that is still queued is not sent again; its handle is returned.
+        """
+        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, cmd, data)
+        self.logger.debug(f"Generated command for: {cmd} - {name}\n{command}")
+        retries = 2 if name.startswith("get_") else 0
+        response_cmd = Constants.RESPONSES.get(cmd)
+        if await self._enqueue(command, priority) is False:
+            # An identical command is still queued; the one response answers both callers
+            pending = self.tracker.waiting(response_cmd, command)
+            if pending is not None:
+                return pending
+        return self.tracker.expect(name, cmd, response_cmd, command, priority, retries)
 
     async def login_request(self):
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 32770)
-        self.logger.debug(f"Generated command for: 32770 - login_request\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
+        return await self._send("login_request", 32770, priority=CommandScheduler.SESSION)
 
     async def login_confirm(self):
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 32769, [1])
-        self.logger.debug(f"Generated command for: 32769 - login_confirm\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
+        return await self._send("login_confirm", 32769, [1], priority=CommandScheduler.SESSION)
         
     async def heartbeat(self):
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 32771, [1])
-        self.logger.debug(f"Generated command for: 32771 - heartbeat\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
+        return await self._send("heartbeat", 32771, [1], priority=CommandScheduler.SESSION)
 
     async def set_charge_fee(self):
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 33028, [1, 1, 0, 0])
-        self.logger.debug(f"Generated command for: 33028 - set_charge_fee\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
+        return await self._send("set_charge_fee", 33028, [1, 1, 0, 0], priority=CommandScheduler.SESSION)
 
     async def get_charge_fee(self):
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 33028, [2, 0])
-        self.logger.debug(f"Generated command for: 33028 - get_charge_fee\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
+        return await self._send("get_charge_fee", 33028, [2, 0])
         
     async def set_charge_service_fee(self):
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 33029, [1, 1, 0, 0])
-        self.logger.debug(f"Generated command for: 33029 - set_charge_service_fee\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
+        return await self._send("set_charge_service_fee", 33029, [1, 1, 0, 0], priority=CommandScheduler.SESSION)
         
     async def get_charge_service_fee(self):
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 33029, [2, 0])
-        self.logger.debug(f"Generated command for: 33029 - get_charge_service_fee\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
+        return await self._send("get_charge_service_fee", 33029, [2, 0])
         
     async def get_charge_status_record(self):
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 32781)
-        self.logger.debug(f"Generated command for: 32781 - get_charge_status_record\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
+        return await self._send("get_charge_status_record", 32781)
         
     async def set_charge_start(self, max_amps = 6):
         # if there's multiple phases, the line_id is 2 - otherwise 1
@@ -67,96 +69,80 @@ class Commands:
         param1 = [255, 255]
         param2 = [255, 255]
         param3 = [255, 255]
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 32775, [line_id, user_id, charge_id, is_reservation, start_date, start_type, charge_type, param1, param2, param3, max_amps])
-        self.logger.debug(f"Generated command for: 32775 - set_charge_start\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
+        return await self._send("set_charge_start", 32775, [line_id, user_id, charge_id, is_reservation, start_date, start_type, charge_type, param1, param2, param3, max_amps], priority=CommandScheduler.CONTROL)
     
     async def set_charge_stop(self):
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 32776, [1, self.device.ble_user_id, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0])
-        self.logger.debug(f"Generated command for: 32776 - set_charge_stop\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
+        return await self._send("set_charge_stop", 32776, [1, self.device.ble_user_id, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0], priority=CommandScheduler.CONTROL)
+
+    async def restart_charge(self, max_amps, ready_timeout=20):
+        """Stop the running session and start it again with max_amps.
+
+        set_config_output_amps alone does not affect a running session (the amps
+        are baked into set_charge_start). Returns False if the wallbox did not
+        become ready for a new session within ready_timeout seconds.
+        """
+        await self.set_charge_stop()
+
+        # After set_charge_stop the wallbox briefly enters a transient state where
+        # output_state is already "Idle" but current_state is "Unknown 7" / "Finished".
+        # Only once current_state returns to "Charging" (CP-line state C: EV actively
+        # requesting charge) is the wallbox ready to accept set_charge_start again.
+        for _ in range(int(ready_timeout / 0.5)):
+            await asyncio.sleep(0.5)
+            output_state = self.device.charge.get('output_state')
+            current_state = self.device.charge.get('current_state')
+            self.logger.debug(f"Waiting for ready state — output_state: {output_state}, current_state: {current_state}")
+            if output_state == "Idle" and current_state == "Charging":
+                self.logger.info(f"Wallbox ready (Idle + CP active) — sending charge_start with {max_amps} A.")
+                break
+        else:
+            self.logger.warning(f"Wallbox did not reach ready state after {ready_timeout} s — output: {self.device.charge.get('output_state')}, current: {self.device.charge.get('current_state')} — skipping restart.")
+            return False
+
+        await asyncio.sleep(1)
+        await self.set_charge_start(int(max_amps))
+        return True
         
     async def get_config_version(self):
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 33030)
-        self.logger.debug(f"Generated command for: 33030 - get_config_version\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
+        return await self._send("get_config_version", 33030)
         
     async def set_config_temperature_unit(self, unit):
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 33042, [1, unit])
-        self.logger.debug(f"Generated command for: 33042 - set_config_temperature_unit\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
+        return await self._send("set_config_temperature_unit", 33042, [1, unit])
         
     async def get_config_temperature_unit(self):
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 33042, [2, 0])
-        self.logger.debug(f"Generated command for: 33042 - get_config_temperature_unit\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
+        return await self._send("get_config_temperature_unit", 33042, [2, 0])
         
     async def set_config_language(self, language):
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 33039, [1, language])
-        self.logger.debug(f"Generated command for: 33039 - set_config_language\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
+        return await self._send("set_config_language", 33039, [1, language])
         
     async def get_config_language(self):
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 33039, [2, 0])
-        self.logger.debug(f"Generated command for: 33039 - get_config_language\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
+        return await self._send("get_config_language", 33039, [2, 0])
         
     async def set_config_name(self, name):
         bytes = Utils.device_name(name)
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 33032, [1, bytes])
-        self.logger.debug(f"Generated command for: 33032 - set_config_name\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
+        return await self._send("set_config_name", 33032, [1, bytes])
         
     async def get_config_name(self):
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 33032, [2, 0])
-        self.logger.debug(f"Generated command for: 33032 - get_config_name\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
+        return await self._send("get_config_name", 33032, [2, 0])
         
     async def set_config_time(self):
         timestamp = Utils.timestamp_bytes()
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 33025, [1, timestamp])
-        self.logger.debug(f"Generated command for: 33025 - set_config_time\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
+        return await self._send("set_config_time", 33025, [1, timestamp], priority=CommandScheduler.SESSION)
         
     async def get_config_time(self):
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 33025, [2, 0])
-        self.logger.debug(f"Generated command for: 33025 - get_config_time\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
+        return await self._send("get_config_time", 33025, [2, 0])
     
     async def set_config_output_amps(self, max_amps = 6):
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 33031, [1, max_amps])
-        self.logger.debug(f"Generated command for: 33031 - set_config_output_amps\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
+        return await self._send("set_config_output_amps", 33031, [1, max_amps], priority=CommandScheduler.CONTROL)
     
     async def get_config_output_amps(self):
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 33031, [2, 0])
-        self.logger.debug(f"Generated command for: 33031 - get_config_output_amps\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
+        return await self._send("get_config_output_amps", 33031, [2, 0])
     
     async def set_config_lcd_brightness(self, brightness = 100):
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 33122, [0, 2, brightness, 0, 0, 0, 0, 0])
-        self.logger.debug(f"Generated command for: 33122 - set_config_lcd_brightness\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
+        return await self._send("set_config_lcd_brightness", 33122, [0, 2, brightness, 0, 0, 0, 0, 0])
     
     async def get_config_lcd_brightness(self):
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 33122, [0, 1, 0, 1, 0, 0, 0, 0])
-        self.logger.debug(f"Generated command for: 33122 - get_config_lcd_brightness\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
+        return await self._send("get_config_lcd_brightness", 33122, [0, 1, 0, 1, 0, 0, 0, 0])
     
     async def set_config_password(self, password):
         if len(password) != 6:
@@ -169,7 +155,4 @@ class Commands:
         # Convert each digit to its ASCII integer representation 
         password_integers = [ord(char) for char in str_password]
         
-        command = Utils.build_command(self.device.info['serial'], self.device.ble_password, 33026, password_integers)
-        self.logger.debug(f"Generated command for: 33026 - set_config_password\n{command}")
-        await self.ble_manager.message_producer(command)
-        return command.hex()
\ No newline at end of file
+        return await self._send("set_config_password", 33026, password_integers)
\ No newline at end of file
@@ -14,6 +14,25 @@ class Constants:
     NEW_BOARD_WRITE_UUID = "0000ffe9-0000-1000-8000-00805f9b34fb"
     NEW_BOARD_READ_UUID = "0000ffe4-0000-1000-8000-00805f9b34fb"
 
+    # Response cmd the wallbox answers each request cmd with. Requests that are
+    # not listed (login confirm, heartbeat reply, fees, ...) get no parsed reply.
+    # Neither does the charge status record (32781): its reply, single_ac_status
+    # (13), also arrives unsolicited every few seconds and cannot be told apart.
+    RESPONSES = {
+        32770: 2,    # login_request -> login_response
+        32775: 7,    # charge_start
+        32776: 8,    # charge_stop
+        33025: 257,  # system time
+        33030: 262,  # version
+        33031: 263,  # output amps
+        33032: 264,  # name
+        33039: 271,  # language
+        33042: 274,  # temperature unit
+    }
+
+    # BLE write sizing: the payload that always fits into the default 23-byte ATT MTU
+    BLE_MIN_WRITE_SIZE = 20
+
 
     ERRORS = {
         0: "Relay Stick Error",
@@ -0,0 +1,147 @@
+import asyncio
+import time
+from collections import deque
+from .histogram import LatencyHistogram
+
+class PendingCommand:
+    """Awaitable handle for a command sent to the wallbox.
+
+    Awaiting it waits for the matching response cmd and returns the parsed
+    data of that response. Commands the wallbox never answers (login confirm,
+    heartbeat replies, ...) resolve to None immediately.
+    """
+
+    def __init__(self, tracker, name, cmd, response_cmd, message, priority, retries):
+        self.tracker = tracker
+        self.name = name
+        self.cmd = cmd
+        self.response_cmd = response_cmd
+        self.message = message
+        self.priority = priority
+        self.retries = retries            # default number of resends when awaited
+        self.hex = message.hex()
+        self.sent_at = time.monotonic()
+        self.resends = 0
+        self.dropped = False              # never sent: dropped from a full outbound queue
+        self.future = asyncio.get_running_loop().create_future() if response_cmd is not None else None
+
+    def done(self):
+        return self.future is None or self.future.done()
+
+    def __await__(self):
+        return self.wait().__await__()
+
+    async def wait(self, timeout=None, retries=None):
+        """Wait for the response, resending up to retries times before raising asyncio.TimeoutError."""
+        if self.future is None:
+            return None
+
+        timeout = self.tracker.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+
+        for attempt in range(retries + 1):
+            try:
+                return await asyncio.wait_for(asyncio.shield(self.future), timeout)
+            except asyncio.TimeoutError:
+                if attempt == retries:
+                    break
+                self.tracker.logger.info(f"No response to {self.name} after {timeout} s, resending")
+                await self.tracker.resend(self)
+            except asyncio.CancelledError:
+                if not self.dropped:
+                    raise
+                raise asyncio.TimeoutError(f"{self.name} (cmd {self.cmd}) was dropped from the full outbound queue")
+
+        self.tracker.discard(self)
+        raise asyncio.TimeoutError(f"Wallbox did not answer {self.name} (cmd {self.cmd}) after {retries + 1} attempt(s)")
+
+
+class ResponseTracker:
+    """Correlates outbound commands with the response cmd the wallbox sends back.
+
+    Responses are matched first-in first-out per response cmd, which mirrors
+    the order in which the wallbox processes its input. Handles nobody awaits
+    are dropped after max_age so the pending lists cannot grow without bounds.
+
+    Round-trip latency is recorded per command name, only where the response
+    is unambiguous: not for resent commands, whose reply may answer any of the
+    transmissions, and not for the same response cmd within timeout of such a
+    command being answered, since a late reply to the earlier transmission
+    resolves the next command waiting for that response cmd.
+    """
+
+    def __init__(self, logger, send, timeout=5.0, max_age=60.0):
+        self.logger = logger
+        self.send = send                  # coroutine (message, priority) that queues a frame
+        self.timeout = timeout            # default seconds to wait for a response
+        self.max_age = max_age
+        self.pending = {}                 # response cmd -> deque of PendingCommand
+        self.latency = {}                 # command name -> LatencyHistogram
+        self.timeouts = {}                # command name -> number of unanswered commands
+        self._ambiguous = {}              # response cmd -> monotonic time late replies may arrive until
+
+    def expect(self, name, cmd, response_cmd, message, priority, retries=0):
+        self._sweep()
+        pending = PendingCommand(self, name, cmd, response_cmd, message, priority, retries)
+        if response_cmd is not None:
+            self.pending.setdefault(response_cmd, deque()).append(pending)
+        return pending
+
+    def waiting(self, response_cmd, message):
+        """The newest unanswered command sent as message, if any."""
+        for pending in reversed(self.pending.get(response_cmd, ())):
+            if pending.message == message and not pending.done():
+                return pending
+        return None
+
+    def drop(self, message):
+        """The frame message was dropped before it was sent: give up on the command waiting for it."""
+        for queue in self.pending.values():
+            for pending in reversed(queue):
+                if pending.message == message and not pending.done():
+                    queue.remove(pending)
+                    pending.dropped = True
+                    pending.future.cancel()
+                    self.logger.warning(f"Dropped {pending.name} (cmd {pending.cmd}) before it was sent")
+                    return pending
+        return None
+
+    async def resend(self, pending):
+        pending.sent_at = time.monotonic()
+        pending.resends += 1
+        await self.send(pending.message, pending.priority)
+
+    def resolve(self, response_cmd, data):
+        """Hand a parsed response to the oldest command waiting for it. Returns that command, if any."""
+        queue = self.pending.get(response_cmd)
+        while queue:
+            pending = queue.popleft()
+            if pending.future.done():
+                continue
+            now = time.monotonic()
+            latency = now - pending.sent_at
+            if pending.resends:
+                self._ambiguous[response_cmd] = now + self.timeout
+            elif now >= self._ambiguous.get(response_cmd, 0):
+                self.latency.setdefault(pending.name, LatencyHistogram()).observe(latency)
+            pending.future.set_result(data)
+            self.logger.debug(f"{pending.name} answered with cmd {response_cmd} after {latency * 1000:.1f} ms")
+            return pending
+        return None
+
+    def discard(self, pending):
+        queue = self.pending.get(pending.response_cmd)
+        if queue and pending in queue:
+            queue.remove(pending)
+        pending.future.cancel()
+        self.timeouts[pending.name] = self.timeouts.get(pending.name, 0) + 1
+        self.logger.warning(f"Wallbox did not answer {pending.name} (cmd {pending.cmd})")
+
+    def _sweep(self):
+        deadline = time.monotonic() - self.max_age
+        for queue in self.pending.values():
+            while queue and queue[0].sent_at < deadline:
+                queue.popleft().future.cancel()
+
+    def latency_summary(self):
+        return {name: histogram.summary() for name, histogram in self.latency.items()}
@@ -76,7 +76,10 @@ class Device:
         self._system_time_raw = None
         self._temperature_unit = None
         self._device_name = None
+        self._time_to_ready = None
         self._rssi = -255
+        # Bumped when a value of the snapshot changes, see StateSerializer
+        self._versions = {'charge': 0, 'config': 0}
         
 
     @property
@@ -107,6 +110,7 @@ class Device:
             'temperature_unit': self._temperature_unit,
             'language': self._language,
             'device_name': self._device_name,
+            'time_to_ready': self._time_to_ready,
             'version': self._version
         }
         
@@ -185,7 +189,11 @@ class Device:
         for key, value in config_dict.items():
             attribute_name = f'_{key}'
             if hasattr(self, attribute_name):
-                setattr(self, attribute_name, value)
+                current = getattr(self, attribute_name)
+                # 1 == True == 1.0, but they are published differently
+                if current != value or type(current) is not type(value):
+                    setattr(self, attribute_name, value)
+                    self._versions['config'] += 1
             else:
                 raise KeyError(f"Invalid device.config key: {key}")
 
@@ -203,10 +211,18 @@ class Device:
         for key, value in charge_dict.items():
             attribute_name = f'_{key}'
             if hasattr(self, attribute_name):
-                setattr(self, attribute_name, value)
+                current = getattr(self, attribute_name)
+                # 1 == True == 1.0, but they are published differently
+                if current != value or type(current) is not type(value):
+                    setattr(self, attribute_name, value)
+                    self._versions['charge'] += 1
             else:
                 raise KeyError(f"Invalid device.config key: {key}")
 
+    def version(self, topic):
+        """Snapshot version of charge or config, None for other topics."""
+        return self._versions.get(topic)
+
     def update_info(self, info_dict):
         for key, value in info_dict.items():
             attribute_name = f'_{key}'
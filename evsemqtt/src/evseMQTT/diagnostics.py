@@ -0,0 +1,149 @@
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from .tracing import TRACER
+
+class Diagnostics:
+    """On-demand task dump and time-boxed profiling of a running Manager.
+
+    request() may be called from a signal handler: the work is handed to the
+    event loop, so nothing runs inside the handler itself. Every request logs
+    all asyncio tasks with their stacks, the outbound queues and the Device
+    state; with profile_seconds set it also profiles the event loop thread for
+    that long and writes the result to profile_dir:
+
+      * cprofile: deterministic cProfile stats (.prof, plus a .txt summary)
+      * sampling: stacks of the loop thread sampled every sample_interval
+        seconds, written in the collapsed format flame graph tools read
+    """
+
+    MODES = ("cprofile", "sampling")
+
+    def __init__(self, manager, logger, profile_seconds=0, profile_mode="cprofile", profile_dir="/data",
+                 sample_interval=0.005):
+        self.manager = manager
+        self.logger = logger
+        self.profile_seconds = profile_seconds
+        self.profile_mode = profile_mode
+        self.profile_dir = profile_dir
+        self.sample_interval = sample_interval
+        self.loop = None
+        self._profiling = None            # task of the running profile, if any
+
+    def attach(self, loop):
+        self.loop = loop
+
+    def request(self, *args):
+        """Signal-handler entry point."""
+        if self.loop is None or self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self._run)
+
+    def _run(self):
+        self.logger.warning(self.dump())
+        if not self.profile_seconds:
+            return
+        if self._profiling and not self._profiling.done():
+            self.logger.warning("A profile is already running, ignoring request")
+            return
+        profile = self._cprofile if self.profile_mode == "cprofile" else self._sample
+        self._profiling = self.loop.create_task(profile(self.profile_seconds), name="profiler")
+
+    # ------------------------------------------------------------------
+    # Task dump
+    # ------------------------------------------------------------------
+
+    def dump(self):
+        lines = ["Diagnostics dump"]
+        tasks = sorted(asyncio.all_tasks(self.loop), key=lambda task: task.get_name())
+        lines.append(f"{len(tasks)} asyncio task(s):")
+        for task in tasks:
+            stack = io.StringIO()
+            task.print_stack(limit=8, file=stack)
+            lines.append(f"--- {task.get_name()} ({task.get_coro().__qualname__})")
+            lines.extend("    " + line for line in stack.getvalue().rstrip().splitlines()[1:])
+
+        manager = self.manager
+        transport = manager.wifi_manager or manager.ble_manager
+        if transport is not None:
+            lines.append(f"Outbound queue: {transport.queue.qsize()} queued, waits {transport.queue.wait_summary()}")
+        pending = {cmd: len(queue) for cmd, queue in manager.commands.tracker.pending.items() if queue}
+        lines.append(f"Awaiting responses: {pending}")
+        lines.append(f"Session: {manager.event_handlers.session.state}")
+        supervisor = getattr(manager, "supervisor", None)
+        if supervisor is not None:
+            lines.append(f"Supervisor: generation {supervisor.generation}, restarts {supervisor.restart_reasons}")
+        lines.append(f"Frame stage latency: {TRACER.summary()}")
+        lines.append(f"Device info: {manager.device.info}")
+        lines.append(f"Device config: {manager.device.config}")
+        lines.append(f"Device charge: {manager.device.charge}")
+        return "\n".join(lines)
+
+    # ------------------------------------------------------------------
+    # Profiling
+    # ------------------------------------------------------------------
+
+    def _path(self, suffix):
+        return os.path.join(self.profile_dir, f"evsemqtt-profile-{time.strftime('%Y%m%d-%H%M%S')}{suffix}")
+
+    async def _cprofile(self, seconds):
+        self.logger.warning(f"cProfile of the event loop started for {seconds} s")
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+
+        path = self._path(".prof")
+        summary = io.StringIO()
+        stats = pstats.Stats(profiler, stream=summary)
+        stats.sort_stats("cumulative").print_stats(30)
+        try:
+            stats.dump_stats(path)
+            with open(self._path(".txt"), "w") as f:
+                f.write(summary.getvalue())
+            self.logger.warning(f"Profile written to {path}")
+        except OSError as e:
+            self.logger.error(f"Could not write profile to {self.profile_dir}: {e}")
+        self.logger.warning(summary.getvalue())
+
+    async def _sample(self, seconds):
+        self.logger.warning(f"Sampling the event loop every {self.sample_interval * 1000:.0f} ms for {seconds} s")
+        target = threading.get_ident()
+        samples = Counter()
+        done = threading.Event()
+
+        def sampler():
+            while not done.wait(self.sample_interval):
+                frame = sys._current_frames().get(target)
+                stack = []
+                while frame is not None:
+                    stack.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                samples[";".join(reversed(stack))] += 1
+
+        thread = threading.Thread(target=sampler, name="evse-sampler", daemon=True)
+        thread.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            done.set()
+            await asyncio.to_thread(thread.join)
+
+        path = self._path(".collapsed")
+        try:
+            with open(path, "w") as f:
+                for stack, count in samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            self.logger.warning(f"{sum(samples.values())} samples written to {path}")
+        except OSError as e:
+            self.logger.error(f"Could not write samples to {self.profile_dir}: {e}")
+        for stack, count in samples.most_common(5):
+            self.logger.warning(f"{count:6d}  {stack.rsplit(';', 1)[-1]}")
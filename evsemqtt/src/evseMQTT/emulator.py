@@ -0,0 +1,650 @@
+import argparse
+import asyncio
+import logging
+import random
+import struct
+import time
+from .constants import Constants
+from .utils import Utils
+
+# Values of the status fields, see Constants.PLUG_STATE, OUTPUT_STATE and CURRENT_STATE
+PLUG_DISCONNECTED, PLUG_UNLOCKED, PLUG_LOCKED = 1, 2, 4
+OUTPUT_CHARGING, OUTPUT_IDLE = 1, 2
+STATE_NOT_CONNECTED, STATE_READY, STATE_CHARGING, STATE_STOPPING = 11, 12, 13, 15
+
+# BLE service and characteristics of the new board revision
+_BLE_SERVICE_UUID = "0000ffe0-0000-1000-8000-00805f9b34fb"
+
+
+def _padded(text, size):
+    return list(text.encode("ascii")[:size].ljust(size, b"\x00"))
+
+
+class WallboxEmulator:
+    """A wallbox speaking the protocol of Utils.build_command and Parsers.
+
+    Transport independent: frames from evseMQTT are passed to receive(), the
+    wallbox's own frames go to the send callback set by a transport
+    (UDPWallbox, FakeBleakClient). While nobody is logged in, run() sends a
+    login beacon every beacon_interval seconds; after login confirmation it
+    sends single AC status frames every status_interval seconds and heartbeats
+    every heartbeat_interval seconds. A session that leaves heartbeat_misses
+    heartbeats unanswered is dropped and the beacons start again.
+
+    Charge start/stop and the output amps behave like the real wallbox: the
+    amps of a running session are the ones sent with set_charge_start, and
+    after a stop the wallbox passes through a transient state before it
+    accepts the next start.
+
+    Faults are injected on the outgoing side: drop and corrupt rates, and
+    fragment, which splits every frame into pieces of that many bytes.
+    """
+
+    def __init__(self, serial="2023040112345678", password="123456", phases=3, max_amps=32, name="Emulator",
+                 logger=None, status_interval=2.0, heartbeat_interval=10.0, beacon_interval=3.0, heartbeat_misses=3,
+                 stop_settle=2.0, seed=None, clock=time.monotonic):
+        self.serial = serial
+        self.password = password
+        self.phases = phases
+        self.max_amps = max_amps
+        self.logger = logger or logging.getLogger("evseMQTT.emulator")
+        self.status_interval = status_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.beacon_interval = beacon_interval
+        self.heartbeat_misses = heartbeat_misses
+        self.stop_settle = stop_settle
+        self.random = random.Random(seed)
+        self.clock = clock
+        self.send = None                  # callable(bytes), set by the transport
+        self.link = None                  # transport, for change_ip
+
+        # Wallbox-side identifiers and configuration
+        self._serial_int = int.from_bytes(bytes.fromhex(serial), "little")
+        self.config = {"charge_amps": 16, "name": f"ACP#{name}", "language": 1, "temperature_unit": 1,
+                       "system_time": 0}
+
+        # Session and charging state
+        self.logged_in = False
+        self.plug = PLUG_DISCONNECTED
+        self.output = OUTPUT_IDLE
+        self.state = STATE_NOT_CONNECTED
+        self.car_amps = 0
+        self.session_amps = 0
+        self.stopped_at = None
+        self.total_wh = 0.0
+        self.errors = 0                   # 32 error bits, see Constants.ERRORS
+        self._advanced_at = None
+
+        # Timing and fault injection
+        self.silent_until = 0.0
+        self.asleep = False               # silent until evseMQTT sends a frame
+        self.drop = 0.0
+        self.corrupt = 0.0
+        self.fragment = 0
+        self._next_beacon = self._next_status = self._next_heartbeat = 0.0
+        self._unanswered = 0
+        self._buffer = bytearray()
+        self._wake = asyncio.Event()
+        self.scenario = []                # (seconds after start, action, value)
+        self.stats = {"frames_in": 0, "frames_out": 0, "bad_frames_in": 0, "status_frames": 0, "sessions": 0}
+
+    # ------------------------------------------------------------------
+    # Frames
+    # ------------------------------------------------------------------
+
+    def frame(self, cmd, data=None):
+        return bytes(Utils.build_command(self._serial_int, self.password, cmd, data))
+
+    def identity(self):
+        """Payload of the login beacon (cmd 1) and login response (cmd 2)."""
+        kind = 10 if self.phases == 3 else 1
+        power = self.max_amps * 230 * self.phases // 100
+        return [kind] + _padded("BESEN", 16) + _padded("BS20", 16) + _padded("HW1.0", 16) \
+            + list(struct.pack(">I", power)) + [self.max_amps] + _padded("", 15)
+
+    def version(self):
+        return _padded("HW1.0", 16) + _padded("SW2.1", 16) + [0, 0, 0, 0]
+
+    def amps(self):
+        """Current the car draws per phase."""
+        if self.output != OUTPUT_CHARGING:
+            return 0
+        return min(self.session_amps, self.car_amps)
+
+    def status(self):
+        """Single AC status payload (cmd 4/13); 25 bytes for one phase, 33 for three."""
+        data = [1]
+        lines = []
+        for _ in range(self.phases):
+            volts = round((230 + self.random.uniform(-1.5, 1.5)) * 10)
+            amps = round(self.amps() * (1 + self.random.uniform(-0.01, 0.01)) * 100)
+            lines.append(list(struct.pack(">HH", volts, amps)))
+        data += lines[0]
+        data += list(struct.pack(">I", int(self.total_wh)))
+        data += [0, 0, 0, 0]
+        temperature = 20000 + 3150 + (self.amps() * 20)
+        data += list(struct.pack(">H", temperature)) + list(struct.pack(">H", 255))
+        data += [0, self.plug, self.output, self.state]
+        data += list(struct.pack(">I", self.errors))
+        for line in lines[1:]:
+            data += line
+        return data
+
+    def _emit(self, cmd, data=None):
+        """Send a frame through the fault injection; False if it was not sent."""
+        if self.send is None or self.clock() < self.silent_until or self.asleep:
+            return False
+        if self.random.random() < self.drop:
+            return False
+        payload = bytearray(self.frame(cmd, data))
+        if self.random.random() < self.corrupt:
+            payload[self.random.randrange(5, len(payload) - 4)] ^= 0x5A
+        size = self.fragment or len(payload)
+        for start in range(0, len(payload), size):
+            self.send(bytes(payload[start:start + size]))
+        self.stats["frames_out"] += 1
+        return True
+
+    # ------------------------------------------------------------------
+    # Inbound
+    # ------------------------------------------------------------------
+
+    def receive(self, data):
+        """Bytes from evseMQTT: a whole frame, several, or a piece of one."""
+        if self.clock() < self.silent_until:
+            return
+        self._buffer += data
+        while len(self._buffer) >= 4:
+            start = self._buffer.find(b"\x06\x01")
+            if start < 0:
+                self._buffer.clear()
+                return
+            del self._buffer[:start]
+            length = (self._buffer[2] << 8) | self._buffer[3]
+            if length < 25:
+                del self._buffer[:2]
+                continue
+            if len(self._buffer) < length:
+                return
+            frame = bytes(self._buffer[:length])
+            del self._buffer[:length]
+            checksum = (frame[length - 4] << 8) | frame[length - 3]
+            if sum(frame[:length - 4]) % 0xFFFF != checksum:
+                self.stats["bad_frames_in"] += 1
+                self.logger.debug(f"Emulator {self.serial}: dropping frame with bad checksum")
+                continue
+            self.stats["frames_in"] += 1
+            cmd = (frame[19] << 8) | frame[20]
+            self._handle(cmd, frame[21:length - 4], frame[13:19])
+
+    def _handle(self, cmd, data, password):
+        if self.asleep:
+            self.logger.info(f"Emulator {self.serial}: woken up by cmd {cmd}")
+            self.asleep = False
+        self._wake.set()
+        if cmd == 1:
+            # Wakeup packet: answer with a beacon right away
+            self._next_beacon = 0.0
+        elif cmd == 32770:
+            if password.decode("ascii", "replace") != self.password:
+                self.logger.warning(f"Emulator {self.serial}: login with wrong password")
+                self._emit(341)
+                return
+            self._emit(2, self.identity())
+        elif cmd == 32769:
+            self.logged_in = True
+            self._unanswered = 0
+            self._next_status = self._next_heartbeat = self.clock()
+        elif cmd == 32771:
+            self._unanswered = 0
+        elif cmd == 32781:
+            if self._emit(13, self.status()):
+                self.stats["status_frames"] += 1
+        elif cmd == 33025:
+            if data and data[0] == 1 and len(data) >= 5:
+                self.config["system_time"] = struct.unpack(">I", bytes(data[1:5]))[0]
+            self._emit(257, [1] + list(struct.pack(">I", self.config["system_time"] or int(time.time()))))
+        elif cmd == 33030:
+            self._emit(262, self.version())
+        elif cmd == 33031:
+            if data and data[0] == 1:
+                self.config["charge_amps"] = min(data[1], self.max_amps)
+            self._emit(263, [1, self.config["charge_amps"]])
+        elif cmd == 33032:
+            if data and data[0] == 1:
+                self.config["name"] = bytes(data[1:33]).rstrip(b"\x00 ").decode("ascii", "replace")
+            self._emit(264, [1] + _padded(self.config["name"], 32))
+        elif cmd == 33039:
+            if data and data[0] == 1:
+                self.config["language"] = data[1]
+            self._emit(271, [1, self.config["language"]])
+        elif cmd == 33042:
+            if data and data[0] == 1:
+                self.config["temperature_unit"] = data[1]
+            self._emit(274, [1, self.config["temperature_unit"]])
+        elif cmd == 32775:
+            self._start(data[-1] if data else self.config["charge_amps"])
+        elif cmd == 32776:
+            self._stop()
+        # Fees, LCD brightness and unknown commands get no answer
+
+    # ------------------------------------------------------------------
+    # Charging
+    # ------------------------------------------------------------------
+
+    def _start(self, amps):
+        if self.plug == PLUG_DISCONNECTED or self.state == STATE_STOPPING:
+            error = 1 if self.plug == PLUG_DISCONNECTED else 2
+            self._emit(7, [1, 0, 0, error, amps])
+            return
+        self.advance()
+        self.session_amps = min(amps, self.max_amps)
+        self.output = OUTPUT_CHARGING
+        self.plug = PLUG_LOCKED
+        self.state = STATE_CHARGING
+        self.stats["sessions"] += 1
+        self.logger.info(f"Emulator {self.serial}: charging with {self.session_amps} A")
+        self._emit(7, [1, 0, 1, 0, self.session_amps])
+        self._next_status = self.clock()
+
+    def _stop(self):
+        self.advance()
+        if self.output == OUTPUT_CHARGING:
+            self.output = OUTPUT_IDLE
+            self.state = STATE_STOPPING
+            self.stopped_at = self.clock()
+            self.logger.info(f"Emulator {self.serial}: charging stopped")
+        self._emit(8, [1, 11, 0])
+        self._next_status = self.clock()
+
+    def plug_in(self, car_amps=32):
+        self.car_amps = car_amps
+        self.plug = PLUG_UNLOCKED
+        self.state = STATE_READY
+        self._next_status = self.clock()
+
+    def unplug(self):
+        self.advance()
+        self.car_amps = 0
+        self.plug = PLUG_DISCONNECTED
+        self.output = OUTPUT_IDLE
+        self.state = STATE_NOT_CONNECTED
+        self._next_status = self.clock()
+
+    def advance(self, now=None):
+        """Count the energy charged since the last call and finish a pending stop."""
+        now = self.clock() if now is None else now
+        if self._advanced_at is not None:
+            self.total_wh += self.amps() * 230 * self.phases * (now - self._advanced_at) / 3600
+        self._advanced_at = now
+        if self.state == STATE_STOPPING and now - self.stopped_at >= self.stop_settle:
+            # The car keeps requesting current (CP state C) until it is unplugged
+            self.state = STATE_CHARGING if self.plug != PLUG_DISCONNECTED else STATE_NOT_CONNECTED
+
+    # ------------------------------------------------------------------
+    # Scenario actions
+    # ------------------------------------------------------------------
+
+    def go_silent(self, seconds):
+        """Send and answer nothing for a while, as if the WiFi dropped out."""
+        self.silent_until = self.clock() + seconds
+        self.logger.info(f"Emulator {self.serial}: silent for {seconds} s")
+
+    def sleep(self):
+        """Stop broadcasting until evseMQTT sends something (a wakeup packet)."""
+        self.asleep = True
+        self.logged_in = False
+        self.logger.info(f"Emulator {self.serial}: asleep")
+
+    def reboot(self, boot_seconds=5):
+        """Lose the session and the running charge, and come back with beacons."""
+        self.advance()
+        self.logged_in = False
+        self.output = OUTPUT_IDLE
+        if self.plug != PLUG_DISCONNECTED:
+            self.plug, self.state = PLUG_UNLOCKED, STATE_READY
+        self._buffer.clear()
+        if hasattr(self.link, "drop"):
+            self.link.drop()
+        self.go_silent(boot_seconds)
+        self._next_beacon = self.silent_until
+        self.logger.info(f"Emulator {self.serial}: rebooting")
+
+    def set_fault(self, code):
+        """Raise the error with this Constants.ERRORS code, or clear all errors with None."""
+        self.errors = 0 if code is None else 1 << (31 - code)
+
+    def apply(self, action, value=None):
+        """Run one scenario step."""
+        if action == "plug":
+            self.plug_in(int(value or 32))
+        elif action == "unplug":
+            self.unplug()
+        elif action == "silent":
+            self.go_silent(float(value))
+        elif action == "sleep":
+            self.sleep()
+        elif action == "reboot":
+            self.reboot(float(value or 5))
+        elif action == "change_ip":
+            if hasattr(self.link, "change_address"):
+                self.link.change_address(value)
+            else:
+                self.logger.warning(f"Emulator {self.serial}: transport cannot change its address")
+        elif action in ("drop", "corrupt"):
+            setattr(self, action, float(value))
+        elif action == "fragment":
+            self.fragment = int(value)
+        elif action == "fault":
+            self.set_fault(None if value in (None, "none") else int(value))
+        else:
+            raise ValueError(f"Unknown scenario action: {action}")
+        self._wake.set()
+
+    # ------------------------------------------------------------------
+    # Main loop
+    # ------------------------------------------------------------------
+
+    async def run(self):
+        started = self.clock()
+        steps = sorted(self.scenario, key=lambda step: step[0])
+        while True:
+            now = self.clock()
+            while steps and now - started >= steps[0][0]:
+                _, action, value = steps.pop(0)
+                self.logger.info(f"Emulator {self.serial}: scenario step {action} {value or ''}")
+                self.apply(action, value)
+            self.advance(now)
+
+            if not self.logged_in:
+                if now >= self._next_beacon:
+                    self._emit(1, self.identity())
+                    self._next_beacon = now + self.beacon_interval
+                due = self._next_beacon
+            else:
+                if now >= self._next_status:
+                    if self._emit(4, self.status()):
+                        self.stats["status_frames"] += 1
+                    self._next_status = now + self.status_interval
+                if now >= self._next_heartbeat:
+                    if self._unanswered >= self.heartbeat_misses:
+                        self.logger.info(f"Emulator {self.serial}: heartbeats unanswered, session dropped")
+                        self.logged_in = False
+                        self._next_beacon = now
+                        continue
+                    if self._emit(3):
+                        self._unanswered += 1
+                    self._next_heartbeat = now + self.heartbeat_interval
+                due = min(self._next_status, self._next_heartbeat)
+            if steps:
+                due = min(due, started + steps[0][0])
+            if self.state == STATE_STOPPING:
+                due = min(due, self.stopped_at + self.stop_settle)
+
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=max(due - self.clock(), 0.001))
+            except asyncio.TimeoutError:
+                pass
+
+
+def parse_scenario(text):
+    """Scenario steps from "<seconds> <action> [value]" entries, separated by ';' or newlines.
+
+        10 plug 32; 40 silent 40; 100 reboot; 150 change_ip 127.0.0.3; 200 corrupt 0.2
+    """
+    steps = []
+    for entry in text.replace("\n", ";").split(";"):
+        parts = entry.split("#")[0].split()
+        if not parts:
+            continue
+        if len(parts) > 3:
+            raise ValueError(f"Invalid scenario step: {entry.strip()}")
+        steps.append((float(parts[0]), parts[1], parts[2] if len(parts) > 2 else None))
+    return steps
+
+
+# ----------------------------------------------------------------------
+# UDP transport
+# ----------------------------------------------------------------------
+
+class _EmulatorProtocol(asyncio.DatagramProtocol):
+    def __init__(self, emulator):
+        self.emulator = emulator
+
+    def datagram_received(self, data, addr):
+        self.emulator.receive(data)
+
+
+class UDPWallbox:
+    """Runs a WallboxEmulator over UDP, the way the wallbox talks to WiFiManager.
+
+    The wallbox sends from an ephemeral port on bind_host to target (evseMQTT's
+    --wifi_port); WiFiManager replies to wherever the datagrams came from.
+    change_address() rebinds to another local address, which on localhost
+    (127.0.0.0/8) looks like the wallbox got a new IP from DHCP.
+    """
+
+    def __init__(self, emulator, target=("127.0.0.1", 28376), bind_host="127.0.0.1"):
+        self.emulator = emulator
+        self.target = target
+        self.bind_host = bind_host
+        self.transport = None
+        emulator.link = self
+        emulator.send = self._send
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(lambda: _EmulatorProtocol(self.emulator),
+                                                                local_addr=(self.bind_host, 0))
+        self.emulator.logger.info(f"Emulator {self.emulator.serial}: UDP from "
+                                  f"{self.transport.get_extra_info('sockname')} to {self.target}")
+
+    def _send(self, data):
+        if self.transport:
+            self.transport.sendto(data, self.target)
+
+    def change_address(self, host):
+        self.close()
+        self.bind_host = host
+        asyncio.ensure_future(self.start())
+
+    def close(self):
+        if self.transport:
+            self.transport.close()
+            self.transport = None
+
+    async def run(self):
+        await self.start()
+        try:
+            await self.emulator.run()
+        finally:
+            self.close()
+
+
+# ----------------------------------------------------------------------
+# BLE transport: stand-ins for the bleak classes BLEManager uses
+# ----------------------------------------------------------------------
+
+class _FakeCharacteristic:
+    def __init__(self, uuid, properties, max_write_without_response_size):
+        self.uuid = uuid
+        self.properties = properties
+        self.max_write_without_response_size = max_write_without_response_size
+
+
+class _FakeService:
+    def __init__(self, uuid, characteristics):
+        self.uuid = uuid
+        self.characteristics = characteristics
+
+
+class _FakeServices:
+    def __init__(self, services):
+        self._services = services
+
+    def __iter__(self):
+        return iter(self._services)
+
+    def get_characteristic(self, uuid):
+        for service in self._services:
+            for characteristic in service.characteristics:
+                if characteristic.uuid == uuid:
+                    return characteristic
+        return None
+
+
+class _FakeBLEDevice:
+    def __init__(self, address, name):
+        self.address = address
+        self.name = name
+
+
+class _FakeAdvertisement:
+    def __init__(self, name, rssi):
+        self.local_name = name
+        self.rssi = rssi
+
+
+class FakeBleakClient:
+    """Connects BLEManager to a WallboxEmulator instead of a Bluetooth adapter.
+
+    Exposes the new board revision's GATT profile. Notifications are split into
+    ATT payloads of mtu_size - 3 bytes like on a real link, and latency seconds
+    pass for every acknowledged write.
+    """
+
+    def __init__(self, emulator, address, timeout=None, mtu_size=23, latency=0.0):
+        self.emulator = emulator
+        self.address = address
+        self.mtu_size = mtu_size
+        self.latency = latency
+        self.is_connected = False
+        self.services = _FakeServices([_FakeService(_BLE_SERVICE_UUID, [
+            _FakeCharacteristic(Constants.NEW_BOARD_WRITE_UUID, ["write", "write-without-response"], mtu_size - 3),
+            _FakeCharacteristic(Constants.NEW_BOARD_READ_UUID, ["notify"], mtu_size - 3),
+        ])])
+        self._callbacks = {}
+        self._outbox = asyncio.Queue()
+        self._pump = None
+
+    async def connect(self):
+        self.is_connected = True
+        self.emulator.link = self
+        self.emulator.send = self._notify
+        return True
+
+    async def disconnect(self):
+        self.drop()
+        if self._pump:
+            self._pump.cancel()
+            self._pump = None
+        return True
+
+    def drop(self):
+        """The link went away (wallbox rebooted or out of range); writes fail from now on."""
+        self.is_connected = False
+        if self.emulator.send == self._notify:
+            self.emulator.send = None
+
+    async def start_notify(self, uuid, callback):
+        self._callbacks[uuid] = callback
+        if self._pump is None:
+            self._pump = asyncio.ensure_future(self._deliver())
+
+    async def stop_notify(self, uuid):
+        self._callbacks.pop(uuid, None)
+
+    async def write_gatt_char(self, uuid, data, response=False):
+        if not self.is_connected:
+            raise ConnectionError("Not connected")
+        if response and self.latency:
+            await asyncio.sleep(self.latency)
+        self.emulator.receive(bytes(data))
+
+    async def read_gatt_char(self, uuid):
+        return bytearray()
+
+    def _notify(self, data):
+        size = self.mtu_size - 3
+        for start in range(0, len(data), size):
+            self._outbox.put_nowait(data[start:start + size])
+
+    async def _deliver(self):
+        # One notification at a time and in order, like the BLE stack
+        while True:
+            data = await self._outbox.get()
+            for uuid, callback in list(self._callbacks.items()):
+                result = callback(uuid, bytearray(data))
+                if asyncio.iscoroutine(result):
+                    await result
+
+
+class FakeBleakScanner:
+    """Finds the emulated wallboxes, keyed by BLE address."""
+
+    def __init__(self, emulators, rssi=-60):
+        self.emulators = emulators
+        self.rssi = rssi
+
+    def _devices(self):
+        for address, emulator in self.emulators.items():
+            name = emulator.config["name"]
+            yield _FakeBLEDevice(address, name), _FakeAdvertisement(name, self.rssi)
+
+    async def find_device_by_filter(self, match, timeout=10.0):
+        for device, advertisement in self._devices():
+            if match(device, advertisement):
+                return device
+        return None
+
+    async def discover(self, timeout=10.0, return_adv=False):
+        return {device.address: (device, advertisement) for device, advertisement in self._devices()}
+
+
+def attach_ble(ble_manager, emulators, mtu_size=23, latency=0.0):
+    """Make a BLEManager scan for and connect to emulators ({address: WallboxEmulator})."""
+    ble_manager.scanner = FakeBleakScanner(emulators)
+    ble_manager.client_factory = lambda address, timeout=None: FakeBleakClient(emulators[address], address, timeout,
+                                                                               mtu_size=mtu_size, latency=latency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulate an evse wallbox over UDP for evseMQTT --wifi")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address evseMQTT listens on (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=28376, help="evseMQTT --wifi_port (default 28376)")
+    parser.add_argument("--bind", type=str, default="127.0.0.1", help="Local address the wallbox sends from (default 127.0.0.1)")
+    parser.add_argument("--serial", type=str, default="2023040112345678", help="Wallbox serial, 16 hex digits")
+    parser.add_argument("--password", type=str, default="123456", help="Wallbox password (default 123456)")
+    parser.add_argument("--phases", type=int, default=3, choices=(1, 3), help="Number of phases (default 3)")
+    parser.add_argument("--car", type=int, default=0, help="Plug in a car taking up to this many A at start (default: no car)")
+    parser.add_argument("--status_interval", type=float, default=2.0, help="Seconds between status frames (default 2)")
+    parser.add_argument("--heartbeat_interval", type=float, default=10.0, help="Seconds between heartbeats (default 10)")
+    parser.add_argument("--scenario", type=str, default="", help="Steps like \"10 plug 32; 40 silent 40; 100 reboot\", or a file with one step per line")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for measurements and faults")
+    parser.add_argument("--logging_level", type=str, default="INFO", help="Logging level (default INFO)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=getattr(logging, args.logging_level.upper(), logging.INFO),
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    emulator = WallboxEmulator(serial=args.serial, password=args.password, phases=args.phases,
+                               status_interval=args.status_interval, heartbeat_interval=args.heartbeat_interval,
+                               seed=args.seed)
+    scenario = args.scenario
+    if scenario and ";" not in scenario and not scenario.split()[0].replace(".", "").isdigit():
+        with open(scenario) as f:
+            scenario = f.read()
+    try:
+        emulator.scenario = parse_scenario(scenario)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.car:
+        emulator.plug_in(args.car)
+    try:
+        asyncio.run(UDPWallbox(emulator, target=(args.host, args.port), bind_host=args.bind).run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
+import time
 from .parsers import Parsers
 from .utils import Utils
 from .constants import Constants
-import asyncio
+from .session import SessionState
+from . import metrics
+from .tracing import TRACER
 
 class EventHandlers:
     def __init__(self, device, commands, logger, callback=None):
@@ -11,6 +14,9 @@ class EventHandlers:
         self.callback = callback
         self.cache_data = None
         self.message_length = 0
+        self._trace = None  # trace of the frame being reassembled
+        self.charge_listeners = []  # called with every single AC status update
+        self.session = SessionState(device=device, commands=commands, logger=logger, publish=self._publish)
 
         # Registry of command values to handler methods
         self.handlers = {
@@ -46,15 +52,19 @@ class EventHandlers:
         
     async def receive_notification(self, sender, byte_array):
         self.logger.debug(f"Notification from {sender}: {byte_array}")
+        TRACER.stamp("dispatch")
 
         packet_header = Constants.PACKET_HEADER
         if Utils.byte_to_string(byte_array[:2] if len(byte_array) >= 2 else byte_array[:1]) == packet_header:
             self.logger.debug(f"Packet Header OK")
             self.cache_data = byte_array
+            # A fragmented frame is timed from its first fragment
+            self._trace = TRACER.current()
             if len(byte_array) >= 4:
                 self.message_length = ((byte_array[2] << 8) + byte_array[3]) & 255
                 if self.message_length > len(byte_array):
                     return
+                TRACER.stamp("reassembled")
                 await self.process_notification(sender, byte_array)
                 return
             
@@ -74,6 +84,9 @@ class EventHandlers:
                 self.cache_data = combined_data
                 return
 
+            if self._trace is not None:
+                TRACER.activate(self._trace)
+            TRACER.stamp("reassembled")
             await self.process_notification(sender, combined_data)
             self.cache_data = None
             self.message_length = 0
@@ -107,12 +120,15 @@ class EventHandlers:
 
             if checksum_calc % 65536 != checksum:
                 self.logger.debug("Checksum failed")
+                metrics.CHECKSUM_FAILURES.inc()
                 return
 
             self.logger.debug("Checksum OK")
+            TRACER.stamp("checksum")
 
             self.logger.debug(f"Unencrypted data length: {len(byte_array2)}, CMD[0x{cmd_byte}]")
             await self.handle_notification(sender, byte_array)
+            TRACER.finish()
 
             if len(byte_array) > length:
                 await self.process_notification(sender, Utils.get_bytes(byte_array, length, len(byte_array) - 1))
@@ -125,8 +141,11 @@ class EventHandlers:
         #for segment in segments:
         #    if segment:
         #parsed_data = Utils.parse_bytearray(segment)
+        started = time.perf_counter()
         parsed_data = Utils.parse_bytearray(message)
         cmd = parsed_data['cmd']
+        metrics.FRAMES_RECEIVED.inc(cmd)
+        TRACER.set_cmd(cmd)
         self.logger.debug(f"Received command {cmd}")
         
         self.logger.debug(f"Parsed data:\n{parsed_data}")
@@ -139,7 +158,10 @@ class EventHandlers:
                 data = handler(parsed_data['data'], parsed_data['identifier'])
             except Exception as e:
                 self.logger.warning(f"Parser error for cmd {cmd} (data length {len(parsed_data.get('data', b''))}): {e}")
+                metrics.PARSE_FAILURES.inc(cmd)
                 return
+            metrics.PARSE_SECONDS.observe(time.perf_counter() - started, cmd)
+            TRACER.stamp("parse")
             self.logger.debug(f"Parsed data\n{data}")
             # Update device info if command 1 is received
             if cmd == 1:
@@ -157,6 +179,13 @@ class EventHandlers:
                     data['current_energy'] = data['current_energy'] / 1000
                 
                 self.device.charge = data
+                for listener in self.charge_listeners:
+                    # One failing listener (e.g. a full disk under the telemetry
+                    # store) must not keep the frame from the others
+                    try:
+                        listener(data)
+                    except Exception:
+                        self.logger.exception(f"Charge listener {getattr(listener, '__qualname__', listener)} failed")
                 
             # Device charge status -- not sure what we need these for
             if cmd in [5, 6]:
@@ -177,6 +206,7 @@ class EventHandlers:
             if cmd == 262:
                 self.logger.debug(f"Device responded with {cmd}, containing {data}")
                 self.device.info = data
+                self.session.check_identified()
             # Update device config if command is related
             if cmd in [257, 263, 264, 271, 274]:
                 self.logger.debug(f"Device responded with {cmd}, containing {data}")
@@ -185,76 +215,37 @@ class EventHandlers:
             # Device did not accept the password -- log error
             if cmd == 341:
                 self.logger.error(f"Password was not accepted by device!")
+
+            TRACER.stamp("device")
+
+            # Complete the command waiting for this response, if any
+            self.commands.tracker.resolve(cmd, data)
         
         if cmd == 1 and self.device.initialization_state and not self.device.logged_in:
-            self.logger.info(f"Device sent login banner - requesting login")
-            # Persist mac, model and other stable fields so they survive restarts
-            # where session recovery bypasses the login-beacon (cmd=1) flow.
-            if hasattr(self.commands.ble_manager, 'record_device_info'):
-                self.commands.ble_manager.record_device_info(self.device.info)
-            await self.commands.login_request()
-            await self.commands.set_charge_fee()
-            await self.commands.set_charge_service_fee()
-            
+            self.session.on_beacon()
+
         if cmd == 2 and self.device.info['software_version'] is None and not self.device.logged_in:
-            self.logger.info(f"Device sent response to login request - confirming login")
-            # If we sent a LOGIN_REQUEST as wakeup (bypassing the beacon flow) the
-            # serial is already known but initialization_state may still be False.
-            if not self.device.initialization_state and self.device.info.get('serial'):
-                self.device.initialization_state = True
-            
-            await self.commands.login_confirm()
-            self.device.logged_in = True
+            self.session.on_login_response()
 
-            # Persist serial immediately so it survives add-on restarts.
-            if hasattr(self.commands.ble_manager, 'record_serial'):
-                self.commands.ble_manager.record_serial(self.device.info.get('serial'))
-            
-            await self.commands.get_config_temperature_unit()
-            await self.commands.get_config_version()
-            await self.commands.get_config_name()
-            await self.commands.get_config_output_amps()
-            await self.commands.get_config_language()
-            await self.commands.get_config_lcd_brightness()
-            await self.commands.set_config_time()
-            await self.commands.get_charge_status_record()
-            await asyncio.sleep(2)  # Ugly hack - but hey ... it works
-        
         if cmd == 3:
             if not self.device.initialization_state:
-                # Session recovery: the wallbox still considers us connected and is
-                # sending heartbeats.  Re-hydrate our state from the packet identifier
-                # so we can reply without waiting for a new login-beacon flow.
-                self.logger.info(
-                    "Session recovery via heartbeat — restoring device state and re-querying config"
-                )
-                self.device.info = {'serial': parsed_data['identifier']}  # sets initialization_state = True
-                self.device.logged_in = True
-
-                # Persist serial immediately so it survives add-on restarts.
-                if hasattr(self.commands.ble_manager, 'record_serial'):
-                    self.commands.ble_manager.record_serial(parsed_data['identifier'])
-
-                await self.commands.heartbeat()
-                await self.commands.set_config_time()
-                await self.commands.get_config_temperature_unit()
-                await self.commands.get_config_version()
-                await self.commands.get_config_name()
-                await self.commands.get_config_output_amps()
-                await self.commands.get_config_language()
-                await self.commands.get_charge_status_record()
+                self.session.on_recovery(parsed_data['identifier'])
             else:
                 self.logger.info(f"Device sent heartbeat - replying")
                 await self.commands.heartbeat()
                 await self.commands.set_config_time()
-        
+
         # Before we forward the message, we check if:
         #   - the callback exists
         #   - the cmd is in forwarded messages
         #   - data is not None
         #   - device has been correctly initialized
         if self.callback and cmd in self.forward_messages and data is not None and self.device.initialization_state:
-            topic = self.forward_messages[cmd]
-            self.callback(self.device.info['serial'], topic, getattr(self.device, topic))
+            TRACER.stamp("filter")
+            self._publish(self.forward_messages[cmd])
                     
-        return cmd
\ No newline at end of file
+        return cmd
+
+    def _publish(self, topic):
+        if self.callback:
+            self.callback(self.device.info['serial'], topic, getattr(self.device, topic))
\ No newline at end of file
@@ -0,0 +1,327 @@
+import asyncio
+import json
+import math
+import time
+from abc import ABC, abstractmethod
+
+class Charger(ABC):
+    """A wallbox sharing the site budget, as seen through its single AC status frames."""
+
+    def __init__(self, name=None, phases=None, phase=1, priority=0, max_amps=32):
+        self._name = name
+        self.fixed_phases = phases        # None: 3 if the status frames carry L2/L3 voltages
+        self.phase = phase                # supply phase (1-3) of a single-phase wallbox
+        self.priority = priority
+        self.max_amps = max_amps
+        self.charge = {}
+        self.allocated = None             # amps last sent to the wallbox
+        self.applied_at = -math.inf
+        self.paused = False               # stopped by the balancer for lack of budget
+        self.active_since = None
+        self.car_limit = None             # the car takes less than the wallbox offers
+        self.restart = None               # task restarting the session with new amps
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def phases(self):
+        if self.fixed_phases:
+            return self.fixed_phases
+        return 3 if (self.charge.get('l2_voltage') or 0) > 100 else 1
+
+    def lines(self):
+        """Indices (0-2) of the site phases this wallbox draws from."""
+        return (0, 1, 2) if self.phases == 3 else (self.phase - 1,)
+
+    @property
+    def charging(self):
+        return self.charge.get('output_state') == "Charging"
+
+    @property
+    def restarting(self):
+        return self.restart is not None and not self.restart.done()
+
+    @property
+    def active(self):
+        # A paused wallbox keeps its claim while the car is plugged in
+        return self.charging or self.restarting or (self.paused and self.charge.get('plug_state') != "Disconnected")
+
+    def drawn(self):
+        return max((self.charge.get(f"l{line + 1}_amperage") or 0) for line in self.lines())
+
+    @abstractmethod
+    async def apply(self, amps, running):
+        """Set the current; running restarts the session with it.
+
+        Returns once the current is set. A restart that has to wait for the
+        wallbox is returned as a task instead of being awaited, so the other
+        wallboxes are not held up; None otherwise.
+        """
+
+    @abstractmethod
+    async def pause(self):
+        """Stop the session for lack of budget."""
+
+    @abstractmethod
+    async def resume(self, amps):
+        """Start a paused session again with amps."""
+
+
+class LocalCharger(Charger):
+    """The wallbox this evseMQTT instance is connected to."""
+
+    def __init__(self, device, commands, **kwargs):
+        super().__init__(**kwargs)
+        self.device = device
+        self.commands = commands
+
+    @property
+    def name(self):
+        return self.device.info['serial'] or "local"
+
+    async def apply(self, amps, running):
+        self.device.config = {'charge_amps': amps}
+        await self.commands.set_config_output_amps(amps)
+        if running:
+            # Waits up to 20 s for the wallbox to become ready again
+            return asyncio.create_task(self.commands.restart_charge(amps), name=f"balancer.restart {self.name}")
+        return None
+
+    async def pause(self):
+        await self.commands.set_charge_stop()
+
+    async def resume(self, amps):
+        self.device.config = {'charge_amps': amps}
+        await self.commands.set_config_output_amps(amps)
+        await self.commands.set_charge_start(amps)
+
+
+class RemoteCharger(Charger):
+    """A wallbox run by another evseMQTT instance, controlled through its command topic."""
+
+    def __init__(self, serial, mqtt_client, **kwargs):
+        super().__init__(serial, **kwargs)
+        self.mqtt_client = mqtt_client
+
+    async def apply(self, amps, running):
+        # The remote MQTTCallback restarts a running session itself
+        self.mqtt_client.publish_command(self.name, {"balancer_amps": amps})
+
+    async def pause(self):
+        self.mqtt_client.publish_command(self.name, {"charge_state": False})
+
+    async def resume(self, amps):
+        self.mqtt_client.publish_command(self.name, {"balancer_amps": amps})
+        self.mqtt_client.publish_command(self.name, {"charge_state": True})
+
+
+class LoadBalancer:
+    """Shares a per-phase site current limit between wallboxes.
+
+    Every status frame of a wallbox triggers a new allocation, so a car that
+    starts or stops is accounted for within one frame. Active sessions first
+    get min_amps each, in priority order (then by who started first); sessions
+    that do not fit are paused. The rest of the budget is handed out one amp at
+    a time round robin ("fair") or to the highest priority first ("priority").
+    A car that draws clearly less than it was given is capped just above its
+    draw so the others can use the difference, until it takes all it is
+    offered again. Reductions are applied first and at once, increases at most
+    every raise_interval seconds, because each change restarts the session.
+    The restart runs as a task; until it is done the wallbox keeps its
+    allocation and is left out of the rebalancing.
+    Idle wallboxes are preset to the budget left over, but never below
+    min_amps: with the site fully shared a car that plugs in can exceed the
+    limit by min_amps until its first status frame. Presets follow the same
+    rule: lowered at once, raised at most every raise_interval seconds.
+    """
+
+    STRATEGIES = ("fair", "priority")
+
+    def __init__(self, logger, limits, strategy="fair", min_amps=6, raise_interval=60, settle=30, mqtt_client=None,
+                 tick=10):
+        self.logger = logger
+        self.limits = tuple(limits)
+        self.strategy = strategy
+        self.min_amps = min_amps
+        self.raise_interval = raise_interval
+        self.settle = settle
+        self.mqtt_client = mqtt_client
+        self.tick = tick
+        self.chargers = []
+        self.allocation = {}
+        self._changed = asyncio.Event()
+
+    def add(self, charger):
+        self.chargers.append(charger)
+        return charger
+
+    def update(self, charger, charge, now=None):
+        """New status of a wallbox: a charge dict as in Device.charge."""
+        now = time.monotonic() if now is None else now
+        charger.charge = charge
+        if charger.paused and (charger.charging or charge.get('plug_state') == "Disconnected"):
+            # Restarted from elsewhere, or the car left: the pause is over
+            charger.paused = False
+        if charger.active and charger.active_since is None:
+            charger.active_since = now
+        elif not charger.active:
+            charger.active_since = charger.car_limit = None
+        if charger.charging and charger.allocated and not charger.restarting and now - charger.applied_at >= self.settle:
+            drawn = charger.drawn()
+            if drawn < charger.allocated - 2:
+                charger.car_limit = max(self.min_amps, math.ceil(drawn) + 1)
+            elif charger.car_limit and drawn >= charger.car_limit:
+                # The car takes all it is offered again
+                charger.car_limit = None
+        self._changed.set()
+
+    def _cap(self, charger):
+        return min(charger.max_amps, charger.car_limit or charger.max_amps)
+
+    def allocate(self, now):
+        """Amps per charger: 0 pauses an active session, idle wallboxes get a standby value."""
+        budget = list(self.limits)
+        # A session being restarted keeps its current until it is back
+        restarting = [charger for charger in self.chargers if charger.restarting]
+        for charger in restarting:
+            for line in charger.lines():
+                budget[line] -= charger.allocated
+        active = sorted((charger for charger in self.chargers if charger.active and not charger.restarting),
+                        key=lambda charger: (-charger.priority, charger.active_since or now))
+        allocation = {}
+        for charger in active:
+            if all(budget[line] >= self.min_amps for line in charger.lines()):
+                allocation[charger] = self.min_amps
+                for line in charger.lines():
+                    budget[line] -= self.min_amps
+            else:
+                allocation[charger] = 0
+
+        growing = [charger for charger in active if allocation[charger]]
+        caps = {charger: self._cap(charger) for charger in growing}
+        if self.strategy == "priority":
+            for charger in growing:
+                extra = min([caps[charger] - allocation[charger]] + [budget[line] for line in charger.lines()])
+                if extra > 0:
+                    allocation[charger] += extra
+                    for line in charger.lines():
+                        budget[line] -= extra
+        else:
+            while growing:
+                growing = [charger for charger in growing if allocation[charger] < caps[charger]
+                           and all(budget[line] >= 1 for line in charger.lines())]
+                for charger in growing:
+                    if all(budget[line] >= 1 for line in charger.lines()):
+                        allocation[charger] += 1
+                        for line in charger.lines():
+                            budget[line] -= 1
+
+        for charger in self.chargers:
+            if charger not in allocation and not charger.restarting:
+                allocation[charger] = max(self.min_amps, min([charger.max_amps] + [budget[line] for line in charger.lines()]))
+        for charger in restarting:
+            allocation[charger] = charger.allocated
+        return allocation
+
+    async def rebalance(self, now=None):
+        now = time.monotonic() if now is None else now
+        allocation = self.allocate(now)
+        # Free current before handing it out
+        steps = sorted(allocation.items(), key=lambda item: item[1] - (item[0].allocated or 0))
+        changed = False
+        for charger, amps in steps:
+            if charger.restarting:
+                continue
+            try:
+                if not charger.active:
+                    raise_pending = (charger.allocated is not None and amps > charger.allocated
+                                     and now - charger.applied_at < self.raise_interval)
+                    if amps != charger.allocated and not raise_pending:
+                        await charger.apply(amps, running=False)
+                        charger.allocated = amps
+                        charger.applied_at = now
+                    continue
+                if amps == 0:
+                    if not charger.paused:
+                        self.logger.info(f"Site limit reached, pausing {charger.name}")
+                        await charger.pause()
+                        charger.paused = True
+                        changed = True
+                    continue
+                if charger.paused:
+                    self.logger.info(f"Resuming {charger.name} with {amps} A")
+                    await charger.resume(amps)
+                    charger.paused = False
+                elif amps == charger.allocated:
+                    continue
+                elif charger.allocated is not None and amps > charger.allocated and now - charger.applied_at < self.raise_interval:
+                    continue
+                else:
+                    self.logger.info(f"Allocating {amps} A to {charger.name} (was {charger.allocated})")
+                    charger.restart = await charger.apply(amps, running=True)
+                    if charger.restart is not None:
+                        charger.restart.add_done_callback(lambda task, charger=charger: self._restarted(charger, task))
+                charger.allocated = amps
+                charger.applied_at = now
+                changed = True
+            except Exception as e:
+                self.logger.error(f"Could not apply {amps} A to {charger.name}: {e}")
+        self.allocation = {charger.name: amps for charger, amps in allocation.items()}
+        if changed:
+            self._publish()
+        return self.allocation
+
+    def _restarted(self, charger, task):
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self.logger.error(f"Restarting {charger.name} with {charger.allocated} A failed: {task.exception()!r}")
+        elif task.result() is False:
+            self.logger.warning(f"{charger.name} did not restart with {charger.allocated} A")
+        # Hand out what the wallbox does not take now
+        self._changed.set()
+
+    def status(self):
+        return {
+            "limits": self.limits,
+            "strategy": self.strategy,
+            "chargers": {charger.name: {"active": charger.active, "paused": charger.paused, "restarting": charger.restarting,
+                                        "allocated": charger.allocated, "drawn": charger.drawn(), "phases": charger.phases}
+                         for charger in self.chargers},
+        }
+
+    def _publish(self):
+        if self.mqtt_client:
+            local = next((charger for charger in self.chargers if isinstance(charger, LocalCharger)), None)
+            self.mqtt_client.publish_balancer(local.name if local else "site", self.status())
+
+    def watch(self, charger):
+        """Follow a remote wallbox through the charge state its own evseMQTT publishes."""
+        self.mqtt_client.add_topic_handler(f"evseMQTT/{charger.name}/state/charge",
+                                           lambda payload: self._on_remote_state(charger, payload))
+
+    def _on_remote_state(self, charger, payload):
+        try:
+            self.update(charger, json.loads(payload))
+        except ValueError as e:
+            self.logger.warning(f"Invalid charge state from {charger.name}: {e}")
+
+    async def run(self):
+        for charger in self.chargers:
+            if isinstance(charger, RemoteCharger):
+                self.watch(charger)
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=self.tick)
+                except asyncio.TimeoutError:
+                    pass
+                self._changed.clear()
+                await self.rebalance()
+        finally:
+            # Torn down with the connection: no restart may go on through the next one
+            for charger in self.chargers:
+                if charger.restarting:
+                    charger.restart.cancel()
@@ -0,0 +1,185 @@
+import asyncio
+from .histogram import LatencyHistogram
+
+class _Metric:
+    """A metric family: one value per combination of label values."""
+
+    TYPE = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}                 # tuple of label values -> value
+
+    def _samples(self):
+        return sorted(self._values.items())
+
+    def _label_text(self, labelvalues, extra=()):
+        pairs = list(zip(self.labelnames, labelvalues)) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        for labelvalues, value in self._samples():
+            lines.append(f"{self.name}{self._label_text(labelvalues)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    TYPE = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+
+class Gauge(_Metric):
+    """Gauge that is either set explicitly or read from a function at scrape time."""
+
+    TYPE = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._functions = {}              # tuple of label values -> callable
+
+    def set(self, value, *labelvalues):
+        self._values[labelvalues] = value
+
+    def set_function(self, function, *labelvalues):
+        self._functions[labelvalues] = function
+
+    def _samples(self):
+        samples = dict(self._values)
+        for labelvalues, function in self._functions.items():
+            try:
+                samples[labelvalues] = function()
+            except Exception:
+                continue
+        return sorted(samples.items())
+
+
+class Histogram(_Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LatencyHistogram.DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value, *labelvalues):
+        histogram = self._values.get(labelvalues)
+        if histogram is None:
+            histogram = self._values[labelvalues] = LatencyHistogram(self.buckets)
+        histogram.observe(value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        for labelvalues, histogram in sorted(self._values.items(), key=lambda item: item[0]):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{self._label_text(labelvalues, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{self._label_text(labelvalues, [('le', '+Inf')])} {histogram.count}")
+            lines.append(f"{self.name}_sum{self._label_text(labelvalues)} {histogram.sum}")
+            lines.append(f"{self.name}_count{self._label_text(labelvalues)} {histogram.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process-wide collection of metrics, rendered in the Prometheus text format.
+
+    Updating a metric is a dict lookup and an addition, so instrumentation can
+    stay enabled in production; formatting only happens when someone scrapes.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            return self._metrics[metric.name]
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LatencyHistogram.DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Decoding pipeline (EventHandlers)
+FRAMES_RECEIVED = REGISTRY.counter("evse_frames_received_total", "Frames received from the wallbox", ("cmd",))
+CHECKSUM_FAILURES = REGISTRY.counter("evse_checksum_failures_total", "Frames dropped because of a bad checksum")
+PARSE_FAILURES = REGISTRY.counter("evse_parse_failures_total", "Frames a parser raised on", ("cmd",))
+PARSE_SECONDS = REGISTRY.histogram("evse_parse_seconds", "Time spent decoding a frame", ("cmd",))
+
+# Transports (BLEManager, WiFiManager)
+FRAMES_SENT = REGISTRY.counter("evse_frames_sent_total", "Frames sent to the wallbox", ("transport",))
+SEND_ERRORS = REGISTRY.counter("evse_send_errors_total", "Frames that could not be sent", ("transport",))
+QUEUE_DEPTH = REGISTRY.gauge("evse_outbound_queue_depth", "Commands waiting in the outbound queue", ("transport",))
+RECONNECTS = REGISTRY.counter("evse_reconnects_total", "Times the link to the wallbox was re-established", ("transport",))
+WAKEUPS_SENT = REGISTRY.counter("evse_wakeups_sent_total", "WiFi wakeup packets sent", ("strategy",))
+RESTARTS = REGISTRY.counter("evse_restarts_total", "Supervisor restarts of the connection tasks", ("reason",))
+
+# MQTT (MQTTClient)
+MQTT_PUBLISHES = REGISTRY.counter("evse_mqtt_publishes_total", "Messages published to the broker")
+MQTT_PUBLISH_BYTES = REGISTRY.counter("evse_mqtt_publish_bytes_total", "Payload bytes published to the broker")
+MQTT_PUBLISH_SECONDS = REGISTRY.histogram("evse_mqtt_publish_seconds", "Time spent handing a message to the MQTT client")
+MQTT_DISCONNECTS = REGISTRY.counter("evse_mqtt_disconnects_total", "Disconnects from the broker")
+
+
+class MetricsServer:
+    """Minimal HTTP endpoint serving REGISTRY on /metrics."""
+
+    def __init__(self, logger, port, host="127.0.0.1", registry=REGISTRY):
+        self.logger = logger
+        self.port = port
+        self.host = host
+        self.registry = registry
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.logger.info(f"Metrics available at http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Drain the request headers; nothing in them matters here.
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] in ("/metrics", "/"):
+                status, body = "200 OK", self.registry.render().encode()
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write(f"HTTP/1.0 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            self.logger.debug(f"Metrics request failed: {e}")
+        finally:
+            writer.close()
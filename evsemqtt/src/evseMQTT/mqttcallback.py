@@ -4,11 +4,15 @@ import time
 from .constants import Constants
 
 class MQTTCallback:
-    def __init__(self, device=None, commands=None):
+    def __init__(self, device=None, commands=None, telemetry=None, mqtt_client=None, surplus=None):
         self.device = device
         self.commands = commands
+        self.telemetry = telemetry
+        self.mqtt_client = mqtt_client
+        self.surplus = surplus
         self.logger = self.commands.logger # Hacky - but ... does it work? Passing logger to the class, will create duplicate log lines
         self._restart_cooldown_until = 0  # epoch timestamp — no restart before this time
+        self._balancer_restart = asyncio.Lock()  # one load balancer restart at a time
     
     async def delegate(self, client, userdata, message):
         # Decode and convert the JSON string to a dictionary
@@ -44,33 +48,38 @@ class MQTTCallback:
                     self.logger.info(f"Restart cooldown active ({remaining} s remaining) — skipping restart for {value} A.")
                     return
                 self.logger.info(f"Charging active — restarting session with {value} A.")
-                await self.commands.set_charge_stop()
-
-                # Wait until the wallbox is truly ready for a new session (max 20 s, poll every 500 ms).
-                # After set_charge_stop the wallbox briefly enters a transient state where
-                # output_state is already "Idle" but current_state is "Unknown 7" / "Finished".
-                # Only once current_state returns to "Charging" (CP-line state C: EV actively
-                # requesting charge) is the wallbox ready to accept set_charge_start again.
-                for _ in range(40):
-                    await asyncio.sleep(0.5)
-                    output_state = self.device.charge.get('output_state')
-                    current_state = self.device.charge.get('current_state')
-                    self.logger.debug(f"Waiting for ready state — output_state: {output_state}, current_state: {current_state}")
-                    if output_state == "Idle" and current_state == "Charging":
-                        self.logger.info(f"Wallbox ready (Idle + CP active) — sending charge_start with {value} A.")
-                        break
-                else:
-                    self.logger.warning(f"Wallbox did not reach ready state after 20 s — output: {self.device.charge.get('output_state')}, current: {self.device.charge.get('current_state')} — skipping restart.")
+                if not await self.commands.restart_charge(int(value)):
                     return
-
-                await asyncio.sleep(1)
-                await self.commands.set_charge_start(int(value))
                 self._restart_cooldown_until = time.time() + 60  # 60 s cooldown after restart
                 self.logger.info(f"Restart cooldown set for 60 s.")
 
-            # Re-issue get_config_output_amps to retrieve the data and put in device.config
-            await self.commands.get_config_output_amps()
+            # Re-issue get_config_output_amps to retrieve the data and put in device.config,
+            # and use the answer to confirm the wallbox actually applied the new value.
+            readback = await self.commands.get_config_output_amps()
+            try:
+                applied = (await readback)['charge_amps']
+            except asyncio.TimeoutError as e:
+                self.logger.warning(f"Could not confirm charge amps: {e}")
+            else:
+                if applied == int(value):
+                    self.logger.info(f"Wallbox confirmed charge amps of {applied} A.")
+                else:
+                    self.logger.warning(f"Wallbox reports {applied} A after setting {value} A.")
             
+        if key == "balancer_amps":
+            # Sent by the site load balancer, which limits increases itself. A reduction
+            # protects the main fuse and must not wait for the restart cooldown.
+            self.logger.info(f"Load balancer sets charge amps to {value}.")
+            self.device.config = {'charge_amps': value}
+            await self.commands.set_config_output_amps(value)
+            # Restarts do not overlap: an update that arrives during one waits for
+            # it, and only the newest of the updates that waited restarts again.
+            async with self._balancer_restart:
+                if self.device.config['charge_amps'] != value:
+                    self.logger.info(f"Load balancer amps {value} superseded by {self.device.config['charge_amps']}.")
+                elif self.device.charge.get('output_state') == "Charging":
+                    await self.commands.restart_charge(int(value))
+
         if key == "lcd_brightness":
             self.logger.info(f"Setting LCD brightness to {value}.")
             await self.commands.set_config_lcd_brightness(value)
@@ -90,4 +99,31 @@ class MQTTCallback:
             await self.commands.set_config_name(value)
             
             # Re-issue get_config_name to retrieve the data and put in device.config
-            await self.commands.get_config_name()
\ No newline at end of file
+            await self.commands.get_config_name()
+
+        if key == "surplus_charging":
+            if self.surplus is None:
+                self.logger.warning("Surplus charging is not configured (--surplus_feedin_topic).")
+            else:
+                self.surplus.set_enabled(value)
+
+        if key == "telemetry_query":
+            self.answer_telemetry_query(value)
+
+    def answer_telemetry_query(self, query):
+        # The query is either a number of seconds or an object:
+        #   {"seconds": 3600, "resolution": "1m", "fields": ["current_energy"], "id": "abc"}
+        # and is answered on evseMQTT/<serial>/telemetry, echoing the id.
+        if self.telemetry is None or self.mqtt_client is None:
+            self.logger.warning("Telemetry query received, but no telemetry buffer is available.")
+            return
+        if not isinstance(query, dict):
+            query = {"seconds": query}
+        response = {"id": query.get("id"), "resolution": query.get("resolution", "raw")}
+        try:
+            response["data"] = self.telemetry.window(float(query.get("seconds", 3600)), fields=query.get("fields"),
+                                                     resolution=response["resolution"])
+        except (TypeError, ValueError) as e:
+            self.logger.warning(f"Invalid telemetry query {query}: {e}")
+            response["error"] = str(e)
+        self.mqtt_client.publish_telemetry(self.device.info['serial'], response)
@@ -1,6 +1,10 @@
 import paho.mqtt.client as mqtt
 import json
 import asyncio
+import time
+from . import metrics
+from .serializer import StateSerializer
+from .tracing import TRACER
 
 class MQTTClient:
     def __init__(self, logger, client_id, broker, port, username=None, password=None, keepalive=60):
@@ -17,12 +21,17 @@ class MQTTClient:
         self.client.on_subscribe = self.on_subscribe
         self.client.on_publish = self.on_publish
         self.connected = False
+        self._topic_handlers = {}  # topic -> paho callback, resubscribed on every connect
+        self.serializer = StateSerializer()  # Manager hands it the device's snapshot versions
 
     def on_connect(self, client, userdata, flags, rc):
         self.logger.info(f"Connected to MQTT broker")
+        for topic in self._topic_handlers:
+            client.subscribe(topic)
         
     def on_disconnect(self, client, userdata, rc):
         self.logger.info(f"Disconnected from MQTT broker")
+        metrics.MQTT_DISCONNECTS.inc()
         self.connected = False
         
     def on_message(self, client, userdata, msg):
@@ -56,23 +65,84 @@ class MQTTClient:
     def subscribe(self, topic, qos=0):
         self.client.subscribe(topic, qos)
 
+    def add_topic_handler(self, topic, handler):
+        """Call handler(payload) on the running event loop for every message on topic."""
+        loop = asyncio.get_running_loop()
+        callback = lambda client, userdata, message: loop.call_soon_threadsafe(handler, message.payload)
+        self._topic_handlers[topic] = callback
+        self.client.message_callback_add(topic, callback)
+        self.client.subscribe(topic)
+
     def publish(self, topic, payload, qos=0, retain=False):
+        started = time.perf_counter()
         self.client.publish(topic, payload, qos, retain)
+        metrics.MQTT_PUBLISH_SECONDS.observe(time.perf_counter() - started)
+        metrics.MQTT_PUBLISHES.inc()
+        metrics.MQTT_PUBLISH_BYTES.inc(amount=len(payload) if payload is not None else 0)
 
     def publish_availability(self, identifier, state):
-        self.client.publish(f"evseMQTT/{identifier}/availability", state, 0, True)
+        self.publish(f"evseMQTT/{identifier}/availability", state, 0, True)
         
     def publish_state(self, identifier, topic, state):
-        self.client.publish(f"evseMQTT/{identifier}/state/{topic}", json.dumps(state))
+        self.publish(f"evseMQTT/{identifier}/state/{topic}", self.serializer.encode(topic, state))
+        TRACER.stamp("publish")
+
+    def publish_session(self, identifier, summary):
+        # Retained, so the last session survives a restart of Home Assistant
+        self.publish(f"evseMQTT/{identifier}/session", json.dumps(summary), retain=True)
+
+    def publish_surplus(self, identifier, status):
+        self.publish(f"evseMQTT/{identifier}/surplus", json.dumps(status))
+
+    def publish_telemetry(self, identifier, response):
+        self.publish(f"evseMQTT/{identifier}/telemetry", json.dumps(response))
+
+    def publish_balancer(self, identifier, status):
+        self.publish(f"evseMQTT/{identifier}/balancer", json.dumps(status))
+
+    def publish_command(self, identifier, command):
+        # Commands for a wallbox run by another evseMQTT instance
+        self.publish(f"evseMQTT/{identifier}/command", json.dumps(command))
 
     def publish_discovery(self, discovery_payload):
         if isinstance(discovery_payload, list):
             for element in discovery_payload:
                 topic = element["config_topic"]
                 payload = {k: v for k, v in element.items() if k != "config_topic"}
-                self.client.publish(topic, json.dumps(payload), retain=True)
+                self.publish(topic, json.dumps(payload), retain=True)
         else:
             topic = f'homeassistant/{discovery_payload["device_class"]}/{discovery_payload["unique_id"]}/config'
             payload = {k: v for k, v in discovery_payload.items() if k != "config_topic"}
-            self.client.publish(topic, json.dumps(payload), retain=True)
+            self.publish(topic, json.dumps(payload), retain=True)
         self.connected = True
+
+    def clear_discovery(self, config_topics):
+        # An empty retained config removes the entity from Home Assistant
+        for topic in config_topics:
+            self.publish(topic, "", retain=True)
+
+    def migrate_discovery(self, config_topics):
+        # Home Assistant keeps the entities of these topics (names, areas,
+        # history) for the discovery config that takes them over, so the old
+        # topics can be cleared afterwards without removing anything
+        for topic in config_topics:
+            self.publish(topic, json.dumps({"migrate_discovery": True}), retain=True)
+
+    async def retained(self, topic_filter, timeout=1.0):
+        """Topics matching topic_filter that hold a retained message on the broker."""
+        loop = asyncio.get_running_loop()
+        found = set()
+
+        def on_retained(client, userdata, message):
+            if message.retain and message.payload:
+                loop.call_soon_threadsafe(found.add, message.topic)
+
+        self.client.message_callback_add(topic_filter, on_retained)
+        self.client.subscribe(topic_filter)
+        try:
+            # The broker sends retained messages right after the subscription
+            await asyncio.sleep(timeout)
+        finally:
+            self.client.unsubscribe(topic_filter)
+            self.client.message_callback_remove(topic_filter)
+        return sorted(found)
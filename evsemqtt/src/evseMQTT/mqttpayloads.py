@@ -1,10 +1,136 @@
 import json
 from .constants import Constants
 
+ENTITY_GROUPS = ("core", "diagnostics", "phases", "config")
+DISCOVERY_MODES = ("entity", "device")
+
+# Set once at the top of a device-based discovery payload
+_SHARED = ("config_topic", "device", "availability_topic", "payload_available", "payload_not_available")
+
+def _phase(line):
+    """Voltage and current sensors of one phase."""
+    return {
+        f"l{line}_voltage": ("phases", "sensor", "charge", {
+            "name": f"L{line} Voltage", "device_class": "voltage", "unit_of_measurement": "V",
+            "state_class": "measurement", "value_template": f"{{{{ value_json.l{line}_voltage }}}}",
+            "entity_category": "diagnostic"}),
+        f"l{line}_amps": ("phases", "sensor", "charge", {
+            "name": f"L{line} Amperage", "device_class": "current", "unit_of_measurement": "A",
+            "state_class": "measurement", "value_template": f"{{{{ value_json.l{line}_amperage }}}}",
+            "entity_category": "diagnostic"}),
+    }
+
+# key -> (group, HA component, state topic, attributes). Attributes that depend
+# on the wallbox are functions of the device; None leaves the attribute out.
+# Topics, availability and the device block are the same for every entity and
+# added by MQTTPayloads.
+ENTITIES = {
+    "charge": ("core", "switch", "charge", {
+        "name": "Charge", "device_class": "switch", "icon": "mdi:ev-plug-type2",
+        "payload_on": 1, "payload_off": 0,
+        "command_template": "{\"charge_state\": {{ value }} }",
+        "value_template": "{{ value_json.charger_status }}"}),
+    "error_state": ("diagnostics", "sensor", "charge", {
+        "name": "Error State", "device_class": "enum",
+        "options": lambda device: list(set(Constants.ERRORS.values())),
+        "value_template": "{{ value_json.error_details }}", "entity_category": "diagnostic"}),
+    "charging_status": ("diagnostics", "sensor", "charge", {
+        "name": "Status", "device_class": "enum",
+        "options": lambda device: list(set(Constants.CHARGING_STATUS.values())),
+        "value_template": "{{ value_json.charging_status }}", "entity_category": "diagnostic"}),
+    "charging_status_description": ("core", "sensor", "charge", {
+        "name": "Message", "device_class": "enum",
+        "options": lambda device: list(set(Constants.CHARGING_STATUS_DESCRIPTIONS.values())),
+        "value_template": "{{ value_json.charging_status_description }}"}),
+    "current_state": ("core", "sensor", "charge", {
+        "name": "Current State", "device_class": "enum", "options": Constants.CURRENT_STATE,
+        "value_template": "{{ value_json.current_state }}"}),
+    "plug_state": ("diagnostics", "sensor", "charge", {
+        "name": "Plug State", "device_class": "enum", "options": Constants.PLUG_STATE,
+        "value_template": "{{ value_json.plug_state }}", "entity_category": "diagnostic"}),
+    "output_state": ("diagnostics", "sensor", "charge", {
+        "name": "Output State", "device_class": "enum", "options": Constants.OUTPUT_STATE,
+        "value_template": "{{ value_json.output_state }}", "entity_category": "diagnostic"}),
+    "device_date": ("diagnostics", "sensor", "config", {
+        "name": "Date", "icon": "mdi:calendar-month-outline", "enabled_by_default": False,
+        "payload_available": None, "payload_not_available": None,
+        "value_template": "{{ value_json.system_time_raw | int | timestamp_custom('%Y-%m-%d', true) }}",
+        "entity_category": "diagnostic"}),
+    "device_time": ("diagnostics", "sensor", "config", {
+        "name": "Time", "icon": "mdi:clock-outline", "enabled_by_default": False,
+        "payload_available": None, "payload_not_available": None,
+        "value_template": "{{ value_json.system_time_raw | int | timestamp_custom('%H:%M', true) }}",
+        "entity_category": "diagnostic"}),
+    "total_energy": ("core", "sensor", "charge", {
+        "name": "Total Energy", "device_class": "energy", "unit_of_measurement": "kWh",
+        "state_class": "total_increasing", "value_template": "{{ value_json.current_amount }}",
+        "entity_category": "diagnostic"}),
+    "current_energy": ("core", "sensor", "charge", {
+        "name": "Current Energy", "device_class": "power",
+        "unit_of_measurement": lambda device: "W" if device.unit == "W" else "kW",
+        "state_class": "measurement", "value_template": "{{ value_json.current_energy }}",
+        "entity_category": "diagnostic"}),
+    "device_name": ("config", "text", "config", {
+        "name": "Name", "command_template": "{\"device_name\": \"{{ value }}\" }", "min": 1, "max": 11,
+        "value_template": "{% if value_json.device_name is defined %}{{ value_json.device_name }}{% endif %}",
+        "entity_category": "config"}),
+    "temperature_c": ("diagnostics", "sensor", "charge", {
+        "name": "Temperature", "device_class": "temperature",
+        "enabled_by_default": lambda device: device.config['temperature_unit'] == "Celcius",
+        "unit_of_measurement": "°C", "state_class": "measurement",
+        "value_template": "{{ value_json.inner_temp_c }}", "entity_category": "diagnostic"}),
+    "temperature_f": ("diagnostics", "sensor", "charge", {
+        "name": "Temperature", "device_class": "temperature",
+        "enabled_by_default": lambda device: device.config['temperature_unit'] == "Fahrenheit",
+        "unit_of_measurement": "°F", "state_class": "measurement",
+        "value_template": "{{ value_json.inner_temp_f }}", "entity_category": "diagnostic"}),
+    "language": ("config", "select", "config", {
+        "name": "Language", "device_class": "select", "icon": "mdi:translate",
+        "options": lambda device: list(Constants.LANGUAGES.keys()),
+        "command_template": "{\"language\": \"{{ value }}\" }",
+        "value_template": "{{ value_json.language }}", "entity_category": "config"}),
+    "temperature_unit": ("config", "select", "config", {
+        "name": "Temperature Unit", "device_class": "select", "icon": "mdi:thermometer",
+        "options": lambda device: list(Constants.TEMPERATURE_UNIT.keys()),
+        "command_template": "{\"temperature_unit\": \"{{ value }}\" }",
+        "value_template": "{{ value_json.temperature_unit }}", "entity_category": "config"}),
+    "lcd_brightness": ("config", "number", "config", {
+        "name": "LCD Brightness", "icon": "mdi:brightness-percent", "enabled_by_default": False,
+        "unit_of_measurement": "percent", "min": 1, "max": 100, "step": 1,
+        "command_template": "{\"lcd_brightness\": {{ value }} }",
+        "value_template": "{{ value_json.lcd_brightness }}", "entity_category": "config"}),
+    "charge_amps": ("core", "number", "config", {
+        "name": "Charge Amps", "icon": "mdi:current-ac", "unit_of_measurement": "A",
+        "min": 6, "max": lambda device: device.info['output_max_amps'], "step": 1,
+        "command_template": "{\"charge_amps\": {{ value }} }",
+        "value_template": "{{ value_json.charge_amps }}"}),
+    "charge_amps_sensor": ("core", "sensor", "config", {
+        "name": "Charge Amps", "device_class": "current", "icon": "mdi:current-ac",
+        "unit_of_measurement": "A", "value_template": "{{ value_json.charge_amps }}"}),
+    **_phase(1),
+    "rssi": ("diagnostics", "sensor", "config", {
+        "name": "RSSI", "device_class": "signal_strength",
+        "enabled_by_default": lambda device: bool(device.rssi), "unit_of_measurement": "dBm",
+        "value_template": "{{ value_json.rssi }}", "entity_category": "diagnostic"}),
+    "version": ("diagnostics", "sensor", "config", {
+        "name": "evseMQTT Version", "icon": "mdi:code-tags",
+        "value_template": "{{ value_json.version }}", "entity_category": "diagnostic"}),
+    "time_to_ready": ("diagnostics", "sensor", "config", {
+        "name": "Time to Ready", "device_class": "duration", "enabled_by_default": False,
+        "unit_of_measurement": "s", "state_class": "measurement",
+        "value_template": "{{ value_json.time_to_ready }}", "entity_category": "diagnostic"}),
+}
+
+# Only announced for three-phase wallboxes
+PHASE_ENTITIES = {**_phase(2), **_phase(3)}
+
 class MQTTPayloads:
-    def __init__(self, device):
+    def __init__(self, device, groups=None, mode="entity"):
         self.device = device
-        
+        self.groups = tuple(groups or ENTITY_GROUPS)
+        self.mode = mode
+        self.device_topic = f"homeassistant/device/{self.device.info['serial']}/config"
+
         # Use MAC as the device identifier when available (BLE mode always has it;
         # WiFi mode gets it from cmd=1 login-beacon or the device-info cache).
         # Fall back to a serial-based identifier when MAC is absent so that the
@@ -28,414 +154,76 @@ class MQTTPayloads:
                 "sw_version": str(self.device.info['software_version'])
             }
         }
-        
-        self.entities = {
-            "charge": {
-                "name": "Charge",
-                "device_class": "switch",
-                "icon": "mdi:ev-plug-type2",
-                "unique_id": f"{self.device.info['serial']}",
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/charge",
-                "command_topic": f"evseMQTT/{self.device.info['serial']}/command",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "payload_on": 1,
-                "payload_off": 0,
-                "command_template": "{\"charge_state\": {{ value }} }",
-                "value_template": "{{ value_json.charger_status }}",
-            },
-            "error_state": {
-                "name": "Error State",
-                "device_class": "enum",
-                "device_type": "sensor",
-                "unique_id": f"{self.device.info['serial']}",
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/charge",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "options": list(set(Constants.ERRORS.values())),
-                "value_template": "{{ value_json.error_details }}",
-                "entity_category": "diagnostic"
-            },
-            "charging_status": {
-                "name": "Status",
-                "device_class": "enum",
-                "device_type": "sensor",
-                "unique_id": f"{self.device.info['serial']}",
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/charge",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "options": list(set(Constants.CHARGING_STATUS.values())),
-                "value_template": "{{ value_json.charging_status }}",
-                "entity_category": "diagnostic"
-            },
-            "charging_status_description": {
-                "name": "Message",
-                "device_class": "enum",
-                "device_type": "sensor",
-                "unique_id": f"{self.device.info['serial']}",
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/charge",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "options": list(set(Constants.CHARGING_STATUS_DESCRIPTIONS.values())),
-                "value_template": "{{ value_json.charging_status_description }}",
-            },
-            "current_state": {
-                "name": "Current State",
-                "device_class": "enum",
-                "device_type": "sensor",
-                "unique_id": f"{self.device.info['serial']}",
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/charge",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "options": Constants.CURRENT_STATE,
-                "value_template": "{{ value_json.current_state }}",
-            },
-            "plug_state": {
-                "name": "Plug State",
-                "device_class": "enum",
-                "device_type": "sensor",
-                "unique_id": f"{self.device.info['serial']}",
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/charge",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "options": Constants.PLUG_STATE,
-                "value_template": "{{ value_json.plug_state }}",
-                "entity_category": "diagnostic"
-            },
-            "output_state": {
-                "name": "Output State",
-                "device_class": "enum",
-                "device_type": "sensor",
-                "unique_id": f"{self.device.info['serial']}",
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/charge",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "options": Constants.OUTPUT_STATE,
-                "value_template": "{{ value_json.output_state }}",
-                "entity_category": "diagnostic"
-            },
-            "device_date": {
-                "name": "Date",
-                "icon": "mdi:calendar-month-outline",
-                "unique_id": f"{self.device.info['serial']}",
-                "enabled_by_default": False,
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/config",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "value_template": "{{ value_json.system_time_raw | int | timestamp_custom('%Y-%m-%d', true) }}",
-                "entity_category": "diagnostic"
-            },
-            "device_time": {
-                "name": "Time",
-                "icon": "mdi:clock-outline",
-                "unique_id": f"{self.device.info['serial']}",
-                "enabled_by_default": False,
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/config",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "value_template": "{{ value_json.system_time_raw | int | timestamp_custom('%H:%M', true) }}",
-                "entity_category": "diagnostic"
-            },
-            "total_energy": {
-                "name": "Total Energy",
-                "device_class": "energy",
-                "device_type": "sensor",
-                "unique_id": f"{self.device.info['serial']}",
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/charge",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "unit_of_measurement": "kWh",
-                "state_class": "total_increasing",
-                "value_template": "{{ value_json.current_amount }}",
-                "entity_category": "diagnostic"
-            },
-            "current_energy": {
-                "name": "Current Energy",
-                "device_class": "power",
-                "device_type": "sensor",
-                "unique_id": f"{self.device.info['serial']}",
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/charge",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "unit_of_measurement": "W" if self.device.unit == "W" else "kW",
-                "state_class": "measurement",
-                "value_template": "{{ value_json.current_energy }}",
-                "entity_category": "diagnostic"
-            },
-            "device_name": {
-                "name": "Name",
-                "device_type": "text",
-                "unique_id": f"{self.device.info['serial']}",
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/config",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "command_topic": f"evseMQTT/{self.device.info['serial']}/command",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "command_template": "{\"device_name\": \"{{ value }}\" }",
-                "min": 1,
-                "max": 11,
-                "value_template": "{% if value_json.device_name is defined %}{{ value_json.device_name }}{% endif %}",
-                "entity_category": "config"
-            },
-            "temperature_c": {
-                "name": "Temperature",
-                "device_class": "temperature",
-                "device_type": "sensor",
-                "enabled_by_default": True if self.device.config['temperature_unit'] == "Celcius" else False,
-                "unique_id": f"{self.device.info['serial']}",
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/charge",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "unit_of_measurement": "°C",
-                "state_class": "measurement",
-                "value_template": "{{ value_json.inner_temp_c }}",
-                "entity_category": "diagnostic"
-            },
-            "temperature_f": {
-                "name": "Temperature",
-                "device_class": "temperature",
-                "device_type": "sensor",
-                "enabled_by_default": True if self.device.config['temperature_unit'] == "Fahrenheit" else False,
-                "unique_id": f"{self.device.info['serial']}",
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/charge",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "unit_of_measurement": "°F",
-                "state_class": "measurement",
-                "value_template": "{{ value_json.inner_temp_f }}",
-                "entity_category": "diagnostic"
-            },
-            "language": {
-                "name": "Language",
-                "device_class": "select",
-                "icon": "mdi:translate",
-                "unique_id": f"{self.device.info['serial']}",                
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/config",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "command_topic": f"evseMQTT/{self.device.info['serial']}/command",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "options": list(Constants.LANGUAGES.keys()),
-                "command_template": "{\"language\": \"{{ value }}\" }",
-                "value_template": "{{ value_json.language }}",
-                "entity_category": "config"
-            },
-            "temperature_unit": {
-                "name": "Temperature Unit",
-                "device_class": "select",
-                "icon": "mdi:thermometer",
-                "unique_id": f"{self.device.info['serial']}",                
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/config",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "command_topic": f"evseMQTT/{self.device.info['serial']}/command",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "options": list(Constants.TEMPERATURE_UNIT.keys()),
-                "command_template": "{\"temperature_unit\": \"{{ value }}\" }",
-                "value_template": "{{ value_json.temperature_unit }}",
-                "entity_category": "config"
-            },
-            "lcd_brightness": {
-                "name": "LCD Brightness",
-                "device_type": "number",
-                "icon": "mdi:brightness-percent",
-                "enabled_by_default": False,
-                "unique_id": f"{self.device.info['serial']}",
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/config",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "command_topic": f"evseMQTT/{self.device.info['serial']}/command",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "unit_of_measurement": "percent",
-                "min": 1, 
-                "max": 100, 
-                "step": 1, 
-                "command_template": "{\"lcd_brightness\": {{ value }} }",
-                "value_template": "{{ value_json.lcd_brightness }}",
-                "entity_category": "config"
-            },
-            "charge_amps": {
-                "name": "Charge Amps",
-                "device_type": "number",
-                "icon": "mdi:current-ac",
-                "unique_id": f"{self.device.info['serial']}",
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/config",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "command_topic": f"evseMQTT/{self.device.info['serial']}/command",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "unit_of_measurement": "A",
-                "min": 6, 
-                "max": self.device.info['output_max_amps'], 
-                "step": 1, 
-                "command_template": "{\"charge_amps\": {{ value }} }",
-                "value_template": "{{ value_json.charge_amps }}",
-            },
-            "charge_amps_sensor": {
-                "name": "Charge Amps",
-                "device_class": "current",
-                "device_type": "sensor",
-                "icon": "mdi:current-ac",
-                "unique_id": f"{self.device.info['serial']}",
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/config",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "unit_of_measurement": "A",
-                "value_template": "{{ value_json.charge_amps }}",
-            },
-            "l1_voltage": {
-                "name": "L1 Voltage",
-                "device_class": "voltage",
-                "device_type": "sensor",
-                "unique_id": f"{self.device.info['serial']}",
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/charge",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "unit_of_measurement": "V",
-                "state_class": "measurement",
-                "value_template": "{{ value_json.l1_voltage }}",
-                "entity_category": "diagnostic"
-            },
-            "l1_amps": {
-                "name": "L1 Amperage",
-                "device_class": "current",
-                "device_type": "sensor",
-                "unique_id": f"{self.device.info['serial']}",
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/charge",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "unit_of_measurement": "A",
-                "state_class": "measurement",
-                "value_template": "{{ value_json.l1_amperage }}",
-                "entity_category": "diagnostic"
-            },
-            "rssi": {
-                "name": "RSSI",
-                "device_class": "signal_strength",
-                "device_type": "sensor",
-                "enabled_by_default": True if self.device.rssi else False,
-                "unique_id": f"{self.device.info['serial']}",
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/config",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "unit_of_measurement": "dBm",
-                "value_template": "{{ value_json.rssi }}",
-                "entity_category": "diagnostic"
-            },
-            "version": {
-                "name": "evseMQTT Version",
-                "device_type": "sensor",
-                "icon": "mdi:code-tags",
-                "unique_id": f"{self.device.info['serial']}",
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/config",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "value_template": "{{ value_json.version }}",
-                "entity_category": "diagnostic"
-            },
-        }
-        
-        self.phase_entities = {
-            "l2_voltage": {
-                "name": "L2 Voltage",
-                "device_class": "voltage",
-                "device_type": "sensor",
-                "unique_id": f"{self.device.info['serial']}",
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/charge",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "unit_of_measurement": "V",
-                "state_class": "measurement",
-                "value_template": "{{ value_json.l2_voltage }}",
-                "entity_category": "diagnostic"
-            },
-            "l2_amps": {
-                "name": "L2 Amperage",
-                "device_class": "current",
-                "device_type": "sensor",
-                "unique_id": f"{self.device.info['serial']}",
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/charge",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "unit_of_measurement": "A",
-                "state_class": "measurement",
-                "value_template": "{{ value_json.l2_amperage }}",
-                "entity_category": "diagnostic"
-            },
-            "l3_voltage": {
-                "name": "L3 Voltage",
-                "device_class": "voltage",
-                "device_type": "sensor",
-                "unique_id": f"{self.device.info['serial']}",
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/charge",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "unit_of_measurement": "V",
-                "state_class": "measurement",
-                "value_template": "{{ value_json.l3_voltage }}",
-                "entity_category": "diagnostic"
-            },
-            "l3_amps": {
-                "name": "L3 Amperage",
-                "device_class": "current",
-                "device_type": "sensor",
-                "unique_id": f"{self.device.info['serial']}",
-                "state_topic": f"evseMQTT/{self.device.info['serial']}/state/charge",
-                "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
-                "payload_available": "online",
-                "payload_not_available": "offline",
-                "unit_of_measurement": "A",
-                "state_class": "measurement",
-                "value_template": "{{ value_json.l3_amperage }}",
-                "entity_category": "diagnostic"
-            },
-        }
-        
-        if self.device.info['phases'] == 3:
-            self.entities.update(self.phase_entities)
 
-    def discovery(self):
-        discovery_entities = []
-        charge_state_topic = f"evseMQTT/{self.device.info['serial']}/state/charge"
+        table = dict(ENTITIES)
+        if self.device.info['phases'] == 3:
+            table.update(PHASE_ENTITIES)
 
-        for entity, data in self.entities.items():
+        # Expanded once; entities of the groups left out are only kept to be
+        # removed from Home Assistant
+        self.entities = {}
+        self.components = {}
+        self.removed_components = {}
+        for entity, (group, component, topic, attributes) in table.items():
+            if group in self.groups:
+                self.entities[entity] = self._expand(entity, component, topic, attributes)
+                self.components[entity] = component
+            else:
+                self.removed_components[entity] = component
+        self.removed = [self._config_topic(entity, component) for entity, component in self.removed_components.items()]
 
-            if "device_class" in data:
-                device_class = data['device_class']
+    def _config_topic(self, entity, component):
+        return f"homeassistant/{component}/{self.device.info['serial']}/{entity}/config"
 
-            if "device_type" in data:
-                device_class = data['device_type']
-                data.pop('device_type')
+    def _expand(self, entity, component, topic, attributes):
+        serial = self.device.info['serial']
+        config = {
+            "unique_id": f"{serial}_{entity}",
+            "state_topic": f"evseMQTT/{serial}/state/{topic}",
+            "availability_topic": f"evseMQTT/{serial}/availability",
+            "payload_available": "online",
+            "payload_not_available": "offline",
+        }
+        if "command_template" in attributes:
+            config["command_topic"] = f"evseMQTT/{serial}/command"
+        for key, value in attributes.items():
+            if callable(value):
+                value = value(self.device)
+            if value is None:
+                config.pop(key, None)
+            else:
+                config[key] = value
+        config["config_topic"] = self._config_topic(entity, component)
+        config.update(self.base_device)
 
-            temp_entity = {}
-            temp_entity.update(data)
-            temp_entity.update({"unique_id": f"{data['unique_id']}_{entity}"})
-            temp_entity.update({"config_topic": f"homeassistant/{device_class}/{data['unique_id']}/{entity}/config"})
-            temp_entity.update(self.base_device)
+        # Entities on the charge state topic receive updates every ~15 s.
+        # expire_after lets HA mark them unavailable automatically when the
+        # wallbox stops sending data — without relying on an "offline" publish.
+        if topic == "charge":
+            config["expire_after"] = 90
+        return config
 
-            # Entities on the charge state topic receive updates every ~15 s.
-            # expire_after lets HA mark them unavailable automatically when the
-            # wallbox stops sending data — without relying on an "offline" publish.
-            if data.get("state_topic") == charge_state_topic:
-                temp_entity["expire_after"] = 90
+    def discovery(self):
+        """One retained config per entity, or a single one for the device in device mode."""
+        if self.mode == "device":
+            return [self.device_discovery()]
+        return list(self.entities.values())
 
-            discovery_entities.append(temp_entity)
-    
-        return discovery_entities
\ No newline at end of file
+    def device_discovery(self):
+        """All entities in one device-based discovery payload (Home Assistant 2024.11 and later)."""
+        components = {}
+        for entity, config in self.entities.items():
+            components[entity] = {"platform": self.components[entity]}
+            components[entity].update((key, value) for key, value in config.items() if key not in _SHARED)
+        for entity, component in self.removed_components.items():
+            # A component reduced to its platform is removed from the device
+            components[entity] = {"platform": component}
+        return {
+            "config_topic": self.device_topic,
+            **self.base_device,
+            "origin": {"name": "evseMQTT", "sw_version": Constants.VERSION},
+            "availability_topic": f"evseMQTT/{self.device.info['serial']}/availability",
+            "payload_available": "online",
+            "payload_not_available": "offline",
+            "components": components,
+        }
\ No newline at end of file
@@ -1,6 +1,5 @@
 from .constants import Constants
 from .utils import Utils
-from .mqttpayloads import MQTTPayloads
 
 class Parsers:
     def login_beacon(data, identifier):
@@ -0,0 +1,125 @@
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from .capture import FrameCapture, read_capture
+from .commands import Commands
+from .device import Device
+from .event_handlers import EventHandlers
+
+class _ReplayTransport:
+    """Stands in for BLEManager/WiFiManager; commands the session sends go nowhere."""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def message_producer(self, message, priority=None):
+        self.sent += 1
+
+
+class Replayer:
+    """Feeds the inbound frames of a capture through EventHandlers.receive_notification.
+
+    speed scales the recorded inter-frame gaps: 1 replays in real time, 10 ten
+    times faster and 0 as fast as possible. Every state the handlers publish is
+    collected in `published`, which is what the golden file compares against.
+    """
+
+    # Values that depend on the replay run rather than on the frames
+    IGNORED_KEYS = ("time_to_ready",)
+
+    def __init__(self, logger, speed=0.0, unit="W", password="123456"):
+        self.logger = logger
+        self.speed = speed
+        self.device = Device("replay")
+        self.device.unit = unit
+        self.device.ble_password = password
+        self.transport = _ReplayTransport()
+        self.commands = Commands(ble_manager=self.transport, device=self.device, logger=logger)
+        self.event_handlers = EventHandlers(device=self.device, commands=self.commands, logger=logger,
+                                            callback=self._record)
+        self.published = []
+
+    def _record(self, serial, topic, state):
+        state = {k: v for k, v in state.items() if k not in self.IGNORED_KEYS}
+        # Round trip through JSON so later mutations of the device dicts do not leak in
+        self.published.append(json.loads(json.dumps({"topic": topic, "state": state})))
+
+    async def run(self, frames):
+        inbound = outbound = 0
+        first = None
+        started = time.perf_counter()
+        for timestamp, direction, transport, payload in frames:
+            if direction != FrameCapture.INBOUND:
+                outbound += 1
+                continue
+            if self.speed > 0:
+                if first is None:
+                    first = timestamp
+                delay = (timestamp - first) / self.speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await self.event_handlers.receive_notification(transport, bytearray(payload))
+            await asyncio.sleep(0)  # let the session react as it would between datagrams
+            inbound += 1
+        elapsed = time.perf_counter() - started
+        self.event_handlers.session.reset()
+
+        return {
+            "inbound_frames": inbound,
+            "outbound_frames": outbound,
+            "commands_sent": self.transport.sent,
+            "published": len(self.published),
+            "elapsed_s": round(elapsed, 3),
+            "frames_per_s": round(inbound / elapsed) if elapsed else None,
+        }
+
+
+def compare_golden(published, path):
+    """Return a list of human readable differences between published and the golden file."""
+    with open(path) as f:
+        golden = [json.loads(line) for line in f if line.strip()]
+    differences = []
+    for index, (expected, actual) in enumerate(zip(golden, published)):
+        if expected != actual:
+            differences.append(f"#{index}: expected {expected}, got {actual}")
+    if len(golden) != len(published):
+        differences.append(f"expected {len(golden)} published states, got {len(published)}")
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a frame capture through the evseMQTT decoding pipeline")
+    parser.add_argument("capture", type=str, help="Capture file written with --capture")
+    parser.add_argument("--speed", type=float, default=0.0, help="1 = real time, N = N times faster, 0 = as fast as possible (default)")
+    parser.add_argument("--golden", type=str, help="Compare the published states against this golden file")
+    parser.add_argument("--write_golden", type=str, help="Write the published states to this golden file")
+    parser.add_argument("--unit", type=str, default="W", help="Unit of measurement for consumed power (kW or W)")
+    parser.add_argument("--logging_level", type=str, default="WARNING", help="Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=getattr(logging, args.logging_level.upper(), logging.WARNING),
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    replayer = Replayer(logging.getLogger("evseMQTT"), speed=args.speed, unit=args.unit)
+    stats = asyncio.run(replayer.run(read_capture(args.capture)))
+    print(json.dumps(stats))
+
+    if args.write_golden:
+        with open(args.write_golden, "w") as f:
+            for entry in replayer.published:
+                f.write(json.dumps(entry, sort_keys=True) + "\n")
+
+    if args.golden:
+        differences = compare_golden(replayer.published, args.golden)
+        for difference in differences[:20]:
+            print(difference)
+        if differences:
+            print(f"{len(differences)} difference(s) against {args.golden}")
+            sys.exit(1)
+        print(f"Output matches {args.golden}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import time
+from collections import deque
+from bleak import BleakScanner, BleakError
+
+class RSSIMonitor:
+    """Long-lived BLE scanner that tracks the signal strength of nearby wallboxes.
+
+    Instead of running a full discovery every heartbeat, a single scanner stays
+    registered for the lifetime of the connection and records the RSSI of every
+    advertisement it sees into a per-address ring buffer. Samples older than
+    max_age are ignored, so a wallbox that stopped advertising (typical while
+    connected) reports no RSSI instead of its last value. Passive scanning is
+    used whenever the backend supports it, so no scan requests are sent and the
+    radio is not taken away from the active connection.
+    """
+
+    NAME_PREFIX = "ACP#"
+
+    def __init__(self, logger, window=10):
+        self.logger = logger
+        self.window = window              # number of RSSI samples kept per address
+        self.samples = {}                 # address -> deque of recent (monotonic time, RSSI)
+        self.scanner = None
+        self.scanning_mode = None
+
+    def _on_detection(self, device, advertisement_data):
+        if device.address not in self.samples and not (device.name or "").startswith(self.NAME_PREFIX):
+            return
+        samples = self.samples.setdefault(device.address, deque(maxlen=self.window))
+        samples.append((time.monotonic(), advertisement_data.rssi))
+
+    def _passive_scanner(self):
+        # BlueZ only allows passive scanning through advertisement monitors,
+        # which need at least one pattern to match on.
+        from bleak.assigned_numbers import AdvertisementDataType
+        from bleak.backends.bluezdbus.advertisement_monitor import OrPattern
+
+        prefix = self.NAME_PREFIX.encode("ascii")
+        patterns = [
+            OrPattern(0, AdvertisementDataType.COMPLETE_LOCAL_NAME, prefix),
+            OrPattern(0, AdvertisementDataType.SHORTENED_LOCAL_NAME, prefix),
+        ]
+        return BleakScanner(self._on_detection, scanning_mode="passive", bluez={"or_patterns": patterns})
+
+    async def start(self, address=None):
+        if self.scanner is not None:
+            return
+
+        if address:
+            self.samples.setdefault(address, deque(maxlen=self.window))
+
+        try:
+            scanner = self._passive_scanner()
+            await scanner.start()
+            self.scanning_mode = "passive"
+        except (BleakError, ImportError, ValueError) as e:
+            self.logger.warning(f"Passive scanning not available ({e}), falling back to active scanning for RSSI")
+            scanner = BleakScanner(self._on_detection)
+            await scanner.start()
+            self.scanning_mode = "active"
+
+        self.scanner = scanner
+        self.logger.info(f"RSSI monitor started ({self.scanning_mode} scanning)")
+
+    async def stop(self):
+        if self.scanner is None:
+            return
+        try:
+            await self.scanner.stop()
+        except BleakError as e:
+            self.logger.debug(f"Error while stopping RSSI monitor: {e}")
+        self.scanner = None
+        self.logger.info("RSSI monitor stopped")
+
+    def smoothed(self, address, max_age=None):
+        """Return the mean of the RSSI samples for address seen in the last max_age seconds, or None."""
+        samples = self.samples.get(address)
+        if samples and max_age is not None:
+            cutoff = time.monotonic() - max_age
+            while samples and samples[0][0] < cutoff:
+                samples.popleft()
+        if not samples:
+            return None
+        return round(sum(rssi for _, rssi in samples) / len(samples))
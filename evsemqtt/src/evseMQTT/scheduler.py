@@ -0,0 +1,134 @@
+import asyncio
+import time
+from collections import deque
+
+class CommandScheduler:
+    """Outbound command queue with priority classes and deduplication.
+
+    Replaces the plain asyncio.Queue used by both transports and keeps its
+    interface (put_nowait/get/get_nowait/empty/task_done/join), but:
+
+      * get() always returns the oldest command of the most urgent class, so a
+        charge stop never waits behind a burst of config queries;
+      * putting never blocks — producers run on the notification path;
+      * a command identical to one that is still pending (same cmd and data) is
+        dropped instead of being sent twice. Charge control commands are never
+        deduplicated, their order matters;
+      * when a class is full its oldest command is dropped, and on_drop (if
+        set) is called with it so whoever waits for its response can give up;
+      * the time every command spends queued is recorded per class.
+    """
+
+    CONTROL = 0  # charge start/stop and output amps changes
+    SESSION = 1  # login, heartbeat replies and time sync
+    CONFIG = 2   # config queries and settings
+
+    NAMES = {CONTROL: "control", SESSION: "session", CONFIG: "config"}
+
+    def __init__(self, logger=None, maxsize=32):
+        self.logger = logger
+        self.maxsize = maxsize            # per-class bound, oldest command is dropped beyond it
+        self._queues = {priority: deque() for priority in self.NAMES}
+        self._pending = {}                # dedupe key -> queued entry
+        self._available = asyncio.Event()
+        self._finished = asyncio.Event()
+        self._finished.set()
+        self._unfinished = 0
+        self.on_drop = None               # callable(message) for commands dropped from a full queue
+
+        self.stats = {
+            name: {"sent": 0, "deduplicated": 0, "dropped": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for name in self.NAMES.values()
+        }
+
+    @staticmethod
+    def _dedupe_key(message):
+        # cmd and data; the header (serial, password) is the same for every command
+        # and the checksum/tail follow from the rest.
+        return bytes(message[19:-4])
+
+    def put_nowait(self, message, priority=CONFIG):
+        """Queue message in the given class. Returns False if it duplicated a pending command."""
+        stats = self.stats[self.NAMES[priority]]
+        key = None
+        if priority != self.CONTROL:
+            key = (priority, self._dedupe_key(message))
+            if key in self._pending:
+                stats["deduplicated"] += 1
+                return False
+
+        queue = self._queues[priority]
+        if len(queue) >= self.maxsize:
+            dropped = queue.popleft()
+            self._pending.pop(dropped[2], None)
+            self._task_finished()
+            stats["dropped"] += 1
+            if self.logger:
+                self.logger.warning(f"Outbound {self.NAMES[priority]} queue full, dropping oldest command")
+            if self.on_drop:
+                self.on_drop(dropped[0])
+
+        entry = (message, time.monotonic(), key)
+        queue.append(entry)
+        if key is not None:
+            self._pending[key] = entry
+
+        self._unfinished += 1
+        self._finished.clear()
+        self._available.set()
+        return True
+
+    def empty(self):
+        return not any(self._queues.values())
+
+    def qsize(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def get_nowait(self):
+        for priority, queue in self._queues.items():
+            if queue:
+                message, queued_at, key = queue.popleft()
+                if key is not None:
+                    self._pending.pop(key, None)
+                self._record_wait(priority, time.monotonic() - queued_at)
+                return message
+        raise asyncio.QueueEmpty
+
+    async def get(self):
+        while self.empty():
+            self._available.clear()
+            await self._available.wait()
+        return self.get_nowait()
+
+    def task_done(self):
+        if self._unfinished <= 0:
+            raise ValueError("task_done() called too many times")
+        self._task_finished()
+
+    def _task_finished(self):
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._finished.set()
+
+    async def join(self):
+        await self._finished.wait()
+
+    def _record_wait(self, priority, wait):
+        name = self.NAMES[priority]
+        stats = self.stats[name]
+        stats["sent"] += 1
+        stats["total_wait"] += wait
+        stats["max_wait"] = max(stats["max_wait"], wait)
+        if self.logger:
+            self.logger.debug(f"Dequeued {name} command after {wait * 1000:.1f} ms")
+
+    def wait_summary(self):
+        """Average and maximum queue wait in milliseconds per class."""
+        return {
+            name: {
+                "sent": stats["sent"],
+                "avg_wait_ms": round(stats["total_wait"] / stats["sent"] * 1000, 2) if stats["sent"] else 0.0,
+                "max_wait_ms": round(stats["max_wait"] * 1000, 2),
+            }
+            for name, stats in self.stats.items()
+        }
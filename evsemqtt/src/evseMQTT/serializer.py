@@ -0,0 +1,46 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # optional, see StateSerializer
+    orjson = None
+
+BACKENDS = ("json", "orjson")
+
+class StateSerializer:
+    """Encodes the charge and config snapshots for evseMQTT/<serial>/state/<topic>.
+
+    version is a callable returning the snapshot version of a topic
+    (Device.version). While it does not change, the last payload of that topic
+    is published again instead of encoding the snapshot. Without it, or for
+    other topics, every call encodes.
+
+    With the default backend the payload is exactly json.dumps(state). The
+    snapshots are flat dicts of numbers and short strings, which the C encoder
+    behind json.dumps already handles faster than encoding pre-split key
+    fragments and values in Python (see benchmarks/bench_serializer.py).
+    backend="orjson" uses orjson when it is installed: compact JSON (no
+    spaces, UTF-8 instead of \\u escapes, null for NaN), which Home Assistant
+    templates read the same, but not the same bytes.
+    """
+
+    def __init__(self, version=None, backend="json"):
+        self.version = version
+        self.backend = backend if backend == "json" or orjson is not None else "json"
+        self._dumps = orjson.dumps if self.backend == "orjson" else json.dumps
+        self._payloads = {}               # topic -> (snapshot version, payload)
+        self.encoded = 0
+        self.reused = 0
+
+    def encode(self, topic, state):
+        version = self.version(topic) if self.version else None
+        if version is not None:
+            cached = self._payloads.get(topic)
+            if cached is not None and cached[0] == version:
+                self.reused += 1
+                return cached[1]
+        payload = self._dumps(state)
+        self.encoded += 1
+        if version is not None:
+            self._payloads[topic] = (version, payload)
+        return payload
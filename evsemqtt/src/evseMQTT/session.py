@@ -0,0 +1,214 @@
+import asyncio
+import time
+
+class SessionState:
+    """Login and initialisation state machine, driven by the wallbox's responses.
+
+        idle -> beacon -> login -> confirm -> hydration -> ready
+
+    A login beacon (cmd 1) triggers a login request; its response (cmd 2)
+    triggers the login confirmation and the config queries; once every config
+    query is answered (or has timed out) the session is ready. A heartbeat from a
+    wallbox that still considers us logged in (session recovery) skips straight
+    to hydration. Each step waits at most step_timeout seconds for the wallbox.
+
+    The `identified` event is set as soon as serial and software version are
+    known, which is all MQTT discovery needs; `ready` once hydration finished.
+    wait_for_change() wakes up whenever `identified` flips, so availability can
+    be tracked without polling.
+    """
+
+    IDLE = "idle"
+    BEACON = "beacon"
+    LOGIN = "login"
+    CONFIRM = "confirm"
+    HYDRATION = "hydration"
+    READY = "ready"
+
+    def __init__(self, device, commands, logger, publish=None, step_timeout=5.0):
+        self.device = device
+        self.commands = commands
+        self.logger = logger
+        self.publish = publish            # callable(topic) publishing a device snapshot, optional
+        self.step_timeout = step_timeout
+        self.state = self.IDLE
+        self.started_at = None            # monotonic time the current login attempt started
+        self.time_to_ready = None         # seconds from beacon (or recovery) to ready
+        self.identified = asyncio.Event()
+        self.ready = asyncio.Event()
+        self._changed = asyncio.Event()   # replaced on every availability change
+        self._task = None
+
+    def _transition(self, state):
+        self.logger.debug(f"Session state: {self.state} -> {state}")
+        self.state = state
+
+    def _start(self, coro):
+        self.cancel()
+        self._task = asyncio.create_task(coro, name=f"session.{coro.__name__.lstrip('_')}")
+        self._task.add_done_callback(self._finished)
+
+    def _finished(self, task):
+        if task.cancelled() or task.exception() is None:
+            return
+        self.logger.error(f"Session step failed in state {self.state}: {task.exception()!r}", exc_info=task.exception())
+        # Start over with the next beacon instead of staying stuck mid-login
+        self._transition(self.IDLE)
+
+    def cancel(self):
+        """Stop the running login or hydration step, e.g. when the connection is torn down."""
+        if self._task and not self._task.done():
+            self._task.cancel()
+        self._task = None
+
+    @property
+    def _transport(self):
+        return self.commands.ble_manager
+
+    def reset(self):
+        """Forget the session, e.g. after the wallbox went silent. The next beacon starts over."""
+        self.cancel()
+        self._transition(self.IDLE)
+        self.started_at = None
+        self.ready.clear()
+        if self.identified.is_set():
+            self.identified.clear()
+            self._notify_change()
+
+    def check_identified(self):
+        if self.identified.is_set():
+            return
+        if self.device.info['serial'] is not None and self.device.info['software_version'] is not None:
+            self.identified.set()
+            self._notify_change()
+
+    def _notify_change(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait_for_change(self):
+        """Return once the wallbox became available (identified) or unavailable (reset)."""
+        await self._changed.wait()
+
+    # ------------------------------------------------------------------
+    # Inputs from EventHandlers
+    # ------------------------------------------------------------------
+
+    def on_beacon(self):
+        if self.state in (self.LOGIN, self.CONFIRM, self.HYDRATION):
+            return
+        self.logger.info(f"Device sent login banner - requesting login")
+        self.started_at = time.monotonic()
+        self._transition(self.BEACON)
+        # Persist mac, model and other stable fields so they survive restarts
+        # where session recovery bypasses the login-beacon (cmd=1) flow.
+        if hasattr(self._transport, 'record_device_info'):
+            self._transport.record_device_info(self.device.info)
+        self._start(self._login())
+
+    def on_login_response(self):
+        # A login request we sent ourselves is completed through the response
+        # tracker; this covers login requests sent as WiFi wakeup packets.
+        if self.state in (self.LOGIN, self.CONFIRM, self.HYDRATION):
+            return
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+        self._start(self._confirm())
+
+    def on_recovery(self, serial):
+        # Session recovery: the wallbox still considers us connected and is
+        # sending heartbeats.  Re-hydrate our state from the packet identifier
+        # so we can reply without waiting for a new login-beacon flow.
+        self.logger.info("Session recovery via heartbeat — restoring device state and re-querying config")
+        self.started_at = time.monotonic()
+        self.device.info = {'serial': serial}  # sets initialization_state = True
+        self.device.logged_in = True
+
+        # Persist serial immediately so it survives add-on restarts.
+        if hasattr(self._transport, 'record_serial'):
+            self._transport.record_serial(serial)
+
+        self._start(self._recover())
+
+    # ------------------------------------------------------------------
+    # Steps
+    # ------------------------------------------------------------------
+
+    async def _login(self):
+        self._transition(self.LOGIN)
+        login = await self.commands.login_request()
+        await self.commands.set_charge_fee()
+        await self.commands.set_charge_service_fee()
+        try:
+            await login.wait(timeout=self.step_timeout, retries=0)
+        except asyncio.TimeoutError:
+            self.logger.warning(f"No login response within {self.step_timeout} s, waiting for the next beacon")
+            self._transition(self.IDLE)
+            return
+        await self._confirm()
+
+    async def _confirm(self):
+        self._transition(self.CONFIRM)
+        self.logger.info(f"Device sent response to login request - confirming login")
+        # If we sent a LOGIN_REQUEST as wakeup (bypassing the beacon flow) the
+        # serial is already known but initialization_state may still be False.
+        if not self.device.initialization_state and self.device.info.get('serial'):
+            self.device.initialization_state = True
+
+        await self.commands.login_confirm()
+        self.device.logged_in = True
+
+        # Persist serial immediately so it survives add-on restarts.
+        if hasattr(self._transport, 'record_serial'):
+            self._transport.record_serial(self.device.info.get('serial'))
+
+        queries = [
+            await self.commands.get_config_temperature_unit(),
+            await self.commands.get_config_version(),
+            await self.commands.get_config_name(),
+            await self.commands.get_config_output_amps(),
+            await self.commands.get_config_language(),
+            await self.commands.get_config_lcd_brightness(),
+        ]
+        await self.commands.set_config_time()
+        await self.commands.get_charge_status_record()
+        await self._hydrate(queries)
+
+    async def _recover(self):
+        await self.commands.heartbeat()
+        await self.commands.set_config_time()
+        queries = [
+            await self.commands.get_config_temperature_unit(),
+            await self.commands.get_config_version(),
+            await self.commands.get_config_name(),
+            await self.commands.get_config_output_amps(),
+            await self.commands.get_config_language(),
+        ]
+        await self.commands.get_charge_status_record()
+        await self._hydrate(queries)
+
+    async def _hydrate(self, pending):
+        """Wait for the config queries in pending; status and time sync are not waited for."""
+        self._transition(self.HYDRATION)
+
+        # Boards without a software version report (fallback revision) use the
+        # hardware version instead; it is known from the login response already.
+        if self.device.fallback and self.device.info['software_version'] is None:
+            self.logger.info(f"Fallback: software_version populated with hardware_version.")
+            self.device.info = {'software_version': self.device.info['hardware_version']}
+        self.check_identified()
+
+        # Not resent: the step is bounded by step_timeout, not step_timeout per attempt
+        results = await asyncio.gather(*(p.wait(timeout=self.step_timeout, retries=0) for p in pending),
+                                       return_exceptions=True)
+        missing = [p.name for p, result in zip(pending, results) if isinstance(result, BaseException)]
+        if missing:
+            self.logger.warning(f"No answer to {', '.join(missing)} during initialization")
+
+        self._transition(self.READY)
+        self.time_to_ready = round(time.monotonic() - self.started_at, 3)
+        self.device.config = {'time_to_ready': self.time_to_ready}
+        self.logger.info(f"Device ready {self.time_to_ready} s after login started")
+        self.ready.set()
+        if self.publish:
+            self.publish("config")
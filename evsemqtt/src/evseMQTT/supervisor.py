@@ -0,0 +1,134 @@
+import asyncio
+import time
+from . import metrics
+
+class RestartRequested(Exception):
+    """Raised inside the task group to tear down the current generation."""
+
+
+class TaskSupervisor:
+    """Runs the tasks of one connection (transport, consumer, watchdog, heartbeat,
+    idle loop) in an asyncio.TaskGroup and restarts them as one unit.
+
+    A generation ends when a task fails or someone calls request_restart(); the
+    group then cancels every sibling, teardown() closes the transport, and the
+    next generation starts after an exponential backoff. A generation that stayed
+    up for stable_after seconds resets the backoff.
+    """
+
+    def __init__(self, logger, min_backoff=1.0, max_backoff=60.0, stable_after=300.0):
+        self.logger = logger
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+        self.generation = 0
+        self.restarts = 0
+        self.restart_reasons = {}         # reason -> number of restarts
+        self.started_at = None            # monotonic start of the current generation
+        self._group = None
+        self._tasks = {}                  # task name -> asyncio.Task of the current generation
+        self._restart = asyncio.Event()
+        self._reason = None
+
+    def spawn(self, name, coro):
+        """Start coro as a named task of the current generation."""
+        if self._group is None:
+            coro.close()
+            raise RuntimeError(f"Cannot start {name}: no generation is running")
+        task = self._group.create_task(coro, name=name)
+        self._tasks[name] = task
+        return task
+
+    def request_restart(self, reason):
+        """Tear down the current generation and start a new one. Safe to call from callbacks."""
+        if self._restart.is_set():
+            return
+        self.logger.warning(f"Restart requested: {reason}")
+        self._reason = reason
+        self._restart.set()
+
+    async def _restart_trigger(self):
+        await self._restart.wait()
+        raise RestartRequested(self._reason)
+
+    async def run(self, body, teardown=None, on_restart=None):
+        """Run body() in a task group until it returns without a restart.
+
+        body is a coroutine function that spawn()s the generation's tasks;
+        teardown and on_restart are optional coroutine functions called after
+        every generation and before every restart respectively.
+        """
+        backoff = self.min_backoff
+        while True:
+            self.generation += 1
+            self.started_at = time.monotonic()
+            self._restart.clear()
+            self._reason = None
+            reason = None
+
+            try:
+                async with asyncio.TaskGroup() as group:
+                    self._group = group
+                    trigger = self.spawn("restart_trigger", self._restart_trigger())
+                    await body()
+                    # Once every task the body started has finished on its own,
+                    # the generation is over; stop the trigger so the group exits.
+                    others = [task for task in self._tasks.values() if task is not trigger]
+                    if others:
+                        await asyncio.wait(others)
+                    trigger.cancel()
+            except* RestartRequested as group_error:
+                reason = str(group_error.exceptions[0])
+            except* Exception as group_error:
+                for error in group_error.exceptions:
+                    self.logger.error(f"Task {self._failed_task(error)} failed: {error!r}", exc_info=error)
+                reason = f"task failure ({type(group_error.exceptions[0]).__name__})"
+            finally:
+                self._group = None
+                self._tasks = {}
+                if teardown:
+                    await teardown()
+
+            if reason is None:
+                return
+
+            self.restarts += 1
+            self.restart_reasons[reason] = self.restart_reasons.get(reason, 0) + 1
+            metrics.RESTARTS.inc(reason)
+            if time.monotonic() - self.started_at >= self.stable_after:
+                backoff = self.min_backoff
+            self.logger.info(f"Restarting generation {self.generation} ({reason}) in {backoff:g} s, "
+                             f"restart #{self.restarts}")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+            if on_restart:
+                await on_restart()
+
+    def _failed_task(self, error):
+        # Errors raised by body() itself belong to no spawned task
+        for name, task in self._tasks.items():
+            if task.done() and not task.cancelled() and task.exception() is error:
+                return name
+        return "body"
+
+    def inventory(self):
+        """Name, state and age of every task in the current generation."""
+        now = time.monotonic()
+        age = round(now - self.started_at, 1) if self.started_at else None
+        return [
+            {
+                "name": name,
+                "state": "running" if not task.done() else ("cancelled" if task.cancelled() else "done"),
+                "generation": self.generation,
+                "age_s": age,
+            }
+            for name, task in self._tasks.items()
+        ]
+
+    def stats(self):
+        return {
+            "generation": self.generation,
+            "restarts": self.restarts,
+            "restart_reasons": dict(self.restart_reasons),
+            "tasks": self.inventory(),
+        }
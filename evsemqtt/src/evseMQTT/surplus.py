@@ -0,0 +1,230 @@
+import asyncio
+import json
+import math
+import time
+
+class SurplusController:
+    """PV-surplus charging, run inside evseMQTT instead of as Home Assistant automations.
+
+    Grid feed-in, grid import and (optionally) home battery discharge are read
+    straight from MQTT topics. Every update recomputes the power available to
+    the car,
+
+        feed-in - import - battery discharge + own charging power - buffer
+
+    smooths it with a time-based exponential filter (filter_seconds) and turns
+    it into amps for the number of phases the wallbox reports. Hysteresis keeps
+    the wallbox calm:
+
+      * charging starts once the minimum current has been available for
+        start_delay, and only with a car plugged in
+      * it stops once less than the minimum has been available for stop_delay;
+        in between it charges at min_amps
+      * the setpoint only moves by at least amps_deadband, lowered after
+        down_interval and raised after up_interval since the last change,
+        because every change restarts the session on the wallbox; that restart
+        runs as a task, and no decisions are taken until it is done
+
+    Decisions are published on evseMQTT/<serial>/surplus.
+    """
+
+    def __init__(self, device, commands, logger, mqtt_client=None, topics=None, scale=1.0, buffer_w=200, min_amps=6,
+                 max_amps=32, filter_seconds=60, start_delay=180, stop_delay=300, amps_deadband=3, down_interval=30,
+                 up_interval=120, stale_after=120, tick=5, enabled=True):
+        self.device = device
+        self.commands = commands
+        self.logger = logger
+        self.mqtt_client = mqtt_client
+        self.topics = topics or {}            # input name -> MQTT topic
+        self.scale = scale                    # 1000 for sensors reporting kW
+        self.buffer_w = buffer_w
+        self.min_amps = min_amps
+        self.max_amps = max_amps
+        self.filter_seconds = filter_seconds
+        self.start_delay = start_delay
+        self.stop_delay = stop_delay
+        self.amps_deadband = amps_deadband
+        self.down_interval = down_interval
+        self.up_interval = up_interval
+        self.stale_after = stale_after
+        self.tick = tick
+        self.enabled = enabled
+
+        self.values = {}                      # input name -> watts
+        self.updated = None                   # time of the last measurement
+        self.filtered_w = None
+        self._filtered_at = None
+        self._start_since = None
+        self._stop_since = None
+        self._adjusted_at = -math.inf
+        self._restart = None                  # task restarting the session with new amps
+        self._changed = asyncio.Event()
+        self.status = {}
+
+    # ------------------------------------------------------------------
+    # Inputs
+    # ------------------------------------------------------------------
+
+    def on_measurement(self, name, payload, now=None):
+        """MQTT handler: payload is a number or a JSON object with "value", "power" or "state"."""
+        try:
+            text = payload.decode() if isinstance(payload, (bytes, bytearray)) else str(payload)
+            try:
+                value = float(text)
+            except ValueError:
+                data = json.loads(text)
+                value = float(next(data[key] for key in ("value", "power", "state") if key in data))
+        except (ValueError, TypeError, StopIteration, UnicodeDecodeError) as e:
+            self.logger.debug(f"Ignoring surplus input {name}: {payload!r} ({e})")
+            return
+        if math.isnan(value):
+            return
+        self.values[name] = value * self.scale
+        self.updated = time.monotonic() if now is None else now
+        self._changed.set()
+
+    def set_enabled(self, enabled):
+        self.enabled = bool(enabled)
+        self.logger.info(f"Surplus charging {'enabled' if self.enabled else 'disabled'}")
+        self._start_since = self._stop_since = None
+        self._changed.set()
+
+    def _charging(self):
+        return self.device.charge.get('output_state') == "Charging"
+
+    def _plugged_in(self):
+        return (self.device.charge.get('plug_state') or "").startswith("Connected")
+
+    def _own_power_w(self):
+        power = self.device.charge.get('current_energy') or 0
+        return power * 1000 if self.device.unit == "kW" else power
+
+    def _watts_per_amp(self):
+        phases = self.device.info.get('phases') or 1
+        charge = self.device.charge
+        voltages = [charge.get(f"l{line}_voltage") for line in range(1, phases + 1)]
+        voltages = [voltage for voltage in voltages if voltage and voltage > 100]
+        return phases * (sum(voltages) / len(voltages) if voltages else 230)
+
+    def available_w(self):
+        return (self.values.get("feedin", 0) - self.values.get("grid", 0) - self.values.get("battery", 0)
+                + (self._own_power_w() if self._charging() else 0) - self.buffer_w)
+
+    # ------------------------------------------------------------------
+    # Control
+    # ------------------------------------------------------------------
+
+    def decide(self, now):
+        """("start", amps), ("stop", None), ("adjust", amps) or (None, reason)."""
+        if not self.enabled:
+            return None, "disabled"
+        if self.updated is None or now - self.updated > self.stale_after:
+            return None, "no recent measurements"
+
+        available = self.available_w()
+        if self.filtered_w is None:
+            self.filtered_w = available
+        else:
+            alpha = 1 - math.exp(-max(now - self._filtered_at, 0) / self.filter_seconds)
+            self.filtered_w += alpha * (available - self.filtered_w)
+        self._filtered_at = now
+        target = min(int(self.filtered_w // self._watts_per_amp()), self.max_amps)
+        self.status.update(available_w=round(available), filtered_w=round(self.filtered_w), target_amps=max(target, 0))
+
+        if not self._charging():
+            self._stop_since = None
+            if not self._plugged_in():
+                self._start_since = None
+                return None, "no car"
+            if target < self.min_amps:
+                self._start_since = None
+                return None, "not enough surplus"
+            if self._start_since is None:
+                self._start_since = now
+            if now - self._start_since < self.start_delay:
+                return None, f"start in {self.start_delay - (now - self._start_since):.0f} s"
+            self._start_since = None
+            return "start", target
+
+        self._start_since = None
+        if target < self.min_amps:
+            if self._stop_since is None:
+                self._stop_since = now
+            if now - self._stop_since >= self.stop_delay:
+                self._stop_since = None
+                return "stop", None
+            target = self.min_amps
+        else:
+            self._stop_since = None
+
+        amps = self.device.config.get('charge_amps') or self.min_amps
+        delta = target - amps
+        since = now - self._adjusted_at
+        if delta <= -self.amps_deadband and since >= self.down_interval:
+            return "adjust", target
+        if delta >= self.amps_deadband and since >= self.up_interval:
+            return "adjust", target
+        return None, "stop pending" if self._stop_since is not None else "holding"
+
+    async def step(self, now=None):
+        now = time.monotonic() if now is None else now
+        if self._restart is not None and not self._restart.done():
+            action, value = None, "restarting charge"
+        else:
+            action, value = self.decide(now)
+        self.status.update(enabled=self.enabled, charging=self._charging(), action=action,
+                           amps=self.device.config.get('charge_amps'))
+        if action is None:
+            self.status["reason"] = value
+            return None
+        self.status["reason"] = None
+        self._adjusted_at = now
+        if action == "start":
+            self.logger.info(f"Surplus of {self.filtered_w:.0f} W, starting charge with {value} A")
+            self.device.config = {'charge_amps': value}
+            await self.commands.set_config_output_amps(value)
+            await self.commands.set_charge_start(value)
+        elif action == "stop":
+            self.logger.info(f"Surplus of {self.filtered_w:.0f} W below the minimum for {self.stop_delay} s, stopping charge")
+            await self.commands.set_charge_stop()
+        else:
+            self.logger.info(f"Surplus of {self.filtered_w:.0f} W, changing charge amps to {value} A")
+            self.device.config = {'charge_amps': value}
+            await self.commands.set_config_output_amps(value)
+            # Waits up to 20 s for the wallbox; run() keeps evaluating meanwhile
+            self._restart = asyncio.create_task(self.commands.restart_charge(value), name="surplus.restart")
+            self._restart.add_done_callback(self._restarted)
+        self.status["amps"] = self.device.config.get('charge_amps')
+        self._publish()
+        return action
+
+    def _restarted(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.error(f"Restarting the charge with new amps failed: {task.exception()!r}")
+
+    def _publish(self):
+        if self.mqtt_client and self.device.info['serial'] is not None:
+            self.mqtt_client.publish_surplus(self.device.info['serial'], self.status)
+
+    async def run(self):
+        """Subscribe to the inputs and evaluate on every update (at least every tick seconds)."""
+        if self.mqtt_client:
+            for name, topic in self.topics.items():
+                self.mqtt_client.add_topic_handler(topic, lambda payload, name=name: self.on_measurement(name, payload))
+        published = 0
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=self.tick)
+                except asyncio.TimeoutError:
+                    pass
+                self._changed.clear()
+                action = await self.step()
+                # Publish the state on every action and at least once a minute otherwise
+                if action is None and time.monotonic() - published >= 60:
+                    self._publish()
+                    published = time.monotonic()
+        finally:
+            # Torn down with the connection: the restart must not go on through the next one
+            if self._restart is not None and not self._restart.done():
+                self._restart.cancel()
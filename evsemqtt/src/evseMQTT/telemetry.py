@@ -0,0 +1,142 @@
+import math
+import time
+from array import array
+
+class _Ring:
+    """Fixed-capacity columns of doubles: one timestamp column plus one per field."""
+
+    def __init__(self, fields, capacity):
+        self.fields = fields
+        self.capacity = capacity
+        self.times = array("d", bytes(8 * capacity))
+        self.columns = [array("d", bytes(8 * capacity)) for _ in fields]
+        self.head = 0                     # next slot to write
+        self.count = 0
+
+    def append(self, timestamp, values):
+        head = self.head
+        self.times[head] = timestamp
+        for column, value in zip(self.columns, values):
+            column[head] = value
+        self.head = (head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def indices(self):
+        """Slot indices from the oldest to the newest sample."""
+        start = (self.head - self.count) % self.capacity
+        return (index % self.capacity for index in range(start, start + self.count))
+
+    def nbytes(self):
+        return (len(self.columns) + 1) * self.times.itemsize * self.capacity
+
+
+class _Tier:
+    """Ring of fixed-width buckets holding the mean of every field."""
+
+    def __init__(self, fields, width, capacity):
+        self.width = width
+        self.ring = _Ring(fields, capacity)
+        self.bucket = None                # start of the bucket being accumulated
+        self.sums = [0.0] * len(fields)
+        self.counts = [0] * len(fields)
+
+    def add(self, timestamp, values):
+        bucket = timestamp - timestamp % self.width
+        if bucket != self.bucket:
+            self.flush()
+            self.bucket = bucket
+        for index, value in enumerate(values):
+            if value == value:            # NaN marks a field the frame did not carry
+                self.sums[index] += value
+                self.counts[index] += 1
+
+    def partial(self):
+        if self.bucket is None or not any(self.counts):
+            return None
+        return self.bucket, [total / count if count else math.nan for total, count in zip(self.sums, self.counts)]
+
+    def flush(self):
+        bucket = self.partial()
+        if bucket is not None:
+            self.ring.append(*bucket)
+        self.sums = [0.0] * len(self.sums)
+        self.counts = [0] * len(self.counts)
+
+
+class TelemetryBuffer:
+    """In-memory history of the charge telemetry with fixed memory use.
+
+    Every single AC status frame is stored in the raw ring; the 1 min and 15 min
+    tiers keep bucket means, so with the default capacities the buffer covers
+    roughly an hour of raw samples, a day at 1 min and a week at 15 min. All
+    rings are preallocated `array`s, so memory does not grow with uptime.
+    """
+
+    FIELDS = ("current_energy", "l1_voltage", "l2_voltage", "l3_voltage",
+              "l1_amperage", "l2_amperage", "l3_amperage",
+              "inner_temp_c", "outer_temp", "total_energy")
+    RESOLUTIONS = {"raw": None, "1m": 60, "15m": 900}
+
+    def __init__(self, raw_capacity=3600, minute_capacity=1440, quarter_capacity=672, fields=FIELDS):
+        self.fields = tuple(fields)
+        self.raw = _Ring(self.fields, raw_capacity)
+        self.tiers = {
+            "1m": _Tier(self.fields, 60, minute_capacity),
+            "15m": _Tier(self.fields, 900, quarter_capacity),
+        }
+
+    def record(self, charge, timestamp=None):
+        """Store the telemetry fields of a Device.charge update."""
+        timestamp = time.time() if timestamp is None else timestamp
+        values = []
+        for field in self.fields:
+            value = charge.get(field)
+            values.append(float(value) if isinstance(value, (int, float)) else math.nan)
+        self.raw.append(timestamp, values)
+        for tier in self.tiers.values():
+            tier.add(timestamp, values)
+
+    def query(self, fields=None, since=None, until=None, resolution="raw"):
+        """Samples between since and until as {"t": [...], field: [...]}; missing values are None.
+
+        The 1m and 15m resolutions include the bucket that is still filling.
+        """
+        if resolution not in self.RESOLUTIONS:
+            raise ValueError(f"Unknown resolution {resolution}, expected one of {', '.join(self.RESOLUTIONS)}")
+        fields = self.fields if fields is None else tuple(fields)
+        unknown = [field for field in fields if field not in self.fields]
+        if unknown:
+            raise ValueError(f"Unknown telemetry field(s): {', '.join(unknown)}")
+        positions = [self.fields.index(field) for field in fields]
+        since = -math.inf if since is None else since
+        until = math.inf if until is None else until
+
+        if resolution == "raw":
+            ring, partial = self.raw, None
+        else:
+            tier = self.tiers[resolution]
+            ring, partial = tier.ring, tier.partial()
+
+        result = {"t": []}
+        result.update((field, []) for field in fields)
+        for index in ring.indices():
+            timestamp = ring.times[index]
+            if since <= timestamp <= until:
+                result["t"].append(timestamp)
+                for field, position in zip(fields, positions):
+                    value = ring.columns[position][index]
+                    result[field].append(value if value == value else None)
+        if partial is not None and since <= partial[0] <= until:
+            result["t"].append(partial[0])
+            for field, position in zip(fields, positions):
+                value = partial[1][position]
+                result[field].append(value if value == value else None)
+        return result
+
+    def window(self, seconds, fields=None, resolution="raw"):
+        """The last `seconds` of history."""
+        return self.query(fields, since=time.time() - seconds, resolution=resolution)
+
+    def nbytes(self):
+        return self.raw.nbytes() + sum(tier.ring.nbytes() for tier in self.tiers.values())
@@ -0,0 +1,502 @@
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from itertools import accumulate
+from .telemetry import TelemetryBuffer
+
+try:
+    import numpy as np
+except ImportError:  # rollups need numpy, reading and writing do not
+    np = None
+
+# Fixed-point scale per field; values are stored as integers in these units
+SCALES = {
+    "current_energy": 1,                  # W
+    "l1_voltage": 10, "l2_voltage": 10, "l3_voltage": 10,              # 0.1 V
+    "l1_amperage": 100, "l2_amperage": 100, "l3_amperage": 100,        # 0.01 A
+    "inner_temp_c": 10, "outer_temp": 10,                              # 0.1 °C
+    "total_energy": 1000,                 # Wh
+}
+
+_WIDTHS = ((1, "b"), (2, "h"), (4, "i"), (8, "q"))
+_NUMPY_TYPES = {1: "<i1", 2: "<i2", 4: "<i4", 8: "<i8"}
+_ALL_PRESENT, _ALL_MISSING, _BITMAP = 0, 1, 2
+
+
+def _encode_ints(values):
+    """First value, then the deltas at the narrowest width that holds them all."""
+    deltas = [b - a for a, b in zip(values, values[1:])]
+    low, high = (min(deltas), max(deltas)) if deltas else (0, 0)
+    for width, code in _WIDTHS:
+        limit = 1 << (8 * width - 1)
+        if -limit <= low and high < limit:
+            break
+    return struct.pack("<qB", values[0], width) + array(code, deltas).tobytes()
+
+
+def _decode_ints(buffer, offset, count):
+    """The first value and the count - 1 deltas written by _encode_ints, and the offset after them."""
+    first, width = struct.unpack_from("<qB", buffer, offset)
+    offset += 9
+    end = offset + width * (count - 1)
+    if np is not None:
+        values = np.empty(count, dtype=np.int64)
+        values[0] = first
+        values[1:] = np.frombuffer(buffer, dtype=_NUMPY_TYPES[width], count=count - 1, offset=offset)
+        return values, end
+    deltas = array(dict(_WIDTHS)[width])
+    deltas.frombytes(buffer[offset:end])
+    if sys.byteorder != "little":
+        deltas.byteswap()
+    return [first] + deltas.tolist(), end
+
+
+def _segmented_cumsum(values, starts):
+    """Running sums of values that restart at every index in starts."""
+    total = np.cumsum(values)
+    before = np.zeros(len(starts), dtype=total.dtype)
+    before[1:] = total[starts[1:] - 1]
+    return total - np.repeat(before, np.diff(np.append(starts, len(values))))
+
+
+class TelemetryStore:
+    """Append-only on-disk store for the charge telemetry of one or more wallboxes.
+
+    Samples are kept in memory and written in blocks of up to block_size
+    samples (or every flush_interval seconds) to one file per wallbox and UTC
+    day: <root>/<serial>/<YYYY-MM-DD>.evts. A block is a fixed header
+
+        magic, sample count, first and last timestamp, payload length
+
+    followed by a zlib-compressed payload of columns. When a day is over its
+    blocks are compacted into one, in the executor when an event loop runs.
+    Timestamps (ms) are stored as delta-of-delta, every field as fixed-point
+    deltas at the narrowest integer width that fits the block, with a bitmap
+    only where a field is sometimes missing. Typical status streams need 2-4 bytes per
+    sample. The day files plus the block headers are the time index: a range
+    read opens only the days in range and seeks past blocks outside it.
+    """
+
+    HEADER = struct.Struct("<4sIddI")
+    MAGIC = b"EVT1"
+    SUFFIX = ".evts"
+
+    def __init__(self, root, logger=None, unit="W", block_size=600, flush_interval=300.0,
+                 fields=TelemetryBuffer.FIELDS):
+        self.root = root
+        self.logger = logger or logging.getLogger("evseMQTT")
+        self.unit = unit
+        self.block_size = block_size
+        self.flush_interval = flush_interval
+        self.fields = tuple(fields)
+        self._pending = {}                # serial -> (timestamps, rows)
+        self._days = {}                   # serial -> UTC day of the last sample
+        self._compactions = set()         # compactions running in the executor
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def record(self, serial, charge, timestamp=None):
+        """Buffer one Device.charge update; full or old buffers are written out."""
+        if serial is None:
+            # Would end up in a "None" directory, mixed up with every other unknown wallbox
+            raise ValueError("Cannot store telemetry before the wallbox serial is known")
+        timestamp = time.time() if timestamp is None else timestamp
+        # By the day of the last sample: the buffer may just have been flushed
+        day, previous = self._day(timestamp), self._days.get(serial)
+        if previous is not None and previous != day:
+            self._flush(serial)
+            self._compact_later(serial, previous)
+        self._days[serial] = day
+        timestamps, rows = self._pending.setdefault(serial, ([], []))
+        row = []
+        for field in self.fields:
+            value = charge.get(field)
+            if isinstance(value, (int, float)):
+                if field == "current_energy" and self.unit == "kW":
+                    value *= 1000
+                row.append(round(value * SCALES[field]))
+            else:
+                row.append(None)
+        timestamps.append(round(timestamp * 1000))
+        rows.append(row)
+        if len(timestamps) >= self.block_size or timestamp - timestamps[0] / 1000 >= self.flush_interval:
+            self._flush(serial)
+
+    def flush(self):
+        for serial in list(self._pending):
+            self._flush(serial)
+
+    close = flush
+
+    def _flush(self, serial):
+        timestamps, rows = self._pending.pop(serial, ([], []))
+        if not timestamps:
+            return
+        path = self._path(serial, self._day(timestamps[0] / 1000))
+        block = self._encode(timestamps, rows)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "ab") as f:
+                f.write(block)
+        except OSError as e:
+            self.logger.error(f"Could not write telemetry to {path}: {e}")
+
+    def _encode(self, timestamps, rows):
+        body = zlib.compress(self._payload(timestamps, rows), 6)
+        return self.HEADER.pack(self.MAGIC, len(timestamps), timestamps[0] / 1000, timestamps[-1] / 1000, len(body)) + body
+
+    def _payload(self, timestamps, rows):
+        count = len(timestamps)
+        deltas = [b - a for a, b in zip(timestamps, timestamps[1:])]
+        payload = [struct.pack("<q", timestamps[0])]
+        if deltas:
+            payload.append(_encode_ints(deltas))
+        for index in range(len(self.fields)):
+            column = [row[index] for row in rows]
+            present = [value is not None for value in column]
+            if not any(present):
+                payload.append(bytes([_ALL_MISSING]))
+                continue
+            if all(present):
+                payload.append(bytes([_ALL_PRESENT]))
+            else:
+                bitmap = bytearray((count + 7) // 8)
+                for position, flag in enumerate(present):
+                    if flag:
+                        bitmap[position >> 3] |= 0x80 >> (position & 7)
+                payload.append(bytes([_BITMAP]) + bytes(bitmap))
+                # Carry the previous value through gaps so they cost a zero delta
+                previous = next(value for value in column if value is not None)
+                for position, value in enumerate(column):
+                    if value is None:
+                        column[position] = previous
+                    previous = column[position]
+            payload.append(_encode_ints(column))
+        return b"".join(payload)
+
+    def _compact_later(self, serial, day):
+        """Compact a finished day off the event loop, or right away when there is none (scripts)."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.compact(serial, day)
+            return
+        # A day of blocks takes long enough to stall frame handling and MQTT
+        future = loop.run_in_executor(None, self.compact, serial, day)
+        self._compactions.add(future)
+        future.add_done_callback(self._compactions.discard)
+
+    def compact(self, serial, day):
+        """Rewrite the blocks of a finished day as a single block.
+
+        A day of small blocks costs a header, a zlib stream and a decode call
+        each; one block per day keeps range reads over months fast and
+        compresses better. The file is replaced atomically.
+        """
+        path = self._path(serial, day)
+        started = time.perf_counter()
+        try:
+            with open(path, "rb") as f:
+                blocks = []
+                for count, start, end, length in self._scan(f, path):
+                    body = f.read(length)
+                    if len(body) < length:
+                        break
+                    blocks.append((count, zlib.decompress(body)))
+            if len(blocks) < 2:
+                return
+            positions = set(range(len(self.fields)))
+            timestamps, rows = self._rows([self._decode(count, payload, positions) for count, payload in blocks])
+            with open(path + ".tmp", "wb") as f:
+                f.write(self._encode(timestamps, rows))
+            os.replace(path + ".tmp", path)
+        except FileNotFoundError:
+            return
+        except (OSError, zlib.error) as e:
+            self.logger.error(f"Could not compact {path}: {e}")
+            return
+        self.logger.debug(f"Compacted {len(blocks)} blocks of {path} in {time.perf_counter() - started:.2f} s")
+
+    def _rows(self, blocks):
+        """Decoded blocks back into the timestamps (ms) and fixed-point rows record() buffers."""
+        timestamps, rows = [], []
+        for stamps, columns in blocks:
+            timestamps.extend(int(stamp) for stamp in accumulate(accumulate(stamps[1:]), initial=stamps[0]))
+            block_rows = [[None] * len(self.fields) for _ in range(len(stamps))]
+            for index, field in enumerate(self.fields):
+                if columns[field] is None:
+                    continue
+                raw, bitmap = columns[field]
+                for position, value in enumerate(accumulate(raw)):
+                    if bitmap is None or bitmap[position >> 3] & (0x80 >> (position & 7)):
+                        block_rows[position][index] = int(value)
+            rows.extend(block_rows)
+        return timestamps, rows
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _day(timestamp):
+        return time.strftime("%Y-%m-%d", time.gmtime(timestamp))
+
+    def _path(self, serial, day):
+        return os.path.join(self.root, str(serial), day + self.SUFFIX)
+
+    def serials(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(entry for entry in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, entry)))
+
+    def _scan(self, f, name):
+        """(count, first, last, payload length) of every block, leaving f at the payload."""
+        while True:
+            header = f.read(self.HEADER.size)
+            if len(header) < self.HEADER.size:
+                return
+            magic, count, start, end, length = self.HEADER.unpack(header)
+            if magic != self.MAGIC:
+                self.logger.warning(f"Corrupt telemetry block in {name}, skipping the rest of the file")
+                return
+            position = f.tell()
+            yield count, start, end, length
+            f.seek(position + length)
+
+    def _blocks(self, serial, since, until):
+        """Payloads of the blocks overlapping [since, until]."""
+        directory = os.path.join(self.root, str(serial))
+        if not os.path.isdir(directory):
+            return
+        first, last = self._day(max(since, 0)), self._day(min(until, 253402300799))
+        for name in sorted(os.listdir(directory)):
+            day = name[:-len(self.SUFFIX)]
+            if not name.endswith(self.SUFFIX) or not first <= day <= last:
+                continue
+            with open(os.path.join(directory, name), "rb") as f:
+                for count, start, end, length in self._scan(f, name):
+                    if end < since or start > until:
+                        continue
+                    body = f.read(length)
+                    if len(body) < length:  # block cut short by a crash
+                        break
+                    yield count, zlib.decompress(body)
+
+    def _decode(self, count, payload, positions):
+        """Columns of a block, still as deltas: the timestamps (first timestamp, first
+        delta, then delta-of-deltas) and, per wanted field, None if it is missing
+        throughout, else (first value and deltas, presence bitmap or None)."""
+        first = struct.unpack_from("<q", payload)[0]
+        offset = 8
+        timestamps = [first] if np is None else np.array([first], dtype=np.int64)
+        if count > 1:
+            deltas, offset = _decode_ints(payload, offset, count - 1)
+            timestamps = [first] + deltas if np is None else np.concatenate((timestamps, deltas))
+        columns = {}
+        for index, field in enumerate(self.fields):
+            mode = payload[offset]
+            offset += 1
+            if mode == _ALL_MISSING:
+                columns[field] = None
+                continue
+            bitmap = None
+            if mode == _BITMAP:
+                bitmap = payload[offset:offset + (count + 7) // 8]
+                offset += len(bitmap)
+            if index not in positions:
+                # Skip the column: first value, width byte, then count - 1 deltas
+                offset += 9 + payload[offset + 8] * (count - 1)
+                continue
+            values, offset = _decode_ints(payload, offset, count)
+            columns[field] = (values, bitmap)
+        return timestamps, columns
+
+    def _assemble(self, blocks, fields):
+        """Integrate the deltas of all blocks at once, restarting at every block."""
+        counts = np.array([len(timestamps) for timestamps, _ in blocks], dtype=np.int64)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        raw = np.concatenate([timestamps for timestamps, _ in blocks])
+        first = raw[starts].copy()
+        raw[starts] = 0
+        deltas = _segmented_cumsum(raw, starts)
+        deltas[starts] = first
+        result = {"t": _segmented_cumsum(deltas, starts) / 1000}
+        for field in fields:
+            parts, present, gaps = [], [], False
+            for (_, columns), count in zip(blocks, counts):
+                column = columns[field]
+                if column is None:
+                    parts.append(np.zeros(count, dtype=np.int64))
+                    present.append(np.zeros(count, dtype=bool))
+                    gaps = True
+                    continue
+                values, bitmap = column
+                parts.append(values)
+                if bitmap is None:
+                    present.append(np.ones(count, dtype=bool))
+                else:
+                    present.append(np.unpackbits(np.frombuffer(bitmap, dtype=np.uint8), count=count).astype(bool))
+                    gaps = True
+            values = _segmented_cumsum(np.concatenate(parts), starts) / SCALES[field]
+            if gaps:
+                values[~np.concatenate(present)] = np.nan
+            result[field] = values
+        return result
+
+    def read(self, serial, since=0, until=None, fields=None):
+        """Samples of serial in [since, until] as {"t": seconds, field: values}.
+
+        Columns are float64 NumPy arrays (NaN where a value is missing) when
+        NumPy is installed, lists otherwise. Samples still in memory are included.
+        """
+        until = time.time() + 86400 if until is None else until
+        fields = self.fields if fields is None else tuple(fields)
+        unknown = [field for field in fields if field not in self.fields]
+        if unknown:
+            raise ValueError(f"Unknown telemetry field(s): {', '.join(unknown)}")
+        positions = {self.fields.index(field) for field in fields}
+
+        blocks = [self._decode(count, payload, positions) for count, payload in self._blocks(serial, since, until)]
+        pending_timestamps, pending_rows = self._pending.get(serial, ([], []))
+        if pending_timestamps:
+            blocks.append(self._decode(len(pending_timestamps), self._payload(pending_timestamps, pending_rows), positions))
+
+        if np is not None:
+            if not blocks:
+                return {key: np.empty(0) for key in ("t",) + fields}
+            result = self._assemble(blocks, fields)
+            keep = (result["t"] >= since) & (result["t"] <= until)
+            return {key: values[keep] for key, values in result.items()}
+
+        result = {"t": []}
+        result.update((field, []) for field in fields)
+        for timestamps, columns in blocks:
+            stamps = [stamp / 1000 for stamp in accumulate(accumulate(timestamps[1:]), initial=timestamps[0])]
+            keep = [position for position, stamp in enumerate(stamps) if since <= stamp <= until]
+            result["t"].extend(stamps[position] for position in keep)
+            for field in fields:
+                if columns[field] is None:
+                    result[field].extend([math.nan] * len(keep))
+                    continue
+                raw, bitmap = columns[field]
+                values = list(accumulate(raw))
+                result[field].extend(
+                    values[position] / SCALES[field]
+                    if bitmap is None or bitmap[position >> 3] & (0x80 >> (position & 7)) else math.nan
+                    for position in keep)
+        return result
+
+    def disk_usage(self, serial):
+        """Bytes on disk and stored samples."""
+        size = samples = 0
+        directory = os.path.join(self.root, str(serial))
+        for name in os.listdir(directory) if os.path.isdir(directory) else ():
+            path = os.path.join(directory, name)
+            size += os.path.getsize(path)
+            with open(path, "rb") as f:
+                samples += sum(count for count, *_ in self._scan(f, name))
+        return size, samples
+
+
+def rollup(data, period=3600, max_gap=300):
+    """Per-period energy (kWh), peak and mean power (W) and phase imbalance, vectorised with NumPy.
+
+    Energy integrates current_energy over time; intervals longer than max_gap
+    seconds (no frames, e.g. the wallbox was offline) count as no power. Phase
+    imbalance is (max - min) / mean of the three phase currents, averaged over
+    the samples where all three phases carry current.
+    """
+    if np is None:
+        raise RuntimeError("Telemetry rollups need NumPy (pip install numpy)")
+    t = np.asarray(data["t"], dtype=np.float64)
+    if not len(t):
+        return []
+    power = np.nan_to_num(np.asarray(data["current_energy"], dtype=np.float64))
+    dt = np.diff(t, append=t[-1])
+    dt[dt > max_gap] = 0
+    energy = power * dt / 3600000
+
+    buckets = (t // period).astype(np.int64)
+    starts = np.flatnonzero(np.diff(buckets, prepend=buckets[0] - 1))
+    counts = np.diff(np.append(starts, len(t)))
+
+    phases = np.vstack([np.asarray(data.get(f"l{line}_amperage", np.full(len(t), np.nan)), dtype=np.float64)
+                        for line in (1, 2, 3)])
+    mean = phases.mean(axis=0)
+    valid = np.isfinite(mean) & (phases.min(axis=0) > 0)
+    imbalance = np.where(valid, (phases.max(axis=0) - phases.min(axis=0)) / np.where(valid, mean, 1), 0)
+    valid_count = np.add.reduceat(valid.astype(np.int64), starts)
+    imbalance_sum = np.add.reduceat(imbalance, starts)
+
+    rows = zip(buckets[starts] * period, counts, np.add.reduceat(energy, starts), np.maximum.reduceat(power, starts),
+               np.add.reduceat(power, starts) / counts, imbalance_sum, valid_count)
+    return [{
+        "start": int(start),
+        "samples": int(count),
+        "kwh": round(float(kwh), 3),
+        "peak_power_w": round(float(peak)),
+        "mean_power_w": round(float(mean_power)),
+        "phase_imbalance": round(float(total / valid), 3) if valid else None,
+    } for start, count, kwh, peak, mean_power, total, valid in rows]
+
+
+def _timestamp(text):
+    """Epoch seconds from a number or an ISO date (local time)."""
+    try:
+        return float(text)
+    except ValueError:
+        return time.mktime(time.strptime(text, "%Y-%m-%d" if len(text) == 10 else "%Y-%m-%dT%H:%M"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query an evseMQTT telemetry store")
+    parser.add_argument("root", type=str, help="Directory written with --telemetry_dir")
+    parser.add_argument("--serial", type=str, help="Wallbox serial (default: all)")
+    parser.add_argument("--since", type=str, default="0", help="Start, as YYYY-MM-DD, YYYY-MM-DDTHH:MM or epoch seconds")
+    parser.add_argument("--until", type=str, help="End, same formats (default: now)")
+    parser.add_argument("--fields", type=str, help="Comma separated fields (default: all)")
+    parser.add_argument("--rollup", type=str, choices=("hourly", "daily"), help="Print rollups instead of samples (needs NumPy)")
+    parser.add_argument("--stats", action="store_true", help="Print disk usage per wallbox")
+    parser.add_argument("--compact", action="store_true", help="Compact every day before today into a single block")
+    args = parser.parse_args()
+
+    store = TelemetryStore(args.root)
+    since = _timestamp(args.since)
+    until = _timestamp(args.until) if args.until else time.time()
+    fields = args.fields.split(",") if args.fields else None
+    for serial in [args.serial] if args.serial else store.serials():
+        if args.compact:
+            today = store._day(time.time())
+            for name in sorted(os.listdir(os.path.join(args.root, serial))):
+                if name.endswith(store.SUFFIX) and name[:-len(store.SUFFIX)] < today:
+                    store.compact(serial, name[:-len(store.SUFFIX)])
+            continue
+        if args.stats:
+            size, samples = store.disk_usage(serial)
+            print(json.dumps({"serial": serial, "bytes": size, "samples": samples,
+                              "bytes_per_sample": round(size / samples, 2) if samples else None}))
+            continue
+        if args.rollup:
+            data = store.read(serial, since, until, fields=("current_energy", "l1_amperage", "l2_amperage", "l3_amperage"))
+            for row in rollup(data, 3600 if args.rollup == "hourly" else 86400):
+                print(json.dumps({"serial": serial, **row}))
+            continue
+        data = store.read(serial, since, until, fields)
+        names = list(data)
+        print(",".join(["serial"] + names))
+        for timestamp, *values in zip(*(data[name] for name in names)):
+            print(",".join([serial, f"{timestamp:.3f}"] + ["" if value != value else f"{value:g}" for value in values]))
+
+
+if __name__ == "__main__":
+    main()
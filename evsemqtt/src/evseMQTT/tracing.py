@@ -0,0 +1,100 @@
+import contextvars
+import logging
+import time
+from . import metrics
+
+class FrameTrace:
+    """Monotonic timestamps of one inbound frame on its way to the MQTT client."""
+
+    __slots__ = ("transport", "marks", "cmd")
+
+    def __init__(self, transport, started=None):
+        self.transport = transport
+        self.marks = [("receive", time.perf_counter() if started is None else started)]
+        self.cmd = None
+
+    def stamp(self, stage):
+        self.marks.append((stage, time.perf_counter()))
+
+    def stages(self):
+        """(stage, seconds since the previous mark) for every mark after receive."""
+        return [(stage, at - self.marks[index][1]) for index, (stage, at) in enumerate(self.marks[1:])]
+
+    def total(self):
+        return self.marks[-1][1] - self.marks[0][1]
+
+
+class Tracer:
+    """Per-stage latency of the receive -> decode -> publish path.
+
+    Stages, each measured from the previous one:
+
+        dispatch     receive callback until EventHandlers got the data (event loop delay)
+        reassembled  frame complete (fragments of a BLE notification joined)
+        checksum     header and checksum verified
+        parse        frame decoded by its parser
+        device       Device updated
+        filter       publish decision taken
+        publish      state handed to the MQTT client (JSON encoding included)
+
+    The current frame travels in a context variable, so the transports, the
+    handlers and the MQTT client can stamp it without passing it around.
+    Durations go into the evse_frame_stage_seconds histogram; frames slower
+    than slow_threshold are logged with their breakdown.
+    """
+
+    # Stages mostly take microseconds, so the buckets start far below LatencyHistogram's
+    BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+               0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+    def __init__(self, logger=None, slow_threshold=0.1):
+        self.logger = logger or logging.getLogger("evseMQTT")
+        self.slow_threshold = slow_threshold
+        self.slow_frames = 0
+        self.histogram = metrics.REGISTRY.histogram(
+            "evse_frame_stage_seconds", "Time an inbound frame spent in each pipeline stage", ("stage",),
+            buckets=self.BUCKETS)
+        self._current = contextvars.ContextVar("evse_frame_trace", default=None)
+
+    def begin(self, transport):
+        trace = FrameTrace(transport)
+        self._current.set(trace)
+        return trace
+
+    def current(self):
+        return self._current.get()
+
+    def activate(self, trace):
+        self._current.set(trace)
+
+    def stamp(self, stage):
+        trace = self._current.get()
+        if trace is not None:
+            trace.stamp(stage)
+
+    def set_cmd(self, cmd):
+        trace = self._current.get()
+        if trace is not None:
+            trace.cmd = cmd
+
+    def finish(self):
+        """Record the current frame. Frames concatenated behind it keep its receive time."""
+        trace = self._current.get()
+        if trace is None or len(trace.marks) < 2:
+            return
+        for stage, seconds in trace.stages():
+            self.histogram.observe(seconds, stage)
+        total = trace.total()
+        self.histogram.observe(total, "total")
+        if total >= self.slow_threshold:
+            self.slow_frames += 1
+            breakdown = ", ".join(f"{stage} {seconds * 1000:.1f}" for stage, seconds in trace.stages())
+            self.logger.warning(f"Slow frame cmd {trace.cmd} via {trace.transport}: {total * 1000:.1f} ms ({breakdown} ms)")
+        self._current.set(FrameTrace(trace.transport, started=trace.marks[0][1]))
+
+    def summary(self):
+        """p50/p95/p99 per stage in milliseconds."""
+        return {labels[0]: histogram.summary() for labels, histogram in sorted(self.histogram._values.items())}
+
+
+TRACER = Tracer()
@@ -3,6 +3,10 @@ import json
 import os
 import socket
 import struct
+from . import metrics
+from .capture import FrameCapture
+from .tracing import TRACER
+from .scheduler import CommandScheduler
 
 # Discovery broadcast packet: header 06 01, length 25, keyType 0,
 # serial all-FF, password all-FF, cmd 0x0001 (LOGIN_BEACON), tail 0F 02.
@@ -47,6 +51,8 @@ class _UDPProtocol(asyncio.DatagramProtocol):
         self._mgr.logger.info(f"UDP socket bound on port {self._mgr.port}")
 
     def datagram_received(self, data, addr):
+        # Stamped here so the trace includes the time until the task runs
+        TRACER.begin("wifi")
         asyncio.ensure_future(self._mgr._on_datagram(data, addr))
 
     def error_received(self, exc):
@@ -55,6 +61,8 @@ class _UDPProtocol(asyncio.DatagramProtocol):
     def connection_lost(self, exc):
         self._mgr.logger.warning("UDP socket closed")
         self._mgr.connected = False
+        self._mgr._link_up.clear()
+        self._mgr._closed.set()
 
 
 class WiFiManager:
@@ -85,8 +93,10 @@ class WiFiManager:
 
         self.transport = None              # asyncio.DatagramTransport, set by _UDPProtocol
         self.evse_addr = None             # (ip, port) of wallbox, discovered on first packet
-        self.queue = asyncio.Queue(5)     # outbound message queue (same as BLEManager)
+        self.queue = CommandScheduler(logger)  # outbound priority queue (same as BLEManager)
         self.connected = False
+        self._link_up = asyncio.Event()   # set while the wallbox address is known
+        self._closed = asyncio.Event()    # set once the socket is shut down
 
         self.last_message_time = None
         self.message_timeout = 35         # seconds without a datagram before wakeup is sent
@@ -114,6 +124,9 @@ class WiFiManager:
 
         # Set by Manager after instantiation, same pattern as BLEManager
         self.manager = None
+        self.capture = None               # optional FrameCapture, set by Manager
+
+        metrics.QUEUE_DEPTH.set_function(lambda: self.queue.qsize(), "wifi")
 
     # ------------------------------------------------------------------
     # IP cache helpers
@@ -201,10 +214,8 @@ class WiFiManager:
 
     async def serve(self):
         """Bind the UDP socket and listen indefinitely for wallbox datagrams."""
-        # Re-create the queue here, inside the running event loop, so that it is
-        # guaranteed to be bound to *this* loop.  Creating it in __init__ (outside
-        # any async context) can bind it to a stale/different loop on Python 3.10+.
-        self.queue = asyncio.Queue(5)
+        # The queue from __init__ is kept: message_consumer may already wait on
+        # it, and asyncio primitives bind to the running loop on first use.
         loop = asyncio.get_event_loop()
         await loop.create_datagram_endpoint(
             lambda: _UDPProtocol(self),
@@ -218,17 +229,20 @@ class WiFiManager:
         # already silent at startup (e.g. after an HA restart).
         self.last_message_time = asyncio.get_event_loop().time()
         self._schedule_reconnect_check()
-        # Keep coroutine alive; actual work happens in datagram_received callbacks.
-        while True:
-            await asyncio.sleep(3600)
+        # Keep coroutine alive until the socket is closed; actual work happens
+        # in datagram_received callbacks.
+        self._closed.clear()
+        await self._closed.wait()
 
     async def disconnect(self):
         self._cancel_reconnect()
         self.connected = False
+        self._link_up.clear()
         if self.transport:
             self.transport.close()
             self.transport = None
         self.evse_addr = None
+        self._closed.set()
         self.logger.info("WiFi (UDP) disconnected")
 
     # ------------------------------------------------------------------
@@ -236,43 +250,68 @@ class WiFiManager:
     # ------------------------------------------------------------------
 
     async def _on_datagram(self, data, addr):
+        if data == _WAKEUP_PACKET:
+            # Our own wakeup broadcast, looped back by the network stack; the
+            # wallbox's beacons carry its serial instead of the all-FF one.
+            return
         self.last_message_time = asyncio.get_event_loop().time()
 
         if not self.connected:
             self.evse_addr = addr
             self.connected = True
+            if self.last_known_port is not None:
+                metrics.RECONNECTS.inc("wifi")
             # Remember source port so wakeup can target it directly.
             self.last_known_port = addr[1]
             # Persist the IP so future restarts can send a targeted wakeup immediately.
             if addr[0] != self.last_known_ip:
                 self.last_known_ip = addr[0]
                 self._save_cached_ip(addr[0])
+            self._link_up.set()
             self.logger.info(f"Wallbox discovered at {addr[0]}:{addr[1]}")
             # Reset the watchdog to a full message_timeout from now.
             self._schedule_reconnect_check()
+        elif addr != self.evse_addr and self._from_known_wallbox(data):
+            # New DHCP lease or port while the session is up: follow it, or every
+            # reply would go to the old address until the session times out.
+            self.logger.warning(f"Wallbox moved from {self.evse_addr[0]}:{self.evse_addr[1]} to {addr[0]}:{addr[1]}")
+            self.evse_addr = addr
+            self.last_known_port = addr[1]
+            if addr[0] != self.last_known_ip:
+                self.last_known_ip = addr[0]
+                self._save_cached_ip(addr[0])
 
+        if self.capture:
+            self.capture.record(FrameCapture.INBOUND, "wifi", data)
         await self.event_handler.receive_notification("wifi", bytearray(data))
 
+    def _from_known_wallbox(self, data):
+        serial = (self.manager.device.info.get("serial") if self.manager else None) or self.last_known_serial
+        return serial is not None and len(data) >= 13 and bytes(data[5:13]).hex().upper() == serial.upper()
+
     # ------------------------------------------------------------------
     # Outgoing datagrams  (write queue — same interface as BLEManager)
     # ------------------------------------------------------------------
 
-    async def message_producer(self, message):
-        await self.queue.put(message)
+    async def message_producer(self, message, priority=CommandScheduler.CONFIG):
+        # Never blocks: producers are called from the notification path.
+        return self.queue.put_nowait(message, priority)
 
     async def message_consumer(self, *args, **kwargs):
         """Drain the outbound queue and send each message to the wallbox."""
         while True:
-            if not self.transport or not self.evse_addr:
-                await asyncio.sleep(0.1)
-                continue
-
             message = await self.queue.get()
+            # Hold the message while the wallbox is unreachable instead of polling.
+            await self._link_up.wait()
             try:
                 self.transport.sendto(message, self.evse_addr)
                 self.logger.debug(f"UDP sent {len(message)} bytes to {self.evse_addr}")
+                metrics.FRAMES_SENT.inc("wifi")
+                if self.capture:
+                    self.capture.record(FrameCapture.OUTBOUND, "wifi", message)
             except Exception as e:
                 self.logger.error(f"UDP send error: {e}")
+                metrics.SEND_ERRORS.inc("wifi")
             finally:
                 self.queue.task_done()
 
@@ -323,6 +362,7 @@ class WiFiManager:
             try:
                 self.transport.sendto(_WAKEUP_PACKET, ("255.255.255.255", port))
                 self.logger.warning(f"Wakeup broadcast sent to 255.255.255.255:{port}")
+                metrics.WAKEUPS_SENT.inc("broadcast")
             except Exception as e:
                 self.logger.error(f"Wakeup broadcast to port {port} failed: {e}")
 
@@ -331,6 +371,7 @@ class WiFiManager:
                 try:
                     self.transport.sendto(_WAKEUP_PACKET, (target_ip, port))
                     self.logger.warning(f"Wakeup sent directly to {target_ip}:{port}")
+                    metrics.WAKEUPS_SENT.inc("unicast")
                 except Exception as e:
                     self.logger.error(f"Direct wakeup to {target_ip}:{port} failed: {e}")
 
@@ -355,6 +396,7 @@ class WiFiManager:
                 from .utils import Utils
                 login_cmd = bytes(Utils.build_command(serial, password, 32770))
                 self.transport.sendto(login_cmd, (target_ip, port_to_use))
+                metrics.WAKEUPS_SENT.inc("login_request")
                 self.logger.warning(
                     f"Login request wakeup sent to {target_ip}:{port_to_use} "
                     f"(serial={serial})"
@@ -380,6 +422,7 @@ class WiFiManager:
                 )
                 self.connected = False
                 self.evse_addr = None
+                self._link_up.clear()
                 # Reset device state so the full login flow runs again on reconnect.
                 if self.manager:
                     self.manager.device.initialization_state = False
@@ -387,6 +430,7 @@ class WiFiManager:
                     # Reset software_version so the full login flow re-runs on
                     # reconnect (event_handlers checks "software_version is None").
                     self.manager.device.info = {'software_version': None}
+                    self.manager.event_handlers.session.reset()
             else:
                 self.logger.warning(
                     f"Still no UDP datagram after {elapsed:.0f} s — retrying wakeup"
@@ -1,13 +1,24 @@
 import argparse
 import asyncio
+import json
 import logging
 import signal
 import sys
-from evseMQTT import BLEManager, Constants, Device, EventHandlers, Commands, Logger, MQTTClient, MQTTCallback, MQTTPayloads, Utils, WiFiManager
+from evseMQTT import Device, EventHandlers, Commands, TaskSupervisor, FrameCapture, MetricsServer, Diagnostics, TRACER, TelemetryBuffer, ChargeSessionDetector, ChargeSessionLedger, SurplusController, LoadBalancer, LocalCharger, RemoteCharger
+# The transports and the MQTT modules are imported where the selected mode needs
+# them: bleak is not needed with --wifi, paho-mqtt not without --mqtt, numpy
+# (through TelemetryStore) not without --telemetry_dir.
+
+# Discovery mode last announced per serial, so the broker is only searched for
+# configs of the other mode when it changed
+_DISCOVERY_MODE_FILE = "/data/discovery_mode.json"
 
 class Manager:
     def __init__(self, address, ble_password, unit, mqtt_enabled=False, mqtt_settings=None, logging_level=logging.INFO, rssi=False,
-                 wifi_enabled=False, wifi_port=28376, wifi_ip=None):
+                 wifi_enabled=False, wifi_port=28376, wifi_ip=None, rssi_interval=60, rssi_window=10, scan_timeout=10.0, capture=None,
+                 metrics_port=None, metrics_host="127.0.0.1", profile_seconds=0, profile_mode="cprofile",
+                 trace_slow_ms=100, session_db=None, telemetry_dir=None, surplus_settings=None,
+                 balance_settings=None, entity_groups=None, discovery_mode="entity", json_backend="json"):
         self.setup_logging(logging_level)
         self.logger = logging.getLogger("evseMQTT")
         debug = logging_level == logging.DEBUG  # Determine if debug logging is enabled
@@ -22,6 +33,7 @@ class Manager:
 
         # Set the RSSI monitoring (BLE only)
         self.device.rssi = rssi and not wifi_enabled
+        self.rssi_interval = rssi_interval
 
         # Set the BLE password
         self.device.ble_password = ble_password
@@ -29,8 +41,20 @@ class Manager:
         # Correct order of instantiation
         self.commands = Commands(ble_manager=None, device=self.device, logger=self.logger)
         self.event_handlers = EventHandlers(device=self.device, commands=self.commands, logger=self.logger)
+        self.telemetry = TelemetryBuffer()
+        self.event_handlers.charge_listeners.append(self.telemetry.record)
+        self.session_ledger = ChargeSessionLedger(session_db) if session_db else None
+        self.charge_sessions = ChargeSessionDetector(device=self.device, logger=self.logger, ledger=self.session_ledger,
+                                                     on_session_end=self._publish_session)
+        self.event_handlers.charge_listeners.append(self.charge_sessions.update)
+        self.telemetry_store = None
+        if telemetry_dir:
+            from evseMQTT import TelemetryStore
+            self.telemetry_store = TelemetryStore(telemetry_dir, logger=self.logger, unit=unit)
+            self.event_handlers.charge_listeners.append(self._store_telemetry)
 
         if wifi_enabled:
+            from evseMQTT import WiFiManager
             self.wifi_manager = WiFiManager(
                 port=wifi_port,
                 event_handler=self.event_handlers,
@@ -39,6 +63,7 @@ class Manager:
             )
             self.wifi_manager.manager = self
             self.commands.ble_manager = self.wifi_manager
+            self.wifi_manager.queue.on_drop = self.commands.tracker.drop
             self.ble_manager = None
 
             # Restore device info cached from a previous session (mac, model, …)
@@ -54,142 +79,247 @@ class Manager:
                     f"Restored cached device info: {self.wifi_manager.cached_device_info}"
                 )
         else:
-            self.ble_manager = BLEManager(event_handler=self.event_handlers, logger=self.logger)
+            from evseMQTT import BLEManager
+            self.ble_manager = BLEManager(event_handler=self.event_handlers, logger=self.logger, rssi_window=rssi_window,
+                                          scan_timeout=scan_timeout)
             self.ble_manager.manager = self
             self.commands.ble_manager = self.ble_manager
+            self.ble_manager.queue.on_drop = self.commands.tracker.drop
             self.wifi_manager = None
 
+        # Optionally log every raw frame for offline replay (see evseMQTT.replay)
+        self.capture = FrameCapture(capture, logger=self.logger) if capture else None
+        (self.wifi_manager or self.ble_manager).capture = self.capture
+
+        # Optional Prometheus-style endpoint for the metrics in evseMQTT.metrics
+        self.metrics_server = MetricsServer(self.logger, metrics_port, metrics_host) if metrics_port else None
+
+        # Frames slower than this from receive to MQTT handoff are logged with their breakdown
+        TRACER.slow_threshold = trace_slow_ms / 1000
+
+        # Task dump and optional profiling on SIGUSR1 (registered in main())
+        self.diagnostics = Diagnostics(self, self.logger, profile_seconds=profile_seconds, profile_mode=profile_mode)
+
+        # Owns the transport, consumer, watchdog, heartbeat and idle tasks and
+        # restarts them together with backoff.
+        self.supervisor = TaskSupervisor(logger=self.logger)
+
         self.mqtt_client = None
         self.mqtt_callback = None
         self.mqtt_payloads = None
+        self.entity_groups = entity_groups
+        self.discovery_mode = discovery_mode
 
         if mqtt_enabled and mqtt_settings:
+            from evseMQTT import MQTTClient
             self.mqtt_client = MQTTClient(logger=self.logger, **mqtt_settings)
             self.mqtt_client.connect()
+            # Unchanged charge/config snapshots are published again without encoding them
+            from evseMQTT import StateSerializer
+            self.mqtt_client.serializer = StateSerializer(version=self.device.version, backend=json_backend)
+            if self.mqtt_client.serializer.backend != json_backend:
+                self.logger.warning(f"{json_backend} is not installed, encoding state with json")
             self.event_handlers.callback = self.mqtt_client.publish_state
 
+        # PV-surplus charging needs the inputs from MQTT
+        self.surplus = None
+        if self.mqtt_client and surplus_settings:
+            self.surplus = SurplusController(device=self.device, commands=self.commands, logger=self.logger,
+                                             mqtt_client=self.mqtt_client, **surplus_settings)
+
+        # Site load balancing: this instance shares the site limit between its own
+        # wallbox and the ones run by other evseMQTT instances on the same broker
+        self.balancer = None
+        if balance_settings:
+            self.balancer = LoadBalancer(self.logger, balance_settings["limits"], strategy=balance_settings["strategy"],
+                                         mqtt_client=self.mqtt_client)
+            local = self.balancer.add(LocalCharger(self.device, self.commands, phase=balance_settings["phase"],
+                                                   priority=balance_settings["priority"],
+                                                   max_amps=balance_settings["max_amps"]))
+            self.event_handlers.charge_listeners.append(lambda charge: self.balancer.update(local, charge))
+            for serial, priority, phase in balance_settings["remotes"]:
+                if self.mqtt_client is None:
+                    self.logger.warning(f"Remote wallbox {serial} needs MQTT, not balancing it")
+                    continue
+                self.balancer.add(RemoteCharger(serial, self.mqtt_client, phase=phase, priority=priority,
+                                                max_amps=balance_settings["max_amps"]))
+
     def setup_logging(self, logging_level):
         logging.basicConfig(level=logging_level, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
     async def run(self, address):
-        if self.wifi_enabled:
-            await self._run_wifi()
-        else:
-            await self._run_ble(address)
-
-    async def _run_wifi(self):
-        consumer = asyncio.create_task(self.wifi_manager.message_consumer())
-        asyncio.create_task(self.wifi_manager.serve())
-
+        body = self._run_wifi if self.wifi_enabled else lambda: self._run_ble(address)
+        self.diagnostics.attach(asyncio.get_running_loop())
+        if self.metrics_server:
+            await self.metrics_server.start()
         try:
-            self.logger.info("Waiting for wallbox UDP broadcast ...")
-
-            while not self.device.initialization_state:
-                self.logger.debug("Device not initialized yet, waiting...")
-                await asyncio.sleep(1)
-
-            self.logger.info(f"Device initialized with serial: {self.device.info['serial']}. Proceeding with login request.")
-
-            if self.device.fallback:
-                self.logger.info("Fallback: software_version populated with hardware_version.")
-                self.device.info = {'software_version': self.device.info['hardware_version']}
-
-            while self.device.info['software_version'] is None:
-                self.logger.debug("Waiting for software version...")
-                await asyncio.sleep(1)
-
-            if self.mqtt_client and not self.mqtt_client.connected and self.device.info['serial'] is not None and self.device.info['software_version'] is not None:
-                self.mqtt_payloads = MQTTPayloads(device=self.device)
-                self.mqtt_callback = MQTTCallback(device=self.device, commands=self.commands)
-                discovery_payloads = self.mqtt_payloads.discovery()
-                self.mqtt_client.publish_discovery(discovery_payloads)
-                self.mqtt_client.subscribe(f"evseMQTT/{self.device.info['serial']}/command")
-                self.mqtt_client.set_on_message(self.mqtt_callback.delegate)
-                self.mqtt_client.publish_availability(self.device.info['serial'], "online")
-
-            # Track initialization_state so we can publish availability changes.
-            prev_initialized = True
-            while True:
-                await asyncio.sleep(1)
-                self.logger.debug("Idling...")
-
-                if not self.mqtt_client or not self.mqtt_client.connected:
-                    prev_initialized = self.device.initialization_state
-                    continue
-
-                serial = self.device.info.get('serial')
-                if not serial:
-                    prev_initialized = self.device.initialization_state
-                    continue
-
-                if self.device.initialization_state != prev_initialized:
-                    if self.device.initialization_state:
-                        self.logger.info("Wallbox reconnected — publishing availability online")
-                        self.mqtt_client.publish_availability(serial, "online")
-                    else:
-                        self.logger.warning("Wallbox disconnected — publishing availability offline")
-                        self.mqtt_client.publish_availability(serial, "offline")
-                    prev_initialized = self.device.initialization_state
-
+            await self.supervisor.run(body, teardown=lambda: self._teardown(address), on_restart=self._reset_session)
         except (KeyboardInterrupt, SystemExit):
             self.logger.info("Interrupted, cleaning up...")
-            await self.wifi_manager.disconnect()
+            if self.ble_manager:
+                await self.ble_manager.queue.join()
+            await self._teardown(address)
         finally:
-            consumer.cancel()
+            if self.metrics_server:
+                await self.metrics_server.stop()
             self.cleanup()
 
+    async def _run_wifi(self):
+        self.supervisor.spawn("transport", self.wifi_manager.serve())
+        self.supervisor.spawn("consumer", self.wifi_manager.message_consumer())
+
+        self.logger.info("Waiting for wallbox UDP broadcast ...")
+
+        # Set by the session state machine the moment serial and software
+        # version are known, so discovery goes out without polling.
+        await self.event_handlers.session.identified.wait()
+
+        self.logger.info(f"Device identified with serial: {self.device.info['serial']}.")
+        await self._announce()
+        self.supervisor.spawn("idle", self._track_availability())
+        if self.surplus:
+            self.supervisor.spawn("surplus", self.surplus.run())
+        if self.balancer:
+            self.supervisor.spawn("balancer", self.balancer.run())
+
+    async def _track_availability(self):
+        # Sleep until the session reports an availability change, then publish it.
+        session = self.event_handlers.session
+        prev_online = True
+        while True:
+            await session.wait_for_change()
+            online = session.identified.is_set()
+
+            if not self.mqtt_client or not self.mqtt_client.connected:
+                prev_online = online
+                continue
+
+            serial = self.device.info.get('serial')
+            if not serial:
+                prev_online = online
+                continue
+
+            if online != prev_online:
+                if online:
+                    self.logger.info("Wallbox reconnected — publishing availability online")
+                    self.mqtt_client.publish_availability(serial, "online")
+                else:
+                    self.logger.warning("Wallbox disconnected — publishing availability offline")
+                    self.mqtt_client.publish_availability(serial, "offline")
+                prev_online = online
+
     async def _run_ble(self, address):
-        await self.ble_manager.scan()
+        # A cached GATT profile means the wallbox was seen before; connect
+        # directly instead of paying for a scan first.
+        if not self.ble_manager.has_profile(address):
+            await self.ble_manager.scan(address)
 
         self.logger.info(f"Connecting...")
 
-        if await self.ble_manager.connect_device(address):
-            self.logger.info(f"Connected.")
-
-            # Start the producer and consumer tasks
-            consumer = asyncio.create_task(self.ble_manager.message_consumer(address, self.ble_manager.write_uuid))
-
+        if not await self.ble_manager.connect_device(address):
+            return
+
+        self.logger.info(f"Connected.")
+
+        self.supervisor.spawn("consumer", self.ble_manager.message_consumer(address, self.ble_manager.write_uuid))
+        self.supervisor.spawn("watchdog", self.ble_manager.watchdog())
+
+        self.logger.info("Waiting for device initialization...")
+
+        await self.event_handlers.session.identified.wait()
+
+        self.logger.info(f"Device identified with serial: {self.device.info['serial']}.")
+        await self._announce()
+        if self.surplus:
+            self.supervisor.spawn("surplus", self.surplus.run())
+        if self.balancer:
+            self.supervisor.spawn("balancer", self.balancer.run())
+
+        if self.device.rssi:
+            self.supervisor.spawn("heartbeat", self.ble_manager.heartbeat(self.rssi_interval, address))
+
+    async def _announce(self):
+        """Publish discovery on the first identification, availability on later ones."""
+        if not self.mqtt_client or self.device.info['serial'] is None or self.device.info['software_version'] is None:
+            return
+
+        if not self.mqtt_client.connected:
+            from evseMQTT import MQTTCallback, MQTTPayloads
+            self.mqtt_payloads = MQTTPayloads(device=self.device, groups=self.entity_groups, mode=self.discovery_mode)
+            self.mqtt_callback = MQTTCallback(device=self.device, commands=self.commands, telemetry=self.telemetry,
+                                              mqtt_client=self.mqtt_client, surplus=self.surplus)
+            serial = self.device.info['serial']
+            stale = []
+            if self._load_discovery_modes().get(serial) != self.discovery_mode:
+                # Configs left on the broker by the other discovery mode are handed
+                # over to the new ones before they are cleared. Probing takes a
+                # second, so it is only done when the mode changed (or is unknown).
+                if self.discovery_mode == "device":
+                    stale = await self.mqtt_client.retained(f"homeassistant/+/{serial}/+/config")
+                else:
+                    stale = await self.mqtt_client.retained(self.mqtt_payloads.device_topic)
+            if stale:
+                self.logger.info(f"Migrating {len(stale)} Home Assistant discovery config(s) to {self.discovery_mode} discovery")
+                self.mqtt_client.migrate_discovery(stale)
+            discovery_payloads = self.mqtt_payloads.discovery()
+            self.mqtt_client.publish_discovery(discovery_payloads)
+            self.mqtt_client.clear_discovery(stale if self.discovery_mode == "device" else stale + self.mqtt_payloads.removed)
+            self._save_discovery_mode(serial, self.discovery_mode)
+            self.mqtt_client.subscribe(f"evseMQTT/{self.device.info['serial']}/command")
+            self.mqtt_client.set_on_message(self.mqtt_callback.delegate)
+        self.mqtt_client.publish_availability(self.device.info['serial'], "online")
+
+    def _load_discovery_modes(self):
+        """Return the discovery mode last announced per serial, or an empty dict."""
+        try:
+            with open(_DISCOVERY_MODE_FILE, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, IOError, json.JSONDecodeError):
+            return {}
+
+    def _save_discovery_mode(self, serial, mode):
+        """Persist the announced discovery mode for use after add-on restarts."""
+        modes = self._load_discovery_modes()
+        if modes.get(serial) == mode:
+            return
+        modes[serial] = mode
+        try:
+            with open(_DISCOVERY_MODE_FILE, "w") as f:
+                json.dump(modes, f)
+        except IOError as e:
+            self.logger.warning(f"Could not save discovery mode to cache: {e}")
+
+    async def _teardown(self, address):
+        """Close the transport after a generation ended so the next one starts clean."""
+        # A login or hydration step must not outlive the connection it was talking to
+        self.event_handlers.session.cancel()
+        if self.wifi_enabled:
+            await self.wifi_manager.disconnect()
+        elif address in self.ble_manager.connected_devices:
             try:
-                self.logger.info("Waiting for device initialization...")
-
-                while not self.device.initialization_state:
-                    self.logger.info(f"Device not initialized yet, waiting...")
-                    await asyncio.sleep(1)
-
-                self.logger.info(f"Device initialized with serial: {self.device.info['serial']}. Proceeding with login request.")
-
-                if self.device.fallback:
-                    self.logger.info(f"Fallback: software_version populated with hardware_version.")
-                    self.device.info = {'software_version': self.device.info['hardware_version']}
-
-                while self.device.info['software_version'] is None:
-                    self.logger.info(f"Waiting for software version...")
-                    await asyncio.sleep(1)
-
-                if self.mqtt_client and not self.mqtt_client.connected and self.device.info['serial'] is not None and self.device.info['software_version'] is not None:
-                    self.mqtt_payloads = MQTTPayloads(device=self.device)
-                    self.mqtt_callback = MQTTCallback(device=self.device, commands=self.commands)
-                    discovery_payloads = self.mqtt_payloads.discovery()
-                    self.mqtt_client.publish_discovery(discovery_payloads)
-                    self.mqtt_client.subscribe(f"evseMQTT/{self.device.info['serial']}/command")
-                    self.mqtt_client.set_on_message(self.mqtt_callback.delegate)
-                    self.mqtt_client.publish_availability(self.device.info['serial'], "online")
-
-                if self.device.rssi:
-                    heartbeat = asyncio.create_task(self.ble_manager.heartbeat(60, address))
+                await self.ble_manager.disconnect_device(address)
+            except Exception as e:
+                self.logger.warning(f"Error while disconnecting from {address}: {e}")
 
-                while True:
-                    await asyncio.sleep(1)
-                    self.logger.debug(f"Idling...")
+    def _store_telemetry(self, charge):
+        # Files are kept per serial; status frames before login are not stored
+        if self.device.info['serial'] is not None:
+            self.telemetry_store.record(self.device.info['serial'], charge)
 
-            except (KeyboardInterrupt, SystemExit):
-                self.logger.info("Interrupted, cleaning up...")
-                await self.ble_manager.queue.join()
-                await self.ble_manager.disconnect_device(address)
-            finally:
-                self.cleanup()
+    def _publish_session(self, serial, summary):
+        if self.mqtt_client:
+            self.mqtt_client.publish_session(serial, summary)
 
     def cleanup(self):
+        if self.capture:
+            self.capture.close()
+        if self.session_ledger:
+            self.charge_sessions.flush()
+            self.charge_sessions.ledger = None
+            self.session_ledger.close()
+            self.session_ledger = None
+        if self.telemetry_store:
+            self.telemetry_store.close()
         if self.mqtt_client:
             self.mqtt_client.publish_availability(self.device.info['serial'], "offline")
             self.mqtt_client.disconnect()
@@ -199,17 +329,17 @@ class Manager:
         self.cleanup()
         sys.exit(0)
 
-    async def restart_run(self, address=None):
-        if address is None:
-            address = self.address
+    def request_restart(self, reason):
+        """Restart transport and tasks as one unit, e.g. when the watchdog gave up on the wallbox."""
+        self.supervisor.request_restart(reason)
 
-        self.logger.info("Restarting run function due to inactivity.")
+    async def _reset_session(self):
+        self.logger.info("Resetting session state for the next connection attempt.")
 
         self.device.initialization_state = False
         self.device.logged_in = False
         self.device.info = {'software_version': None}
-
-        await self.run(address)
+        self.event_handlers.session.reset()
 
     async def exit_with_error(self, error):
         self.logger.error(f"Error encountered:\n{error}")
@@ -227,10 +357,19 @@ class Manager:
         self.logger.info("All tasks cancelled, exiting...")
         sys.exit(1)
 
+async def discover_devices(timeout):
+    """List every evse wallbox in BLE range, e.g. to look up the address for --address."""
+    from evseMQTT import BLEManager
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    ble_manager = BLEManager(event_handler=None, logger=logging.getLogger("evseMQTT"), scan_timeout=timeout)
+    devices = await ble_manager.discover()
+    if not devices:
+        ble_manager.logger.info("No evse devices found")
+
 def main():
     parser = argparse.ArgumentParser(description="BLE/WiFi Manager for EVSE Wallbox")
     parser.add_argument("--address", type=str, default="", help="BLE device MAC address (BLE mode)")
-    parser.add_argument("--password", type=str, required=True, help="BLE / WiFi device password")
+    parser.add_argument("--password", type=str, help="BLE / WiFi device password")
     parser.add_argument("--unit", type=str, default="W", help="Unit of measurement for consumed power (kW or W)")
     parser.add_argument("--mqtt", action='store_true', help="Enable MQTT")
     parser.add_argument("--mqtt_broker", type=str, help="MQTT broker address")
@@ -238,12 +377,46 @@ def main():
     parser.add_argument("--mqtt_user", type=str, help="MQTT username")
     parser.add_argument("--mqtt_password", type=str, help="MQTT password")
     parser.add_argument("--rssi", action='store_true', help="Monitor Received Signal Strength Indicator (BLE only)")
+    parser.add_argument("--rssi_interval", type=int, default=60, help="Seconds between smoothed RSSI updates (default 60)")
+    parser.add_argument("--rssi_window", type=int, default=10, help="Number of RSSI samples averaged per update (default 10)")
     parser.add_argument("--logging_level", type=str, default="INFO", help="Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)")
     parser.add_argument("--wifi", action='store_true', help="Connect via WiFi (UDP) instead of BLE")
     parser.add_argument("--wifi_port", type=int, default=28376, help="UDP port to listen on for wallbox broadcasts (default 28376)")
     parser.add_argument("--wifi_ip", type=str, default="", help="Optional static IP of the wallbox for targeted wakeup packets")
+    parser.add_argument("--scan_timeout", type=float, default=10.0, help="Upper bound in seconds for a BLE scan (default 10)")
+    parser.add_argument("--discover", action='store_true', help="List all evse devices in BLE range and exit")
+    parser.add_argument("--metrics_port", type=int, default=0, help="Serve Prometheus metrics on this port (disabled by default)")
+    parser.add_argument("--metrics_host", type=str, default="127.0.0.1", help="Address the metrics endpoint binds to (default 127.0.0.1)")
+    parser.add_argument("--profile_seconds", type=int, default=0, help="Profile the event loop for this long on SIGUSR1 (default 0: task dump only)")
+    parser.add_argument("--profile_mode", type=str, default="cprofile", choices=Diagnostics.MODES, help="Profiler used on SIGUSR1 (default cprofile)")
+    parser.add_argument("--trace_slow_ms", type=float, default=100, help="Log frames slower than this from receive to MQTT publish (default 100)")
+    parser.add_argument("--session_db", type=str, default="", help="Record charging sessions in this SQLite file (e.g. /data/sessions.db)")
+    parser.add_argument("--telemetry_dir", type=str, default="", help="Keep compressed charge telemetry in this directory (e.g. /data/telemetry)")
+    parser.add_argument("--surplus_feedin_topic", type=str, default="", help="MQTT topic with the grid feed-in power; enables PV-surplus charging")
+    parser.add_argument("--surplus_grid_topic", type=str, default="", help="MQTT topic with the power drawn from the grid (optional)")
+    parser.add_argument("--surplus_battery_topic", type=str, default="", help="MQTT topic with the home battery discharge power (optional)")
+    parser.add_argument("--surplus_kw", action='store_true', help="The surplus input topics report kW instead of W")
+    parser.add_argument("--surplus_buffer_w", type=int, default=200, help="Watts of surplus kept back from the car (default 200)")
+    parser.add_argument("--surplus_max_amps", type=int, default=32, help="Highest charge current the surplus controller sets (default 32)")
+    parser.add_argument("--balance_limit", type=str, default="", help="Site current limit in A, one value or L1,L2,L3; enables load balancing")
+    parser.add_argument("--balance_strategy", type=str, default="fair", choices=LoadBalancer.STRATEGIES, help="Share the site limit evenly or by priority (default fair)")
+    parser.add_argument("--balance_priority", type=int, default=0, help="Priority of this wallbox for load balancing (default 0)")
+    parser.add_argument("--balance_phase", type=int, default=1, choices=(1, 2, 3), help="Site phase a single-phase wallbox is connected to (default 1)")
+    parser.add_argument("--balance_remote", type=str, action='append', default=[], help="Wallbox of another evseMQTT instance to balance, as SERIAL[:PRIORITY[:PHASE]] (repeatable)")
+    parser.add_argument("--balance_max_amps", type=int, default=32, help="Highest charge current the load balancer gives one wallbox (default 32)")
+    parser.add_argument("--discovery_mode", type=str, default="entity", choices=("entity", "device"), help="One Home Assistant discovery config per entity, or one per wallbox (needs Home Assistant 2024.11+, default entity)")
+    parser.add_argument("--entity_groups", type=str, default="", help="Home Assistant entities to announce: any of core,diagnostics,phases,config (default all)")
+    parser.add_argument("--json_backend", type=str, default="json", choices=("json", "orjson"), help="Encode state with json or, if installed, orjson (compact JSON, default json)")
+    parser.add_argument("--capture", type=str, default="", help="Append every raw frame to this file for replay (e.g. /data/frames.cap)")
     args = parser.parse_args()
 
+    if args.discover:
+        asyncio.run(discover_devices(args.scan_timeout))
+        return
+
+    if not args.password:
+        parser.error("--password is required")
+
     if not args.wifi and not args.address:
         parser.error("--address is required when using BLE mode")
 
@@ -255,6 +428,45 @@ def main():
         "password": args.mqtt_password
     } if args.mqtt else None
 
+    surplus_topics = {name: topic for name, topic in (("feedin", args.surplus_feedin_topic),
+                                                      ("grid", args.surplus_grid_topic),
+                                                      ("battery", args.surplus_battery_topic)) if topic}
+    surplus_settings = {
+        "topics": surplus_topics,
+        "scale": 1000 if args.surplus_kw else 1,
+        "buffer_w": args.surplus_buffer_w,
+        "max_amps": args.surplus_max_amps,
+    } if args.surplus_feedin_topic else None
+
+    balance_settings = None
+    if args.balance_limit:
+        try:
+            limits = [int(value) for value in args.balance_limit.split(",")]
+            remotes = []
+            for remote in args.balance_remote:
+                parts = remote.split(":")
+                remotes.append((parts[0], int(parts[1]) if len(parts) > 1 else 0, int(parts[2]) if len(parts) > 2 else 1))
+        except ValueError:
+            parser.error("--balance_limit takes A or L1,L2,L3 and --balance_remote SERIAL[:PRIORITY[:PHASE]]")
+        if len(limits) not in (1, 3):
+            parser.error("--balance_limit takes one limit or one per phase")
+        balance_settings = {
+            "limits": limits * 3 if len(limits) == 1 else limits,
+            "strategy": args.balance_strategy,
+            "priority": args.balance_priority,
+            "phase": args.balance_phase,
+            "max_amps": args.balance_max_amps,
+            "remotes": remotes,
+        }
+
+    entity_groups = None
+    if args.entity_groups:
+        from evseMQTT.mqttpayloads import ENTITY_GROUPS
+        entity_groups = [group.strip() for group in args.entity_groups.split(",") if group.strip()]
+        unknown = [group for group in entity_groups if group not in ENTITY_GROUPS]
+        if unknown or not entity_groups:
+            parser.error(f"--entity_groups takes a comma-separated list of {', '.join(ENTITY_GROUPS)}")
+
     logging_level = getattr(logging, args.logging_level.upper(), logging.INFO)
     manager = Manager(
         address=args.address,
@@ -267,6 +479,22 @@ def main():
         wifi_enabled=args.wifi,
         wifi_port=args.wifi_port,
         wifi_ip=args.wifi_ip or None,
+        rssi_interval=args.rssi_interval,
+        rssi_window=args.rssi_window,
+        scan_timeout=args.scan_timeout,
+        capture=args.capture or None,
+        metrics_port=args.metrics_port or None,
+        metrics_host=args.metrics_host,
+        profile_seconds=args.profile_seconds,
+        profile_mode=args.profile_mode,
+        trace_slow_ms=args.trace_slow_ms,
+        session_db=args.session_db or None,
+        telemetry_dir=args.telemetry_dir or None,
+        surplus_settings=surplus_settings,
+        balance_settings=balance_settings,
+        entity_groups=entity_groups,
+        discovery_mode=args.discovery_mode,
+        json_backend=args.json_backend,
     )
 
     # Register signal handlers for common termination signals
@@ -274,6 +502,9 @@ def main():
     for sig in signals:
         signal.signal(sig, manager.handle_exit)
 
+    # Dump tasks and state (and profile, with --profile_seconds) without restarting
+    signal.signal(signal.SIGUSR1, manager.diagnostics.request)
+
     asyncio.run(manager.run(args.address))
 
 if __name__ == "__main__":